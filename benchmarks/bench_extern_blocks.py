@@ -0,0 +1,62 @@
+'''Time Cython on PXDs with one extern block per declaration or namespace.
+
+Run from the repository root (needs cython, but not clang):
+
+    python -m benchmarks.bench_extern_blocks [-n 3] [--sizes 300 3000]
+'''
+
+import argparse
+import pathlib
+import subprocess
+import tempfile
+import timeit
+
+from cythonator.cythonator import Namespace, _convert_toplevel
+from cythonator.write_cython import write_pxd
+
+
+def _namespace(count):
+    return Namespace(id='_global_namespace', name='', children=[
+        _convert_toplevel({
+            'id': '0x1', 'kind': 'NamespaceDecl', 'name': 'ns', 'inner': [
+                {'id': f'0x1{ii}', 'kind': 'FunctionDecl', 'name': f'f{ii}',
+                 'type': {'qualType': 'double (int, double)'}}
+                for ii in range(count)]})])
+
+
+def _per_declaration(namespace, header):
+    # what was written before declarations shared extern blocks
+    return ''.join(write_pxd(ns._replace(children=[child]), header)
+                   for ns in namespace.children for child in ns.children)
+
+
+def _cython(pxd, d, n):
+    pyx = pathlib.Path(d) / 'bench.pyx'
+    pyx.write_text(pxd)
+    return min(timeit.repeat(lambda: subprocess.run(
+        ['cython', '-3', '--cplus', str(pyx)], check=True),
+        number=1, repeat=n))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=3, help='Repetitions')
+    parser.add_argument('--sizes', type=int, nargs='*',
+                        default=[300, 1000, 3000])
+    args = parser.parse_args()
+
+    print(f'{"functions":>10} {"blocks":<12} {"KB":>8} {"cython [s]":>11}')
+    with tempfile.TemporaryDirectory() as d:
+        header = str(pathlib.Path(d) / 'bench.hpp')
+        for count in args.sizes:
+            ns = _namespace(count)
+            for name, pxd in [
+                    ('declaration', _per_declaration(ns, header)),
+                    ('namespace', write_pxd(ns, header))]:
+                t = _cython(pxd, d, args.n)
+                print(f'{count:>10} {name:<12} {len(pxd) / 2**10:>8.1f} '
+                      f'{t:>11.3f}')
+
+
+if __name__ == '__main__':
+    main()
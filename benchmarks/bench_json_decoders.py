@@ -0,0 +1,54 @@
+'''Compare JSON decoder backends on the AST dumps of the test headers.
+
+Run from the repository root:
+
+    python tests/generate_test_headers.py
+    python -m benchmarks.bench_json_decoders [--clang clang++-10] [-n 5]
+'''
+
+import argparse
+import pathlib
+import subprocess
+import tempfile
+import timeit
+
+from cythonator.decoders import available_backends, get_decoder, load_file
+
+
+def _dump(header, clang_exe):
+    fp = tempfile.TemporaryFile()
+    subprocess.run(
+        [clang_exe, '-Xclang', '-ast-dump=json', '-fsyntax-only', str(header)],
+        stdout=fp, check=True)
+    return fp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clang', type=str, default='clang++-10')
+    parser.add_argument('-n', type=int, default=5, help='Repetitions')
+    parser.add_argument(
+        'headers', nargs='*',
+        default=sorted(pathlib.Path('tests/headers').glob('*.hpp')))
+    args = parser.parse_args()
+
+    backends = available_backends()
+    print(f'{"header":<28} {"MB":>7} {"backend":<10} '
+          f'{"bytes [s]":>10} {"mmap [s]":>10}')
+    for header in args.headers:
+        with _dump(header, args.clang) as fp:
+            fp.seek(0)
+            data = fp.read()
+            size = len(data) / 2**20
+            for backend in backends:
+                loads = get_decoder(backend)
+                t_bytes = min(timeit.repeat(
+                    lambda: loads(data), number=1, repeat=args.n))
+                t_mmap = min(timeit.repeat(
+                    lambda: load_file(fp, loads), number=1, repeat=args.n))
+                print(f'{pathlib.Path(header).name:<28} {size:>7.2f} '
+                      f'{backend:<10} {t_bytes:>10.4f} {t_mmap:>10.4f}')
+
+
+if __name__ == '__main__':
+    main()
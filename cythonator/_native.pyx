@@ -0,0 +1,390 @@
+# distutils: language=c++
+# cython: language_level=3
+'''Collect declarations in-process using the clang tooling libraries.'''
+
+import os
+import threading
+
+from libcpp cimport bool as cbool
+from libcpp.memory cimport unique_ptr
+from libcpp.string cimport string
+from libcpp.vector cimport vector
+
+from cythonator.cythonator import (
+    Namespace, Class, Function, Method, Field, Typedef, Param, TemplateParam,
+    handle_type, _function_return_type, _warn_nontype_template_params,
+    _warn_template_template_params, _warn_virtual_functions)
+from cythonator.dedup import dedup
+from cythonator.diagnostics import report
+from cythonator.selectors import select_ir
+from cythonator.typedefs import resolve_types
+
+
+cdef extern from "cythonator/decl_collector.hpp" namespace "cythonator" nogil:
+    cdef enum RecordKind:
+        RK_Namespace
+        RK_Class
+        RK_Function
+        RK_Typedef
+        RK_Field
+        RK_Param
+        RK_TemplateParam
+        RK_NonTypeTemplateParam
+        RK_TemplateTemplateParam
+        RK_Base
+        RK_VirtualMethod
+
+    cdef enum RecordFlags:
+        RF_PreviouslyDeclared
+        RF_Referenced
+        RF_ParameterPack
+        RF_HasDefault
+        RF_Ctor
+        RF_Public
+        RF_Implicit
+        RF_HasName
+        RF_Template
+        RF_Definition
+        RF_HasInner
+        RF_Specialization
+        RF_Protected
+
+    cdef cppclass DeclRecord:
+        RecordKind kind
+        int parent
+        unsigned flags
+        string id
+        string name
+        string type
+        string desugared
+        string tag
+        string extra
+
+    cdef cppclass ParseResult:
+        int status
+        vector[DeclRecord] records
+
+    ParseResult collect_decls(
+        const string& header,
+        const vector[string]& flags,
+        const vector[string]& include_roots,
+        cbool keep_all) except +
+
+
+cdef extern from "cythonator/parse_session.hpp" namespace "cythonator" nogil:
+    cdef cppclass ParseSession:
+        ParseSession(
+            const vector[string]& flags,
+            const vector[string]& include_roots,
+            cbool keep_all) except +
+        ParseResult parse(const string& header) except +
+        void invalidate()
+        unsigned preamble_builds()
+
+
+class _Record:
+    '''Python side of a DeclRecord plus the records nested in it.'''
+    __slots__ = ('kind', 'flags', 'id', 'name', 'type', 'tag', 'extra', 'items')
+
+    def __init__(self, kind, flags, id, name, type, desugared, tag, extra):
+        self.kind = kind
+        self.flags = flags
+        self.id = id
+        self.name = name
+        # "type" of clang's JSON dump, so handle_type() desugars the same
+        self.type = {'qualType': type}
+        if desugared:
+            self.type['desugaredQualType'] = desugared
+        self.tag = tag
+        self.extra = extra
+        self.items = []
+
+    def of_kind(self, kind):
+        return [r for r in self.items if r.kind == kind]
+
+
+def _access(r):
+    if r.flags & RF_Public:
+        return 'public'
+    if r.flags & RF_Protected:
+        return 'protected'
+    return 'private'
+
+
+def _template_param(r):
+    return TemplateParam(
+        id=r.id,
+        name=r.name if r.flags & RF_HasName else None,
+        referenced=bool(r.flags & RF_Referenced),
+        tag_used=r.tag,
+        default=handle_type(r.extra) if r.flags & RF_HasDefault else None,
+        is_parameter_pack=bool(r.flags & RF_ParameterPack),
+    )
+
+
+def _typedef(r):
+    return Typedef(
+        id=r.id,
+        name=r.name,
+        type=handle_type(r.type),
+        referenced=bool(r.flags & RF_Referenced),
+    )
+
+
+def _function(r):
+    templateparams = ()
+    if r.flags & RF_Template:
+        templateparams = [
+            _template_param(t) for t in r.of_kind(RK_TemplateParam)]
+        _warn_nontype_template_params(
+            [t.type['qualType'] + ' ' + t.name
+             for t in r.of_kind(RK_NonTypeTemplateParam)],
+            f'function "{r.name}"')
+
+    params = ()
+    if r.flags & RF_HasInner:
+        params = [Param(
+            id=p.id,
+            name=p.name if p.flags & RF_HasName else None,
+            type=handle_type(p.type),
+        ) for p in r.of_kind(RK_Param)]
+
+    return Function(
+        id=r.id,
+        # strip templates off of constructors
+        name=r.name.split('<')[0] if r.flags & RF_Ctor else r.name,
+        previously_declared=bool(r.flags & RF_PreviouslyDeclared),
+        return_type=_function_return_type(r.type),
+        params=params,
+        templateparams=templateparams,
+        is_specialization=bool(r.flags & RF_Specialization),
+    )
+
+
+def _class(r, access):
+    templateparams = ()
+    if r.flags & RF_Template:
+        templateparams = [
+            _template_param(t) for t in r.of_kind(RK_TemplateParam)]
+
+    _warn_virtual_functions(
+        [v.name for v in r.of_kind(RK_VirtualMethod)], r.tag, r.name)
+    _warn_nontype_template_params(
+        [t.type['qualType'] + ' ' + t.name
+         for t in r.of_kind(RK_NonTypeTemplateParam)],
+        f'{r.tag} "{r.name}"')
+    _warn_template_template_params(
+        [t.name for t in r.of_kind(RK_TemplateTemplateParam)], r.tag, r.name)
+
+    # Like the JSON dump, templated classes don't list their bases
+    bases = ()
+    if not r.flags & RF_Template and r.of_kind(RK_Base):
+        bases = [b.type['qualType'] for b in r.of_kind(RK_Base)]
+
+    children = [_class(c, access) for c in r.of_kind(RK_Class)]
+
+    return Class(
+        id=r.id,
+        name=r.name,
+        is_struct=r.tag == 'struct',
+        methods=[Method(
+            function=_function(m),
+            is_ctor=bool(m.flags & RF_Ctor),
+        ) for m in r.of_kind(RK_Function)
+            if _access(m) in access and not m.flags & RF_Implicit],
+        fields=[Field(
+            id=f.id,
+            name=f.name,
+            type=handle_type(f.type),
+        ) for f in r.of_kind(RK_Field) if _access(f) in access],
+        templateparams=templateparams,
+        bases=bases,
+        typedefs=[_typedef(t) for t in r.of_kind(RK_Typedef)],
+        children=children,
+    )
+
+
+def _namespace(r, access):
+    children = []
+    for c in r.items:
+        if c.kind == RK_Function:
+            children.append(_function(c))
+        elif c.kind == RK_Typedef:
+            children.append(_typedef(c))
+        elif c.kind == RK_Namespace:
+            children.append(_namespace(c, access))
+        elif c.kind == RK_Class:
+            children.append(_class(c, access))
+    return Namespace(id=r.id, name=r.name, children=children)
+
+
+cdef _build_ir(vector[DeclRecord]& records, selector):
+    top = _Record(RK_Namespace, 0, '_global_namespace', '', '', '', '', '')
+    nodes = []
+    cdef size_t ii
+    for ii in range(records.size()):
+        rec = _Record(
+            records[ii].kind,
+            records[ii].flags,
+            records[ii].id.decode(),
+            records[ii].name.decode(),
+            records[ii].type.decode(),
+            records[ii].desugared.decode(),
+            records[ii].tag.decode(),
+            records[ii].extra.decode())
+        parent = top if records[ii].parent < 0 else nodes[records[ii].parent]
+        parent.items.append(rec)
+        nodes.append(rec)
+    if selector is None:
+        return dedup(resolve_types(_namespace(top, frozenset(['public']))))
+    # the selector's access is applied while building classes
+    namespace = _namespace(top, selector.access)
+    return dedup(resolve_types(select_ir(namespace, selector)))
+
+
+def _check_status(filename, status, count):
+    '''Fail if clang collected nothing (`count` records), warn on errors.
+
+    Same as checking the clang process of :func:`cythonator.cythonator`.
+    '''
+    if not status:
+        return
+    if not count:
+        raise RuntimeError(f'clang failed to parse "{filename}"!')
+    report('warning', f'clang had errors parsing "{filename}", the IR '
+           'may be incomplete.')
+
+
+cdef vector[string] _include_roots(include_roots):
+    return [os.fsencode(os.path.join(os.path.realpath(r), ''))
+            for r in (include_roots or ())]
+
+
+def parse_header(filename, flags=(), include_roots=None, filter_includes=True,
+                 selector=None):
+    '''Parse a C/C++ header in-process and return its IR.
+
+    Parameters
+    ----------
+    filename : str
+        Header to parse (as C++).
+    flags : list of str, optional
+        Compiler flags, e.g., ``['-I', 'include/', '-std=c++17']``.
+    include_roots : list of str, optional
+        Also keep declarations from headers below these directories.
+    filter_includes : bool, optional
+        Only keep declarations located in `filename` (or below
+        `include_roots`).
+    selector : Selector, optional
+        Only keep the declarations (and class members) it selects.
+
+    Returns
+    -------
+    Namespace
+        The global namespace, same as :func:`cythonator.cythonator`:
+        typedefs are resolved and redeclarations merged.
+
+    Raises
+    ------
+    RuntimeError
+        If clang failed without collecting any declarations, e.g.,
+        because `filename` doesn't exist.  If it collected some despite
+        errors, a warning is reported instead.
+
+    Notes
+    -----
+    No clang process is spawned and no JSON is produced: the AST is
+    walked by a RecursiveASTVisitor that hands back compact records of
+    only the declarations (and parts thereof) the IR is made of.  The
+    builtin headers are looked up relative to the resource directory,
+    which can be set with ``-resource-dir`` in `flags`.
+    '''
+
+    cdef string header = os.fsencode(filename)
+    cdef vector[string] cflags = [os.fsencode(f) for f in flags]
+    cdef vector[string] roots = _include_roots(include_roots)
+    cdef cbool keep_all = not filter_includes
+    cdef ParseResult res
+    with nogil:
+        res = collect_decls(header, cflags, roots, keep_all)
+    _check_status(filename, res.status, res.records.size())
+    return _build_ir(res.records, selector)
+
+
+cdef class Session:
+    '''Parse many headers with the same flags in-process.
+
+    Parameters
+    ----------
+    flags : list of str, optional
+        Compiler flags, e.g., ``['-I', 'include/', '-std=c++17']``.
+    include_roots : list of str, optional
+        Also keep declarations from headers below these directories.
+    filter_includes : bool, optional
+        Only keep declarations located in the parsed header (or below
+        `include_roots`).
+    selector : Selector, optional
+        Only keep the declarations it selects, see :func:`parse_header`.
+
+    Notes
+    -----
+    The session holds on to a clang FileManager, so files and directories
+    are only looked up once for all headers, and to a precompiled
+    preamble (the leading ``#include`` lines and their contents) per
+    header.  Parsing a header again after editing only its body reuses the
+    preamble.  Call :meth:`invalidate` if headers outside of the parsed
+    ones changed.  Calls are serialized, use a session per thread to
+    parse in parallel.  :func:`cythonator.cythonator` (and so
+    :func:`cythonator.run`) parses with a session passed as `session`,
+    see :func:`cythonator.cythonator.open_session`.
+    '''
+
+    cdef unique_ptr[ParseSession] _session
+    cdef object _lock
+    cdef object _selector
+
+    def __cinit__(self, flags=(), include_roots=None, filter_includes=True,
+                  selector=None):
+        cdef vector[string] cflags = [os.fsencode(f) for f in flags]
+        cdef vector[string] roots = _include_roots(include_roots)
+        self._session.reset(
+            new ParseSession(cflags, roots, not filter_includes))
+        self._lock = threading.Lock()
+        self._selector = selector
+
+    def parse(self, filename):
+        '''Parse a C/C++ header and return its IR.
+
+        Parameters
+        ----------
+        filename : str
+            Header to parse (as C++).
+
+        Returns
+        -------
+        Namespace
+            The global namespace, same as :func:`parse_header`.
+
+        Raises
+        ------
+        RuntimeError
+            Same as :func:`parse_header`.
+        '''
+
+        cdef string header = os.fsencode(os.path.abspath(filename))
+        cdef ParseResult res
+        with self._lock:
+            with nogil:
+                res = self._session.get().parse(header)
+        _check_status(filename, res.status, res.records.size())
+        return _build_ir(res.records, self._selector)
+
+    def invalidate(self):
+        '''Drop all cached file system state and preambles.'''
+        with self._lock:
+            self._session.get().invalidate()
+
+    @property
+    def preamble_builds(self):
+        '''Number of preambles built so far.'''
+        return self._session.get().preamble_builds()
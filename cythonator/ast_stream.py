@@ -0,0 +1,117 @@
+'''Incremental reader for clang's JSON AST dump.'''
+
+import json
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _StreamBuffer:
+    '''Text buffer over a file-like object that is filled on demand.
+
+    Only the part of the stream that has not been consumed yet is kept
+    around, so memory is bounded by the largest single JSON value that
+    is decoded instead of by the size of the whole stream.
+    '''
+
+    def __init__(self, fp, chunk_size):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        # Drop everything we have already consumed before growing
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.fp.read(size)
+        if not chunk:
+            self.eof = True
+        else:
+            self.buf += chunk
+
+    def peek(self):
+        '''Skip whitespace and return the next character ('' at EOF).'''
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ''
+            self._fill(self.chunk_size)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(
+                f'Malformed AST dump: expected "{char}" but found '
+                f'"{self.buf[self.pos:self.pos+20]}"')
+        self.pos += 1
+
+    def decode(self):
+        '''Decode the JSON value starting at the current position.
+
+        When the value is not complete yet, read at least as much again
+        as is pending and retry, so the total decode work stays linear
+        in the size of the value.
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A scalar running up to the end of the buffer might
+                # have been cut off in the middle
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            self._fill(max(self.chunk_size, len(self.buf) - self.pos))
+
+
+def iter_ast_nodes(fp, chunk_size=1 << 16):
+    '''Yield the nodes of a translation unit's "inner" list one at a time.
+
+    Parameters
+    ----------
+    fp : file-like
+        Text stream containing the output of ``-Xclang -ast-dump=json``.
+    chunk_size : int, optional
+        Number of characters to read from `fp` at a time.
+
+    Notes
+    -----
+    Each node is yielded as soon as its closing brace has been read and
+    is not referenced again afterwards, so callers that discard nodes
+    after handling them never hold more than one declaration at a time.
+    '''
+
+    sb = _StreamBuffer(fp, chunk_size)
+    sb.expect('{')
+    if sb.peek() == '}':
+        return
+    while True:
+        key = sb.decode()
+        sb.expect(':')
+        if key == 'inner':
+            sb.expect('[')
+            if sb.peek() == ']':
+                sb.pos += 1
+            else:
+                while True:
+                    yield sb.decode()
+                    if sb.peek() == ']':
+                        sb.pos += 1
+                        break
+                    sb.expect(',')
+        else:
+            # id, kind, loc, range of the TranslationUnitDecl itself
+            sb.decode()
+        if sb.peek() == '}':
+            sb.pos += 1
+            return
+        sb.expect(',')
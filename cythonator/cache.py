@@ -0,0 +1,153 @@
+'''Cache the IR of headers on disk.'''
+
+import functools
+import hashlib
+import os
+import pathlib
+import pickle
+import tempfile
+
+from cythonator.pch import default_cache_dir, _clang_fingerprint, _read_depfile
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def converter_fingerprint():
+    '''Fingerprint of the code turning headers into IR.
+
+    IR cached by another version of cythonator (e.g., before a fix, or
+    with namedtuples of other fields) is never used.
+    '''
+    h = hashlib.sha256()
+    here = pathlib.Path(__file__).parent
+    for path in sorted(here.glob('*.py')) + sorted(here.glob('*.pyx')):
+        h.update(path.name.encode() + b'\0' + path.read_bytes())
+    return h.hexdigest()
+
+
+def _dep_info(path):
+    st = os.stat(path)
+    return (path, st.st_size, st.st_mtime_ns, _file_digest(path))
+
+
+def _dep_unchanged(dep):
+    path, size, mtime, digest = dep
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != size:
+        return False
+    # Touched but not changed is still a hit
+    return st.st_mtime_ns == mtime or _file_digest(path) == digest
+
+
+class IRCache:
+    '''Content-addressed cache of the IR of parsed headers.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        Where to keep the cache.  Defaults to ``$XDG_CACHE_HOME/cythonator``.
+    max_size : int, optional
+        Least recently used entries are removed once the cache grows
+        larger than this many bytes.
+
+    Notes
+    -----
+    Entries are keyed on the contents and location of the header, the
+    clang binary, the flags, any options changing the IR and the code of
+    cythonator itself (see :func:`converter_fingerprint`).  Each
+    entry also records every file the header included (from clang's
+    dependency output) and is only used while none of them changed.
+    '''
+
+    def __init__(self, cache_dir=None, max_size=256 << 20):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.root = pathlib.Path(cache_dir) / 'ir'
+        self.max_size = max_size
+        # bytes in the cache, as far as we know; None until looked at
+        self._size = None
+
+    def key(self, header, clang_exe, flags, options=()):
+        '''Key of `header` parsed with `flags` and IR `options`.'''
+        return hashlib.sha256('\0'.join(
+            [converter_fingerprint(), _clang_fingerprint(clang_exe),
+             os.path.realpath(header),
+             _file_digest(header), repr(tuple(options))] + list(flags)
+        ).encode()).hexdigest()
+
+    def _path(self, key):
+        return self.root / key[:2] / (key + '.pickle')
+
+    def get(self, key):
+        '''Cached IR for `key` or None if there is none or it is stale.'''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                deps, ir = pickle.load(fp)
+        except Exception:
+            # Missing, truncated or from an incompatible version
+            return None
+        if not all(_dep_unchanged(d) for d in deps):
+            return None
+        # mtime is what eviction goes by
+        os.utime(path)
+        return ir
+
+    def put(self, key, ir, depfile):
+        '''Store `ir` along with the files listed in `depfile`.'''
+        try:
+            deps = [_dep_info(os.path.abspath(d))
+                    for d in _read_depfile(depfile)]
+        except (OSError, ValueError):
+            # Without dependencies we couldn't tell when it gets stale
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump((deps, ir), fp, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        # only look at every entry once the cache may have grown too big
+        if self._size is None or self._size + size > self.max_size:
+            self.evict()
+        else:
+            self._size += size
+
+    def evict(self):
+        '''Remove least recently used entries until under max_size.'''
+        entries = []
+        total = 0
+        for path in self.root.glob('*/*.pickle'):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        self._size = total
@@ -0,0 +1,181 @@
+'''Take the flags of headers from a compilation database.'''
+
+import json
+import os
+import shlex
+
+# Flags that change how a header parses and take a path
+_PATH_FLAGS = ('-I', '-isystem', '-iquote', '-idirafter', '-include',
+               '-imacros', '-isysroot', '--sysroot')
+# Flags that change how a header parses and take any other value
+_VALUE_FLAGS = ('-D', '-U', '-target', '--target', '-x', '-Xclang')
+# Flags that can be glued to their value, e.g., -Iinclude
+_JOINED_FLAGS = ('-I', '-isystem', '-iquote', '-idirafter', '-isysroot',
+                 '-D', '-U', '-x')
+# Flags that can be joined to their value by "=", e.g., --target=arm64
+_EQ_FLAGS = ('--sysroot', '--target')
+# Flags without a value that change how a header parses: the language,
+# the predefined macros or the standard library.  Codegen, optimization
+# and warning flags don't matter, and would only split headers into
+# more batches (and cache keys).
+_SINGLE_FLAGS = frozenset([
+    '-ansi', '-pthread', '-m32', '-m64', '-mx32',
+    '-nostdinc', '-nostdinc++', '-nostdlibinc', '-nobuiltininc',
+    '-fexceptions', '-fno-exceptions', '-fcxx-exceptions',
+    '-fno-cxx-exceptions', '-frtti', '-fno-rtti',
+    '-fsigned-char', '-fno-signed-char', '-funsigned-char',
+    '-fno-unsigned-char', '-fshort-wchar', '-fno-short-wchar',
+    '-fchar8_t', '-fno-char8_t', '-fgnu-keywords', '-fno-gnu-keywords',
+    '-fms-extensions', '-fno-ms-extensions', '-fms-compatibility',
+    '-fno-ms-compatibility', '-fdelayed-template-parsing',
+    '-fno-delayed-template-parsing', '-fblocks', '-fno-blocks',
+    '-fopenmp', '-fcoroutines-ts', '-fconcepts-ts',
+    '-fsized-deallocation', '-fno-sized-deallocation',
+    '-faligned-new', '-fno-aligned-new', '-fno-builtin',
+])
+# Flags with a value glued to them by "=", matched by prefix
+_PREFIX_FLAGS = ('-std=', '-stdlib=', '-fms-compatibility-version=',
+                 '-fgnuc-version=', '-fopenmp=')
+
+
+def load_compdb(path):
+    '''Read a compilation database.
+
+    Parameters
+    ----------
+    path : str
+        ``compile_commands.json`` or the (build) directory containing it.
+
+    Returns
+    -------
+    dict
+        Maps the real path of each source file to its arguments (the
+        compiler first) and the directory they are relative to.
+    '''
+
+    if os.path.isdir(path):
+        path = os.path.join(path, 'compile_commands.json')
+    with open(path) as fp:
+        entries = json.load(fp)
+
+    db = {}
+    for entry in entries:
+        args = entry.get('arguments')
+        if args is None:
+            args = shlex.split(entry['command'])
+        directory = entry['directory']
+        filename = os.path.realpath(os.path.join(directory, entry['file']))
+        db[filename] = (args, directory)
+    return db
+
+
+def _split_flag(args, ii, flags):
+    '''Return (flag, value, number of args used) if args[ii] is in flags.'''
+    arg = args[ii]
+    for flag in flags:
+        if arg == flag:
+            if ii + 1 < len(args):
+                return flag, args[ii+1], 2
+            return None
+        if flag in _EQ_FLAGS and arg.startswith(flag + '='):
+            return flag, arg[len(flag) + 1:], 1
+        if arg.startswith(flag) and flag in _JOINED_FLAGS:
+            return flag, arg[len(flag):], 1
+    return None
+
+
+def _join_flag(flag, value):
+    '''Flag and its value, as arguments to pass on to clang.'''
+    if flag in _EQ_FLAGS:
+        return [f'{flag}={value}']
+    if flag in ('-D', '-U'):
+        return [flag + value]
+    return [flag, value]
+
+
+def header_flags(args, directory):
+    '''Flags of a compile command that matter for parsing headers.
+
+    Include paths (and the sysroot) are made absolute.  Only flags
+    known to change how headers parse are kept: defines, include paths,
+    the language and its standard, the target and its standard library,
+    ``-Xclang`` pairs and the like.  Everything that has to do with
+    compiling and linking (the compiler, sources, ``-c``, ``-o``,
+    ``-fPIC``, ``-march=...``, ``-O2``, ...) is dropped.
+    '''
+
+    flags = []
+    ii = 1  # skip the compiler
+    while ii < len(args):
+        arg = args[ii]
+        split = _split_flag(args, ii, _PATH_FLAGS)
+        if split is not None:
+            flag, value, used = split
+            flags += _join_flag(
+                flag, os.path.normpath(os.path.join(directory, value)))
+            ii += used
+            continue
+        split = _split_flag(args, ii, _VALUE_FLAGS)
+        if split is not None:
+            flag, value, used = split
+            flags += _join_flag(flag, value)
+            ii += used
+            continue
+        if arg == '-o':
+            ii += 2
+            continue
+        if arg in _SINGLE_FLAGS or arg.startswith(_PREFIX_FLAGS):
+            flags.append(arg)
+        ii += 1
+    return tuple(flags)
+
+
+def _common_prefix_len(a, b):
+    return len(os.path.commonpath([a, b]))
+
+
+def find_command(header, db):
+    '''Pick the compile command of `db` to parse `header` with.
+
+    Headers rarely have an entry of their own, so in order of
+    preference this is the header's own entry, the entry of a source
+    file next to it with the same stem (``foo.cpp`` for ``foo.hpp``) or
+    the entry of the source file closest to it in the directory tree.
+
+    Returns
+    -------
+    tuple or None
+        ``(args, directory)`` or None if `db` is empty.
+    '''
+
+    path = os.path.realpath(header)
+    if path in db:
+        return db[path]
+
+    stem = os.path.splitext(path)[0]
+    for filename in db:
+        if os.path.splitext(filename)[0] == stem:
+            return db[filename]
+
+    if not db:
+        return None
+    closest = max(db, key=lambda f: _common_prefix_len(f, path))
+    return db[closest]
+
+
+def group_headers(headers, db):
+    '''Group headers that are parsed with the same flags.
+
+    Returns
+    -------
+    dict
+        Maps tuples of flags (see :func:`header_flags`) to the list of
+        headers to parse with them, in the order they were given.
+    '''
+
+    groups = {}
+    for header in headers:
+        command = find_command(header, db)
+        flags = () if command is None else header_flags(*command)
+        groups.setdefault(flags, []).append(header)
+    return groups
@@ -1,20 +1,40 @@
 '''Transpile C/C++ headers into Cython extensions.'''
 
 import subprocess
-import json
+import io
+import os
+import tempfile
+import shutil
+import functools
 from collections import namedtuple
 import argparse
-import re
-from warnings import warn
 
 from cythonator.write_cython import write_pxd
+from cythonator.ast_stream import iter_ast_nodes
+from cythonator.locations import LocationFilter
+from cythonator.decoders import get_decoder, load_file
+from cythonator.pch import build_pch
+from cythonator.compdb import load_compdb, group_headers
+from cythonator.cache import IRCache
+from cythonator.qualtype import (
+    Type, parse_qualtype, return_type, with_canonical)
+from cythonator.typedefs import resolve_types
+from cythonator.index import DeclIndex
+from cythonator.lazy import LazyList, is_lazy, lazy_ir
+from cythonator.shake import shake
+from cythonator.shards import write_shards
+from cythonator.manifest import update_pxd
+from cythonator.dedup import dedup
+from cythonator.diagnostics import collecting, report, report_all
+from cythonator.parallel import (
+    count_decls, default_jobs, shard_size, split_namespace, merge_pieces,
+    map_shards)
+from cythonator.selectors import (
+    Selector, current_selector, selecting, iter_filtered_dump)
 
 
 # Custom AST nodes -- I don't think Cython ones currently do all the
 # things we need
-Type = namedtuple(
-    'Type',
-    'name is_ref is_ptr is_const is_const_ptr is_arr template_args clang_str')
 Typedef = namedtuple('Typedef', 'id name type referenced')
 TemplateParam = namedtuple(
     'TemplateParam',
@@ -25,7 +45,8 @@ Class = namedtuple(
         'id name is_struct methods fields templateparams bases typedefs children')
 Function = namedtuple(
     'Function',
-    'id name previously_declared return_type params templateparams')
+    'id name previously_declared return_type params templateparams '
+    'is_specialization', defaults=(False,))
 Method = namedtuple('Method', 'function is_ctor')
 Field = namedtuple('Field', 'id name type')
 Namespace = namedtuple(
@@ -33,122 +54,14 @@ Namespace = namedtuple(
     'id name children')
 
 
-def _is_const(type_str):
-    type_str = _remove_template_part(type_str).strip()
-    if len(type_str) > len('const ') and type_str[:len('const ')] == 'const ':
-        return True
-    return False
-
-
-def _is_const_ptr(type_str):
-    type_str = _remove_template_part(type_str).split()
-    return '*const' in type_str
-
-
-def _remove_template_part(type_str):
-    # Remove any template part of the string
-    start_idx = type_str.find('<')
-    end_idx = type_str.rfind('>')
-    if start_idx > 0:
-        type_str = type_str[:start_idx] + type_str[end_idx+1:]
-    return type_str.strip()
-
-
-def _is_ptr(type_str):
-    return '*' in _remove_template_part(type_str)
-
-
-def _is_ref(type_str):
-    return '&' in _remove_template_part(type_str)
-
-
-def _is_arr(type_str):
-    return '[' in _remove_template_part(type_str)
-
-
-def _sanitize_type_str(type_str):
-    type_str = _remove_template_part(type_str)
-    type_str = type_str.replace('*', '').replace('&', '').strip()
-    type_str = ' '.join([t for t in type_str.split() if t != 'const'])
-    type_str = type_str.split('()')[0].strip()
-    return type_str
-
-
-def _get_template_args(type_str):
-    # If there is a template, we need to recursively resolve it
-    if '<' not in type_str:
-        return []
-
-    # Take contents of the outermost angle bracket pair
-    start_idx = type_str.find('<')
-    end_idx = type_str.rfind('>')
-    template_str = type_str[start_idx+1:end_idx].strip()
-
-    # This could be a comma separated list of potentially templated
-    # types, so separate the types and call recursively to get the
-    # final list
-    # NOTE: we could also create a dummy class to take the parameters
-    # and call clang recursively, but this will probably work, too
-    idx = 0
-    tipe = ''
-    braces = 0
-    types = []
-    recurse = False
-    while idx < len(template_str):
-        # Eat the next type
-        if template_str[idx] == '<':
-            braces += 1
-            recurse = True
-        if template_str[idx] == '>':
-            braces -= 1
-        if braces == 0 and template_str[idx] == ',':
-            # print('tipe before recurse is', tipe)
-            # types.append(_get_template_args(tipe)[0])
-            types.append(Type(
-                name=_sanitize_type_str(tipe),
-                is_ref=_is_ref(tipe),
-                is_ptr=_is_ptr(tipe),
-                is_const=_is_const(tipe),
-                is_const_ptr=_is_const_ptr(tipe),
-                is_arr=_is_arr(tipe),
-                template_args=_get_template_args(tipe) if recurse else [],
-                clang_str=tipe,
-            ))
-            tipe = ''
-            recurse = False
-        else:
-            tipe = tipe + template_str[idx]
-            if idx == len(template_str) - 1:
-                types.append(Type(
-                    name=_sanitize_type_str(tipe),
-                    is_ref=_is_ref(tipe),
-                    is_ptr=_is_ptr(tipe),
-                    is_const=_is_const(tipe),
-                    is_const_ptr=_is_const_ptr(tipe),
-                    is_arr=_is_arr(tipe),
-                    template_args=_get_template_args(tipe) if recurse else [],
-                    clang_str=tipe,
-                ))
-
-        idx += 1
-
-    return types
-
-
 def handle_type(t):
-    if not isinstance(t, str):
-        t = t['qualType']
-
-    return Type(
-        name=_sanitize_type_str(t),
-        is_ref=_is_ref(t),
-        is_ptr=_is_ptr(t),
-        is_const=_is_const(t),
-        is_const_ptr=_is_const_ptr(t),
-        is_arr=_is_arr(t),
-        template_args=_get_template_args(t),
-        clang_str=t,
-    )
+    if isinstance(t, str):
+        return parse_qualtype(t)
+    # clang only writes the desugared type if it is different
+    canonical = None
+    if 'desugaredQualType' in t:
+        canonical = parse_qualtype(t['desugaredQualType'])
+    return with_canonical(parse_qualtype(t['qualType']), canonical)
 
 
 def handle_typedef(node):
@@ -161,13 +74,49 @@ def handle_typedef(node):
     )
 
 
+def _warn_nontype_template_params(params, what, id=None):
+    if params:
+        report(
+            'warning',
+            f'Non-type template parameters {set(params)} of'
+            f' the {what} are not supported by Cython '
+            'and will be omitted from the template parameter list!', id)
+
+
+def _warn_template_template_params(names, tag_used, name, id=None):
+    if names:
+        report(
+            'warning',
+            'Template-template parameters are not supported. Template-'
+            f'template parameters {set(names)} '
+            f'of {tag_used} "{name}" will be ignored.', id)
+
+
+def _warn_virtual_functions(names, tag_used, name, id=None):
+    # Cython lacks support for virtual functions
+    if names:
+        report(
+            'warning',
+            f'Cython does not support virtual interfaces '
+            f'for functions {set(names)} in '
+            f'{tag_used} "{name}"!', id)
+
+
+def _function_return_type(t):
+    canonical = None
+    if 'desugaredQualType' in t:
+        canonical = return_type(t['desugaredQualType'])
+    return with_canonical(return_type(t['qualType']), canonical)
+
+
 def handle_function(node):
     templateparams = ()
 
     # strip templates off of constructors;
     # this seems to be the only function kind that needs this
+    name = node['name']
     if node['kind'] == 'CXXConstructorDecl':
-        node['name'] = node['name'].split('<')[0]
+        name = name.split('<')[0]
 
     if node['kind'] == 'FunctionTemplateDecl':
         # handle TemplateParams here
@@ -185,23 +134,12 @@ def handle_function(node):
             t['type']['qualType'] + ' ' + t['name']
             for t in node['inner']
             if t['kind'] == 'NonTypeTemplateParmDecl' and 'name' in t]
-        if nonTypeTemplateParams:
-            warn(
-                f'Non-type template parameters {set(nonTypeTemplateParams)} of'
-                f' the function "{node["name"]}" are not supported by Cython '
-                'and will be omitted from the template parameter list!')
+        _warn_nontype_template_params(
+            nonTypeTemplateParams, f'function "{node["name"]}"', node['id'])
 
         # FunctionTemplateDecl contains FunctionDecl or CXXMethodDecl
         node = [l for l in node['inner'] if l['kind'] in {'FunctionDecl', 'CXXMethodDecl'}][0]
-
-    # eat the return type
-    ret_type = ''
-    ii = 0
-    next_char = node['type']['qualType'][ii]
-    while next_char != '(':
-        ret_type += next_char
-        ii += 1
-        next_char = node['type']['qualType'][ii]
+        name = node['name']
 
     # Get the function params
     if 'inner' in node:
@@ -213,41 +151,45 @@ def handle_function(node):
     else:
         params = ()
 
+    # redeclarations and specializations are merged by cythonator.dedup
     previously_declared = 'previousDecl' in node
-    # if previously_declared:
-    #     raise NotImplementedError('Need naming scheme for overloads '
-    #                               'and template specializations!')
+    is_specialization = any(
+        l['kind'] == 'TemplateArgument' for l in node.get('inner', ()))
 
     return Function(
         id=node['id'],
-        name=node['name'],
+        name=name,
         previously_declared=previously_declared,
-        return_type=handle_type(ret_type),
+        return_type=_function_return_type(node['type']),
         params=params,
         templateparams=templateparams,
+        is_specialization=is_specialization,
     )
 
 
 def handle_namespace(node, parent_node=None):
-    if 'inner' not in node:
-        node['inner'] = []
-
     if parent_node is None:
         qualified_ns = node['name']
     else:
         qualified_ns = parent_node['name'] + '::' + node['name']
 
     # gather all children contained in namespace
-    children = []
-    for thing in node['inner']:
-        if thing['kind'] in {'FunctionDecl', 'FunctionTemplateDecl'}:
-            children.append(handle_function(thing))
-        elif thing['kind'] == 'TypedefDecl':
-            children.append(handle_typedef(thing))
-        elif thing['kind'] == 'NamespaceDecl' and 'name' in node:
-            children.append(handle_namespace(thing, node))
-        elif thing['kind'] in {'CXXRecordDecl', 'ClassTemplateDecl'}:
-            children.append(handle_class(thing))
+    selector = current_selector()
+    inner = [thing for thing in node.get('inner', ())
+             if thing['kind'] in _NAMESPACE_HANDLERS and (
+                 selector is None
+                 or selector.selects_node(thing, qualified_ns))]
+
+    # nested namespaces are named after the qualified name
+    scope = {**node, 'name': qualified_ns}
+
+    def build(thing):
+        return _NAMESPACE_HANDLERS[thing['kind']](thing, scope)
+
+    if is_lazy():
+        children = LazyList(inner, build, [t.get('name') for t in inner])
+    else:
+        children = [c for c in map(build, inner) if c is not None]
 
     return Namespace(
         id=node['id'],
@@ -256,6 +198,42 @@ def handle_namespace(node, parent_node=None):
     )
 
 
+class ClassVisitor:
+    '''What has been gathered so far while visiting a class's members.
+
+    Members are visited once, in the order they are declared in, so
+    `access` is the access of the member being visited: it starts out
+    as the default of the class's tag and is updated by every access
+    specifier along the way.  Class handlers (see
+    :func:`register_handler`) add to the lists of the visitor, only
+    keeping members whose access is in `keep_access` (see
+    :class:`cythonator.selectors.Selector`).
+    '''
+    __slots__ = ('name', 'tag_used', 'access', 'keep_access', 'methods',
+                 'fields', 'typedefs', 'children', 'virtual_functions')
+
+    def __init__(self, node):
+        self.name = node['name']
+        self.tag_used = node['tagUsed']
+        self.access = 'private' if node['tagUsed'] == 'class' else 'public'
+        selector = current_selector()
+        self.keep_access = (
+            ('public',) if selector is None else selector.access)
+        self.methods = []
+        self.fields = []
+        self.typedefs = []
+        self.children = []
+        self.virtual_functions = []
+
+    def visit(self, members):
+        for m in members:
+            if 'virtual' in m:
+                self.virtual_functions.append(m['name'])
+            handler = _CLASS_HANDLERS.get(m['kind'])
+            if handler is not None:
+                handler(m, self)
+
+
 def handle_class(node):
     '''
     Notes
@@ -272,8 +250,10 @@ def handle_class(node):
 
     # If the class has no name, we probably don't care?
     if 'name' not in node:
-        print(json.dumps(node, indent=4))
-        assert False
+        report('warning',
+               f'Unnamed {node.get("tagUsed", "class")} is not supported '
+               'and will be ignored!', node['id'])
+        return None
 
     # Keep a list of all the base classes we inherit from;
     # We currently don't keep track of access (public, private, etc.),
@@ -298,7 +278,6 @@ def handle_class(node):
             is_parameter_pack='isParameterPack' in t and t['isParameterPack'],
         ) for t in node['inner'] if t['kind'] == 'TemplateTypeParmDecl']
 
-        # TODO: move this code and the copy in handle_function to a separate shared function
         nonTypeTemplateParams = [
             t['type']['qualType'] + ' ' + t['name']
             for t in node['inner']
@@ -311,147 +290,868 @@ def handle_class(node):
         # FunctionTemplateDecl contains CXXRecordDecl
         node = [l for l in node['inner'] if l['kind'] == 'CXXRecordDecl'][0]
 
-    # If there is no inner, then this is usually just a declaration
-    if 'inner' not in node:
-        node['inner'] = []
-
-    # Warn about Cython's lack of support for virtual functions
-    virt_funcs = [n['name'] for n in node['inner'] if 'virtual' in n]
-    if virt_funcs:
-        warn(
-            f'Cython does not support virtual interfaces '
-            f'for functions {set(virt_funcs)} in '
-            f'{node["tagUsed"]} "{node["name"]}"!')
+    # Single pass over the members; if there is no inner, then this is
+    # usually just a declaration
+    visitor = ClassVisitor(node)
+    if is_lazy():
+        # members are visited when any of them is first needed
+        visit = functools.lru_cache(maxsize=None)(
+            lambda: _visit_class(visitor, node))
+        methods, fields, typedefs, children = [
+            LazyList.deferred(lambda attr=attr: getattr(visit(), attr))
+            for attr in ('methods', 'fields', 'typedefs', 'children')]
+    else:
+        _visit_class(visitor, node)
+        methods, fields, typedefs, children = (
+            visitor.methods, visitor.fields, visitor.typedefs,
+            visitor.children)
 
     # Warn about any non-type template params we encountered
-    if nonTypeTemplateParams:
-        warn(
-            f'Non-type template parameters {set(nonTypeTemplateParams)} of'
-            f' the {node["tagUsed"]} "{node["name"]}" are not supported by Cython '
-            'and will be omitted from the template parameter list!')
+    _warn_nontype_template_params(
+        nonTypeTemplateParams, f'{node["tagUsed"]} "{node["name"]}"',
+        node['id'])
 
     # Warn about any template-template paramters we encountered
-    if templateTemplateParams:
-        warn(
-            'Template-template parameters are not supported. Template-'
-            f'template parameters {set(templateTemplateParams)} '
-            f'of {node["tagUsed"]} "{node["name"]}" will be ignored.')
-
-    # Deduce the access specifier of each entry in node['inner']
-    current_access = 'private' if node['tagUsed'] == 'class' else 'public'
-    for ii, thing in enumerate(node['inner']):
-        if thing['kind'] in {'CXXConstructorDecl', 'CXXMethodDecl', 'FunctionTemplateDecl', 'FieldDecl'}:
-            node['inner'][ii]['access'] = current_access
-        elif thing['kind'] == 'AccessSpecDecl':
-            current_access = thing['access']
-
-    # gather up all children
-    children = []
-    for thing in node['inner']:
-        if thing['kind'] in {'CXXRecordDecl', 'ClassTemplateDecl'} and (('name' in thing) and (thing['name'] != node['name'])):
-            children.append(handle_class(thing))
+    _warn_template_template_params(
+        templateTemplateParams, node['tagUsed'], node['name'], node['id'])
 
     return Class(
         id=node['id'],
         name=node['name'],
         is_struct=node['tagUsed'] == 'struct',
-        # can add default ctor, movectr, copyctr, copyassign if wanted (look in definitionData)
-        # - Ignores implicit functions generated by virtual methods
-        # - Ignores non-public methods
-        methods=[Method(
-            function=handle_function(m),
-            is_ctor=m['kind'] == 'CXXConstructorDecl',
-        ) for m in node['inner'] if m['kind'] in {'CXXConstructorDecl', 'CXXMethodDecl', 'FunctionTemplateDecl'} and m['access'] == 'public' and ('isImplicit' not in m or not m['isImplicit'])],
-        fields=[Field(
-            id=f['id'],
-            name=f['name'],
-            type=handle_type(f['type']),
-        ) for f in node['inner'] if f['kind'] == 'FieldDecl' and f['access'] == 'public'],
+        methods=methods,
+        fields=fields,
         templateparams=templateparams,
         bases=bases,
-        typedefs=[handle_typedef(t) for t in node['inner'] if t['kind'] == 'TypedefDecl'],
+        typedefs=typedefs,
         children=children,
     )
 
 
+def _visit_class(visitor, node):
+    visitor.visit(node.get('inner', ()))
+
+    # Warn about Cython's lack of support for virtual functions
+    _warn_virtual_functions(
+        visitor.virtual_functions, node['tagUsed'], node['name'], node['id'])
+    return visitor
+
+
+# Handlers of the kinds of nodes found in namespaces (including the
+# global one) and in classes
+_NAMESPACE_HANDLERS = {}
+_CLASS_HANDLERS = {}
+
+
+def register_handler(kinds, scope='namespace'):
+    '''Decorator registering a handler for nodes of `kinds`.
+
+    Parameters
+    ----------
+    kinds : str or list of str
+        Kinds of clang's JSON AST nodes, e.g., ``'EnumDecl'``.  A handler
+        registered for a kind replaces any previous one.
+    scope : {'namespace', 'class'}, optional
+        Where the nodes are found.  Namespace handlers are called as
+        ``handler(node, parent)`` with the enclosing NamespaceDecl node
+        (None at the top level) and return the IR node to add to the
+        namespace or None.  Class handlers are called as
+        ``handler(node, visitor)`` with the :class:`ClassVisitor` of the
+        enclosing class and add to it.
+
+    Notes
+    -----
+    Handlers only see the JSON AST, they are not used with ``native``.
+    With `jobs`, they are passed on to the worker processes, so they
+    must be picklable (e.g., module-level functions).
+    '''
+
+    if scope == 'namespace':
+        handlers = _NAMESPACE_HANDLERS
+    elif scope == 'class':
+        handlers = _CLASS_HANDLERS
+    else:
+        raise ValueError(f'Unknown scope "{scope}"!')
+    if isinstance(kinds, str):
+        kinds = [kinds]
+
+    def decorator(handler):
+        for kind in kinds:
+            handlers[kind] = handler
+        return handler
+    return decorator
+
+
+@register_handler(['FunctionDecl', 'FunctionTemplateDecl'])
+def _namespace_function(node, parent):
+    return handle_function(node)
+
+
+@register_handler('TypedefDecl')
+def _namespace_typedef(node, parent):
+    return handle_typedef(node)
+
+
+@register_handler('NamespaceDecl')
+def _namespace_namespace(node, parent):
+    # ignore anonymous namespaces
+    if 'name' not in node:
+        return None
+    return handle_namespace(node, parent)
+
+
+@register_handler(['CXXRecordDecl', 'ClassTemplateDecl'])
+def _namespace_class(node, parent):
+    # both structs and classes
+    return handle_class(node)
+
+
+@register_handler('AccessSpecDecl', scope='class')
+def _class_access(node, visitor):
+    visitor.access = node['access']
+
+
+@register_handler(
+    ['CXXConstructorDecl', 'CXXMethodDecl', 'FunctionTemplateDecl'],
+    scope='class')
+def _class_method(node, visitor):
+    # can add default ctor, movectr, copyctr, copyassign if wanted (look in definitionData)
+    # - Ignores implicit functions generated by virtual methods
+    # - Ignores non-public methods (unless selected)
+    if (visitor.access in visitor.keep_access
+            and not node.get('isImplicit', False)):
+        visitor.methods.append(Method(
+            function=handle_function(node),
+            is_ctor=node['kind'] == 'CXXConstructorDecl',
+        ))
+
+
+@register_handler('FieldDecl', scope='class')
+def _class_field(node, visitor):
+    if visitor.access in visitor.keep_access:
+        visitor.fields.append(Field(
+            id=node['id'],
+            name=node['name'],
+            type=handle_type(node['type']),
+        ))
+
+
+@register_handler('TypedefDecl', scope='class')
+def _class_typedef(node, visitor):
+    visitor.typedefs.append(handle_typedef(node))
+
+
+@register_handler(['CXXRecordDecl', 'ClassTemplateDecl'], scope='class')
+def _class_class(node, visitor):
+    # the class itself shows up as a (implicit) member
+    if 'name' in node and node['name'] != visitor.name:
+        visitor.children.append(handle_class(node))
+
+
 def _get_all_types(thing):
     '''Find all types present in a "thing".'''
+    return set(DeclIndex().add(thing).types_used(thing))
 
-    parsable = repr(thing)
 
-    # Find everything that looks like a type
-    types = set()
-    # TODO: make work with template_args
-    for match in re.finditer(r"Type\(name='(?P<name>\w+)', is_ref=(?P<is_ref>\w+), is_ptr=(?P<is_ptr>\w+), is_const=(?P<is_const>\w+)\), template_args=(?P<template_args>\w+)", parsable):
-        types.add(match.group('name'))
-    return types
+# Kinds of statements and expressions, i.e., what function bodies and
+# initializers are made of
+_STMT_SUFFIXES = ('Stmt', 'Expr', 'Literal', 'Operator', 'Cleanups')
 
 
-def cythonator(filename: str, extra_include_dirs=None, clang_exe='clang++-10'):
-    '''C/C++ -> Cython.'''
+def _is_stmt(node):
+    kind = node.get('kind', '')
+    return (not kind or kind == 'CXXCtorInitializer'
+            or kind.endswith(_STMT_SUFFIXES))
 
-    # Process the sources
+
+def _strip_bodies(node):
+    '''Copy of node without any statements or expressions in it.'''
+    if 'inner' not in node:
+        return node
+    return {**node, 'inner': [
+        _strip_bodies(n) for n in node['inner'] if not _is_stmt(n)]}
+
+
+def _handle_toplevel(node, global_namespace, keep=None, decls_only=False):
+    # Every node needs to go through the filter (in order) so it can
+    # keep track of which file we are in
+    if keep is not None and not keep(node):
+        return
+
+    child = _convert_toplevel(node, decls_only)
+    if child is not None:
+        global_namespace.children.append(child)
+
+
+def _convert_toplevel(node, decls_only=False):
+    '''IR of a top-level node (None if it is left out).'''
+
+    # ignore double underscored typedefs
+    if node['kind'] == 'TypedefDecl' and node['name'].startswith('__'):
+        return None
+
+    handler = _NAMESPACE_HANDLERS.get(node['kind'])
+    if handler is None:
+        report('note', f'No handler for "{node["kind"]}" nodes', node['id'])
+        return None
+
+    selector = current_selector()
+    if selector is not None and not selector.selects_node(node):
+        return None
+
+    if decls_only:
+        node = _strip_bodies(node)
+    return handler(node, None)
+
+
+def _install_handlers(namespace_handlers, class_handlers):
+    '''Use the handlers of the parent process in a worker.'''
+    _NAMESPACE_HANDLERS.clear()
+    _NAMESPACE_HANDLERS.update(namespace_handlers)
+    _CLASS_HANDLERS.clear()
+    _CLASS_HANDLERS.update(class_handlers)
+
+
+def _convert_shard(nodes, decls_only, selector):
+    res = []
+    with selecting(selector):
+        for node in nodes:
+            # they are reported again by the parent, in order
+            with collecting() as diagnostics:
+                child = _convert_toplevel(node, decls_only)
+            res.append((child, diagnostics))
+    return res
+
+
+def _convert_parallel(nodes, jobs, decls_only, selector):
+    '''IR of top-level nodes (None where left out), on `jobs` processes.
+
+    Big namespaces are split up (see
+    :func:`cythonator.parallel.split_namespace`), so the IR of their
+    pieces is put back together with
+    :func:`cythonator.parallel.merge_pieces`.  Workers use the handlers
+    registered in this process (see :func:`register_handler`), so
+    handlers must be picklable where workers aren't forked.
+    '''
+
+    if jobs is None:
+        jobs = default_jobs()
+    # usually there is one (nested) namespace holding almost everything,
+    # so go by the number of declarations, not of top-level nodes
+    size = shard_size(sum(count_decls(node) for node in nodes), jobs)
+    pieces, owner = [], []
+    for ii, node in enumerate(nodes):
+        for piece in split_namespace(node, size):
+            pieces.append(piece)
+            owner.append(ii)
+    converted = map_shards(
+        _convert_shard, pieces, jobs, args=(decls_only, selector),
+        initializer=_install_handlers,
+        initargs=(dict(_NAMESPACE_HANDLERS), dict(_CLASS_HANDLERS)))
+
+    res = [[] for _node in nodes]
+    for ii, (child, diagnostics) in zip(owner, converted):
+        report_all(diagnostics)
+        if child is not None:
+            res[ii].append(child)
+    return [merge_pieces(children)[0] if children else None
+            for children in res]
+
+
+def _indexed(namespace, index):
+    if index is not None:
+        index.add(namespace)
+    return namespace
+
+
+def _clang_opts(extra_include_dirs, extra_flags, decls_only, pch_includes,
+                clang_exe, pch_dir):
     opts = []
     if extra_include_dirs is not None:
         opts.append('-I')
         opts.append(extra_include_dirs)
 
-    opts.append(filename)
-    proc = subprocess.Popen(
-        [clang_exe, '-Xclang', '-ast-dump=json', '-fsyntax-only'] + opts,
-        stdout=subprocess.PIPE)
-    out, _err = proc.communicate()
-
-    # with open('ast.json', 'wb') as fp:
-    #     fp.write(out)
-
-    ast = json.loads(out)
+    if extra_flags:
+        opts += list(extra_flags)
+
+    if decls_only:
+        opts += ['-Xclang', '-skip-function-bodies']
+
+    if pch_includes:
+        pch = build_pch(pch_includes, flags=opts, clang_exe=clang_exe,
+                        cache_dir=pch_dir)
+        opts += ['-include-pch', pch]
+    return opts
+
+
+def _check_clang(cmd, returncode, size):
+    '''Fail if clang wrote no AST (`size` bytes or nodes), warn on errors.'''
+    if not returncode:
+        return
+    if not size:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    report('warning', f'clang exited with status {returncode}, the AST '
+           'may be incomplete.')
+
+
+def _iter_toplevel(cmd, stream, json_backend, capture):
+    '''Run clang and yield the top-level nodes of its AST dump.'''
+
+    if stream:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        seen = 0
+        try:
+            with io.TextIOWrapper(proc.stdout, encoding='utf-8') as fp:
+                for node in iter_ast_nodes(fp):
+                    seen += 1
+                    yield node
+        except ValueError:
+            # the dump was cut short, clang's status tells why
+            if not proc.wait():
+                raise
+        _check_clang(cmd, proc.wait(), seen)
+        return
+
+    loads = get_decoder(json_backend)
+    if capture == 'file':
+        with tempfile.TemporaryFile() as fp:
+            returncode = subprocess.run(cmd, stdout=fp).returncode
+            _check_clang(cmd, returncode, fp.seek(0, os.SEEK_END))
+            ast = load_file(fp, loads)
+    elif capture == 'pipe':
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        out, _err = proc.communicate()
+        _check_clang(cmd, proc.returncode, len(out))
+
+        # with open('ast.json', 'wb') as fp:
+        #     fp.write(out)
+
+        ast = loads(out)
+        del out
+    else:
+        raise ValueError(f'Unknown capture "{capture}"!')
 
     # print(list(ast['inner'][-1].keys()))
     # print(ast['inner'][-1]['inner'])
 
+    yield from ast['inner']
+
+
+def _iter_filtered(cmd, json_backend):
+    '''Run clang with ``-ast-dump-filter`` and yield the dumped nodes.'''
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE)
+    # a failing clang looks just like nothing being dumped
+    _check_clang(cmd, proc.returncode, len(proc.stdout))
+    yield from iter_filtered_dump(proc.stdout, get_decoder(json_backend))
+
+
+def default_clang():
+    '''clang to use if none is given.
+
+    That is ``$CYTHONATOR_CLANG`` if set, else the first of
+    ``clang++-10`` and ``clang++`` found on the PATH.
+    '''
+    exe = os.environ.get('CYTHONATOR_CLANG')
+    if exe:
+        return exe
+    for exe in ('clang++-10', 'clang++'):
+        if shutil.which(exe) is not None:
+            return exe
+    return 'clang++-10'
+
+
+_ConfigBase = namedtuple(
+    'Config',
+    'clang_exe extra_include_dirs extra_flags stream filter_includes '
+    'include_roots decls_only json_backend capture pch_includes pch_dir '
+    'native cache cache_dir lazy selector jobs session',
+    defaults=(None, None, None, False, True, None, False, 'auto', 'pipe',
+              None, None, False, False, None, False, None, 1, None))
+
+
+class Config(_ConfigBase):
+    '''Options of :func:`run`, the same as the arguments of :func:`cythonator`.
+
+    Lists are stored as tuples, so a Config can be shared by any number
+    of threads.  Use ``_replace`` to make a changed copy, e.g., to parse
+    in-process with a session (see :func:`open_session`).
+    '''
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        config = _ConfigBase.__new__(cls, *args, **kwargs)
+        return tuple.__new__(cls, [
+            tuple(val) if isinstance(val, list) else val for val in config])
+
+    @classmethod
+    def _make(cls, iterable):
+        # namedtuple's _make (and so _replace) skips __new__
+        return cls(*iterable)
+
+
+Result = namedtuple('Result', 'ir diagnostics')
+
+
+def run(filename, config=Config()):
+    '''C/C++ -> IR, safe to call from many threads at once.
+
+    Parameters
+    ----------
+    filename : str
+        Header to convert.
+    config : Config, optional
+        How to convert it.
+
+    Returns
+    -------
+    Result
+        ``ir`` is the global namespace (see :func:`cythonator`) and
+        ``diagnostics`` the list of
+        :class:`cythonator.diagnostics.Diagnostic` reported instead of
+        being printed or warned about.  Diagnostics of lazy IR (see
+        `Config.lazy`) are added when it is built.
+
+    Notes
+    -----
+    Clang's JSON is never modified and all state of a conversion is
+    kept per call (or per thread), so threads don't interfere.  Clang
+    runs in a subprocess, so threads parse in parallel.  With
+    `Config.jobs`, worker processes are only forked while no other
+    threads are running (see :func:`cythonator.parallel.map_shards`).
+    A `Config.session` parses one header at a time.
+    '''
+    with collecting() as diagnostics:
+        ir = cythonator(filename, **config._asdict())
+    return Result(ir, diagnostics)
+
+
+def open_session(config=Config()):
+    '''In-process parser of many headers, converting like `config`.
+
+    Returns
+    -------
+    cythonator._native.Session
+        Parses headers the same as :func:`run` with `config` and
+        ``native=True`` would, but keeps the files looked up and the
+        preambles built between headers.  Pass it on as
+        `Config.session` (or the `session` of :func:`cythonator`).
+    '''
+
+    from cythonator._native import Session
+    clang_exe = config.clang_exe
+    if clang_exe is None:
+        clang_exe = default_clang()
+    opts = _clang_opts(config.extra_include_dirs, config.extra_flags,
+                       config.decls_only, config.pch_includes, clang_exe,
+                       config.pch_dir)
+    return Session(
+        flags=opts, include_roots=config.include_roots,
+        filter_includes=config.filter_includes, selector=config.selector)
+
+
+def run_headers(filenames, config=Config()):
+    '''Many C/C++ headers -> IR, safe to call from many threads at once.
+
+    Like :func:`run`, but for :func:`cythonator_headers`, so ``ir`` maps
+    headers to their global namespace.  `Config.native`, `Config.cache`,
+    `Config.cache_dir`, `Config.lazy` and `Config.session` don't apply.
+    '''
+    kwargs = config._asdict()
+    for name in ('native', 'cache', 'cache_dir', 'lazy', 'session'):
+        del kwargs[name]
+    with collecting() as diagnostics:
+        ir = cythonator_headers(filenames, **kwargs)
+    return Result(ir, diagnostics)
+
+
+def cythonator(filename: str, extra_include_dirs=None, clang_exe=None,
+               stream=False, filter_includes=True, include_roots=None,
+               decls_only=False, json_backend='auto', capture='pipe',
+               pch_includes=None, pch_dir=None, native=False,
+               extra_flags=None, cache=False, cache_dir=None, index=None,
+               lazy=False, selector=None, jobs=1, session=None):
+    '''C/C++ -> Cython.
+
+    `clang_exe` is the clang to run (see :func:`default_clang`).
+
+    `extra_flags` is a list of additional compiler flags, e.g.,
+    ``['-DNDEBUG', '-std=c++17']``.
+
+    If `stream` is True, the AST dump is consumed incrementally from
+    clang's stdout and every top-level declaration is converted (and
+    then dropped) as soon as it has been read, instead of decoding the
+    whole translation unit at once.
+
+    If `filter_includes` is True, only declarations located in
+    `filename` or in a header below one of `include_roots` are
+    converted; everything pulled in from other headers is dropped
+    before any IR is built for it.
+
+    If `decls_only` is True, clang skips function bodies instead of
+    parsing and dumping them, and any statements that still make it
+    into the dump (e.g., initializers) are stripped before conversion.
+
+    When not streaming, the dump is decoded all at once using
+    `json_backend` (see :func:`cythonator.decoders.get_decoder`).  With
+    `capture='file'`, clang writes the dump to a temporary file that is
+    memory-mapped for decoding instead of being copied out of a pipe
+    (the "stdlib" backend still copies it, the others decode in place).
+
+    `pch_includes` is a list of headers shared by many of the headers
+    being wrapped (e.g., ``['<vector>', 'core.hpp']``).  They are
+    precompiled once (see :func:`cythonator.pch.build_pch`) and the PCH
+    is reused by every call with the same includes and flags; their
+    declarations are not part of the dump.
+
+    If `native` is True, the header is parsed in-process by the clang
+    extension module (see :func:`cythonator._native.parse_header`)
+    instead of by `clang_exe`, skipping the JSON round trip entirely.
+    If `session` is a :class:`cythonator._native.Session` (see
+    :func:`open_session`), it parses the header instead, with the
+    flags, include roots and selector it was made with.
+
+    If `cache` is True, the IR is stored in (and taken from) an
+    :class:`cythonator.cache.IRCache` in `cache_dir`, so headers that
+    didn't change (along with everything they include) are not parsed
+    again.
+
+    If `index` is a :class:`cythonator.index.DeclIndex`, the
+    declarations are added to it.
+
+    If `lazy` is True, the members of namespaces and classes are only
+    converted when first accessed (see :class:`cythonator.lazy.LazyList`),
+    so namespaces that are never looked at cost next to nothing.  Types
+    then are only resolved as far as clang desugared them (no
+    :func:`cythonator.typedefs.resolve_types`), redeclarations aren't
+    merged (no :func:`cythonator.dedup.dedup`) and the JSON AST is kept
+    around until everything referring to it has been built.  Adding to
+    an `index` or the `cache` builds everything.
+
+    If `selector` is a :class:`cythonator.selectors.Selector`, only the
+    declarations it selects are converted.  When it allows (see
+    :meth:`cythonator.selectors.Selector.dump_filter`), clang only dumps
+    the scope the selected declarations are in, read all at once
+    regardless of `stream` and `capture`.
+
+    If `jobs` isn't 1, the top-level declarations are split into shards
+    that are converted by a pool of `jobs` processes (one per core if
+    None), see :func:`cythonator.parallel.map_shards`.  The IR is the
+    same as with a single process.  The whole AST is read first, even
+    when streaming, and `lazy` is not supported.
+    '''
+
+    if lazy and jobs != 1:
+        raise ValueError('Lazy IR can only be built by a single process!')
+    if session is not None:
+        return _indexed(session.parse(filename), index)
+    if clang_exe is None:
+        clang_exe = default_clang()
+
+    # Process the sources
+    opts = _clang_opts(extra_include_dirs, extra_flags, decls_only,
+                       pch_includes, clang_exe, pch_dir)
+
+    if native:
+        from cythonator._native import parse_header
+        return _indexed(parse_header(
+            filename, flags=opts, include_roots=include_roots,
+            filter_includes=filter_includes, selector=selector), index)
+
+    if cache:
+        ir_cache = IRCache(cache_dir)
+        key = ir_cache.key(filename, clang_exe, opts, (
+            filter_includes, include_roots, decls_only, lazy, selector))
+        cached = ir_cache.get(key)
+        if cached is not None:
+            return _indexed(cached, index)
+
+    opts.append(filename)
+    cmd = [clang_exe, '-Xclang', '-ast-dump=json', '-fsyntax-only'] + opts
+
+    dump_filter = None if selector is None else selector.dump_filter()
+    if dump_filter is not None:
+        cmd += ['-Xclang', '-ast-dump-filter', '-Xclang', dump_filter]
+
     global_namespace = Namespace(
         id='_global_namespace',
         name='',
         children=[],
     )
-    for node in ast['inner']:
-        if node['kind'] in {'FunctionDecl', 'FunctionTemplateDecl'}:
-            # print(node)
-            global_namespace.children.append(handle_function(node))
-        elif node['kind'] == 'NamespaceDecl' and 'name' in node:  # ignore anonymous namespaces
-            global_namespace.children.append(handle_namespace(node))
-        elif node['kind'] == 'TypedefDecl':
-            # ignore double underscored typedefs
-            if node['name'].startswith('__'):
-                continue
-            global_namespace.children.append(handle_typedef(node))
-        elif node['kind'] in {'CXXRecordDecl', 'ClassTemplateDecl'}:
-            # both structs and classes
-            # print(json.dumps(node, indent=4))
-            global_namespace.children.append(handle_class(node))
-            # print(handle_class(node))
+
+    keep = None
+    if filter_includes:
+        keep = LocationFilter([filename], include_roots)
+
+    depfile = None
+    if cache:
+        # Have clang list everything the header includes
+        fd, depfile = tempfile.mkstemp(suffix='.d')
+        os.close(fd)
+        cmd += ['-MD', '-MF', depfile]
+
+    try:
+        if dump_filter is None:
+            nodes = _iter_toplevel(cmd, stream, json_backend, capture)
+            if keep is not None:
+                nodes = filter(keep, nodes)
+        else:
+            # every dump names its file, so filter what was dumped
+            nodes = (wrapped for node, wrapped
+                     in _iter_filtered(cmd, json_backend)
+                     if keep is None or keep(node))
+
+        if jobs == 1:
+            with lazy_ir(lazy), selecting(selector):
+                for node in nodes:
+                    _handle_toplevel(node, global_namespace,
+                                     decls_only=decls_only)
         else:
-            print(node['kind'])
+            global_namespace.children.extend(
+                child for child in _convert_parallel(
+                    list(nodes), jobs, decls_only, selector)
+                if child is not None)
+        if not lazy:
+            global_namespace = dedup(resolve_types(global_namespace))
+        if cache:
+            ir_cache.put(key, global_namespace, depfile)
+    finally:
+        if depfile is not None:
+            os.remove(depfile)
 
     # print(global_namespace)
     # pxd = write_pxd(global_namespace, filename)
     # print(pxd)
     # print(_get_all_types(global_namespace))
-    return global_namespace
+    return _indexed(global_namespace, index)
+
+
+def cythonator_headers(filenames, extra_include_dirs=None,
+                       clang_exe=None, stream=False,
+                       filter_includes=True, include_roots=None,
+                       decls_only=False, json_backend='auto',
+                       capture='pipe', pch_includes=None, pch_dir=None,
+                       extra_flags=None, index=None, selector=None,
+                       jobs=1):
+    '''Many C/C++ headers -> Cython, using a single clang run.
+
+    All of `filenames` are included by one umbrella translation unit, so
+    whatever they have in common is only parsed and dumped once.  Each
+    declaration is then assigned to the header it is located in.  The
+    remaining arguments are the same as for :func:`cythonator`.  With
+    `jobs`, clang's AST is still split by header by a single process,
+    but the declarations are converted in parallel.
+
+    Returns
+    -------
+    dict
+        Maps headers to their global namespace.  Every header of
+        `filenames` is present (in order), followed by any other header
+        declarations were kept from, keyed by its real path.
+    '''
+
+    if clang_exe is None:
+        clang_exe = default_clang()
+    opts = _clang_opts(extra_include_dirs, extra_flags, decls_only,
+                       pch_includes, clang_exe, pch_dir)
+
+    namespaces = {
+        f: Namespace(id='_global_namespace', name='', children=[])
+        for f in filenames}
+    keep = LocationFilter(filenames, include_roots)
+    by_path = {os.path.realpath(f): f for f in filenames}
+    owners = {}  # file as written in the dump -> key in namespaces
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        umbrella = os.path.join(tmpdir, 'umbrella.hpp')
+        with open(umbrella, 'w') as fp:
+            for f in filenames:
+                fp.write(f'#include "{os.path.abspath(f)}"\n')
+        cmd = [clang_exe, '-Xclang', '-ast-dump=json', '-fsyntax-only'
+               ] + opts + [umbrella]
+
+        nodes = _iter_toplevel(cmd, stream, json_backend, capture)
+        parts = []  # (header, node) to convert with many processes
+        with selecting(selector):
+            for node in nodes:
+                # The filter's tracker sees every node, so it stays in sync
+                for f, part in keep.tracker.split(node):
+                    if f is None or (
+                            filter_includes and not keep.file_allowed(f)):
+                        continue
+                    try:
+                        header = owners[f]
+                    except KeyError:
+                        path = os.path.realpath(f)
+                        header = owners[f] = by_path.get(path, path)
+                    if header not in namespaces:
+                        namespaces[header] = Namespace(
+                            id='_global_namespace', name='', children=[])
+                    if jobs == 1:
+                        _handle_toplevel(part, namespaces[header],
+                                         decls_only=decls_only)
+                    else:
+                        parts.append((header, part))
+
+    if parts:
+        converted = _convert_parallel(
+            [part for _header, part in parts], jobs, decls_only, selector)
+        for (header, _part), child in zip(parts, converted):
+            if child is not None:
+                namespaces[header].children.append(child)
+
+    namespaces = dedup(dict(zip(
+        namespaces, resolve_types(list(namespaces.values())))))
+    for ns in namespaces.values():
+        _indexed(ns, index)
+    return namespaces
+
+
+def cythonator_compdb(filenames, compdb, extra_flags=None, **kwargs):
+    '''Many C/C++ headers -> Cython, using the flags of a build.
+
+    The flags of each header (defines, ``-std``, include directories,
+    ...) are taken from a compilation database (see
+    :func:`cythonator.compdb.find_command`) and headers with the same
+    flags share a single clang run (see :func:`cythonator_headers`).
+
+    Parameters
+    ----------
+    filenames : list of str
+        Headers to parse.
+    compdb : str or dict
+        Path to ``compile_commands.json`` (or the directory containing
+        it) or a database returned by
+        :func:`cythonator.compdb.load_compdb`.
+    extra_flags : list of str, optional
+        Flags passed in addition to the ones from the database.
+    kwargs : dict
+        Passed on to :func:`cythonator_headers`.
+
+    Returns
+    -------
+    dict
+        Same as :func:`cythonator_headers`.
+    '''
+
+    if not isinstance(compdb, dict):
+        compdb = load_compdb(compdb)
+
+    found = {}
+    for flags, headers in group_headers(filenames, compdb).items():
+        found.update(cythonator_headers(
+            headers, extra_flags=list(flags) + list(extra_flags or ()),
+            **kwargs))
+
+    # Requested headers first and in order, like cythonator_headers
+    namespaces = {f: found.pop(f) for f in filenames}
+    namespaces.update(found)
+    return namespaces
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='C++ -> Cython.')
     parser.add_argument(
-        '--header', type=str, help='C++ header file', required=True)
+        '--header', type=str, nargs='+', required=True,
+        help='C++ header file(s); many headers are parsed in one clang run')
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument('--output', type=str, help='PYX file to write')
+    output.add_argument(
+        '--output-dir', type=str,
+        help='Write one PXD module per namespace (or header) and an index '
+             'module into this directory')
     parser.add_argument(
-        '--output', type=str, help='PYX file to write', required=True)
+        '--shard-by', type=str, default='namespace',
+        choices=['namespace', 'header'],
+        help='How to split declarations into modules with --output-dir')
     parser.add_argument(
         '-I', type=str, help='Include directory', required=False)
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='Convert declarations while clang is still writing the AST')
+    parser.add_argument(
+        '--include-root', type=str, action='append', dest='include_roots',
+        help='Also keep declarations from headers below this directory')
+    parser.add_argument(
+        '--keep-included', action='store_true',
+        help='Keep declarations from all included headers')
+    parser.add_argument(
+        '--decls-only', action='store_true',
+        help="Don't parse or dump function bodies")
+    parser.add_argument(
+        '--json-backend', type=str, default='auto',
+        choices=['auto', 'orjson', 'simdjson', 'stdlib'],
+        help='JSON decoder to use when not streaming')
+    parser.add_argument(
+        '--capture', type=str, default='pipe', choices=['pipe', 'file'],
+        help='Read the AST from a pipe or a memory-mapped temporary file')
+    parser.add_argument(
+        '--pch-include', type=str, action='append', dest='pch_includes',
+        help='Precompile this include (e.g. "<vector>") and reuse it')
+    parser.add_argument(
+        '--pch-dir', type=str, help='Where to keep precompiled headers')
+    parser.add_argument(
+        '--native', action='store_true',
+        help='Parse in-process with the bundled clang libraries')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help="Don't reuse or store the IR of previous runs")
+    parser.add_argument(
+        '--cache-dir', type=str, help='Where to keep the IR cache')
+    parser.add_argument(
+        '--compdb', type=str,
+        help='Take flags from this compile_commands.json (or its directory)')
+    parser.add_argument(
+        '--select', type=str, action='append', default=[],
+        help='Only convert declarations matching this glob (or "re:regex")')
+    parser.add_argument(
+        '--exclude', type=str, action='append', default=[],
+        help="Don't convert declarations matching this glob (or 're:regex')")
+    parser.add_argument(
+        '--kind', type=str, action='append', dest='kinds',
+        help='Only convert declarations of this kind (e.g. "class")')
+    parser.add_argument(
+        '--access', type=str, action='append',
+        choices=['public', 'protected', 'private'],
+        help='Convert class members with this access (default: public)')
+    parser.add_argument(
+        '--root', type=str, action='append', dest='roots',
+        help='Only write this declaration (e.g. "mylib::solve") and '
+             'the types it needs')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Convert and write on this many processes (0: one per core)')
     args = parser.parse_args()
-
-    # write to file
-    ns = cythonator(args.header, extra_include_dirs=args.I)
-    with open(args.output, 'wb') as fp:
-        fp.write(write_pxd(ns, args.header).encode())
+    jobs = args.jobs or None
+
+    kwargs = dict(
+        extra_include_dirs=args.I, stream=args.stream,
+        filter_includes=not args.keep_included,
+        include_roots=args.include_roots, decls_only=args.decls_only,
+        json_backend=args.json_backend, capture=args.capture,
+        pch_includes=args.pch_includes, pch_dir=args.pch_dir, jobs=jobs)
+    if args.select or args.exclude or args.kinds or args.access:
+        kwargs['selector'] = Selector(
+            args.select, args.exclude, args.kinds, args.access or ['public'])
+    if args.compdb is not None:
+        if args.native:
+            parser.error('--native does not support --compdb')
+        namespaces = cythonator_compdb(args.header, args.compdb, **kwargs)
+    elif len(args.header) > 1 and args.native:
+        # one session, so files and preambles are shared by the headers
+        session = open_session(Config(**kwargs))
+        namespaces = dedup({h: cythonator(h, session=session)
+                            for h in args.header})
+    elif len(args.header) > 1:
+        namespaces = cythonator_headers(args.header, **kwargs)
+    else:
+        namespaces = {args.header[0]: cythonator(
+            args.header[0], native=args.native, cache=not args.no_cache,
+            cache_dir=args.cache_dir, **kwargs)}
+
+    if args.roots:
+        namespaces = shake(namespaces, args.roots)
+    # only what changed since the last run is written
+    if args.output_dir is not None:
+        write_shards(namespaces, args.output_dir, by=args.shard_by, jobs=jobs)
+    else:
+        update_pxd(namespaces, args.output, jobs=jobs)
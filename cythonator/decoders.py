@@ -0,0 +1,111 @@
+'''JSON decoder backends for clang's AST dump.'''
+
+import json
+import mmap
+from cythonator.diagnostics import report
+
+
+def _stdlib():
+    def loads(data):
+        if isinstance(data, (str, bytes, bytearray)):
+            return json.loads(data)
+        # json can't read from buffers (e.g., mmaps), so the buffer is
+        # decoded into a str: a full copy, unlike with the other backends.
+        # Going through a view at least skips copying it to bytes first.
+        with memoryview(data) as view:
+            return json.loads(str(view, 'utf-8'))
+    return loads
+
+
+def _orjson():
+    import orjson
+
+    def loads(data):
+        if isinstance(data, mmap.mmap):
+            # Release the view right away so the map can be closed
+            with memoryview(data) as view:
+                return orjson.loads(view)
+        return orjson.loads(data)
+    return loads
+
+
+def _simdjson():
+    import simdjson
+
+    def loads(data):
+        # Parsers reuse their internal buffers, so don't share them
+        parser = simdjson.Parser()
+        if isinstance(data, mmap.mmap):
+            with memoryview(data) as view:
+                return parser.parse(view, recursive=True)
+        return parser.parse(data, recursive=True)
+    return loads
+
+
+# In order of preference for "auto"
+BACKENDS = {
+    'orjson': _orjson,
+    'simdjson': _simdjson,
+    'stdlib': _stdlib,
+}
+
+
+def available_backends():
+    '''Names of the backends that can be used in this environment.'''
+    names = []
+    for name, factory in BACKENDS.items():
+        try:
+            factory()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_decoder(backend='auto'):
+    '''Return a function that decodes a bytes-like JSON document.
+
+    Parameters
+    ----------
+    backend : str, optional
+        One of "auto", "orjson", "simdjson" or "stdlib".  "auto" picks
+        the fastest backend that is installed.  If a specific backend
+        is requested but not installed, a warning is issued and the
+        stdlib decoder is used instead.
+
+    Notes
+    -----
+    All backends accept bytes, bytearray, memoryview and mmap objects.
+    Only orjson and simdjson decode buffers in place; the stdlib backend
+    copies them into a str first.
+    '''
+
+    if backend == 'auto':
+        for factory in BACKENDS.values():
+            try:
+                return factory()
+            except ImportError:
+                pass
+    if backend not in BACKENDS:
+        raise ValueError(
+            f'Unknown JSON backend "{backend}"! Choose from '
+            f'{["auto"] + list(BACKENDS)}.')
+    try:
+        return BACKENDS[backend]()
+    except ImportError:
+        report('warning', f'JSON backend "{backend}" is not installed, '
+               'falling back to "stdlib".')
+        return _stdlib()
+
+
+def load_file(fp, loads):
+    '''Decode the JSON document in the open binary file `fp` via mmap.
+
+    The file isn't read into memory, unless `loads` is the stdlib
+    decoder, which copies it (see :func:`get_decoder`).
+    '''
+    fp.seek(0, 2)
+    if not fp.tell():
+        return loads(b'')
+    with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return loads(mm)
@@ -0,0 +1,139 @@
+'''Merge redeclarations so every declaration is only written once.'''
+
+
+def _kind(node):
+    return node.__class__.__name__
+
+
+def _canonical(t):
+    return t if t.canonical is None else t.canonical
+
+
+def signature(func):
+    '''Key of a function: equal for redeclarations of the same overload.
+
+    Parameter names don't matter and typedefs are resolved, so
+    ``void f(myInt x)`` and ``void f(int)`` are the same.
+    '''
+    return (
+        func.name,
+        _canonical(func.return_type),
+        tuple(_canonical(p.type) for p in func.params),
+        tuple((t.name, t.is_parameter_pack) for t in func.templateparams),
+    )
+
+
+def _key(node):
+    kind = _kind(node)
+    if kind == 'Function':
+        return (kind, signature(node))
+    if kind == 'Method':
+        return (kind, node.is_ctor, signature(node.function))
+    if kind == 'Class':
+        return (kind, node.name)
+    if kind == 'Typedef':
+        return (kind, node.name)
+    # namespaces are reopened, not redeclared
+    return None
+
+
+def _completeness(node):
+    '''How much of a class a declaration has (forward ones have nothing).'''
+    if _kind(node) != 'Class':
+        return 0
+    return (bool(node.methods or node.fields or node.typedefs
+                 or node.children or node.bases) * 2
+            + bool(node.templateparams))
+
+
+class _Scopes:
+    '''Declarations seen so far, by scope and key.'''
+
+    def __init__(self):
+        # (scope, key) -> (list holding the first declaration, its index)
+        self.first = {}
+        # (scope, name) of function templates
+        self.templates = set()
+
+
+def _dedup_list(nodes, scope, seen):
+    res = []
+    for node in nodes:
+        kind = _kind(node)
+        if kind == 'Namespace':
+            res.append(_dedup_namespace(node, seen))
+            continue
+        if kind == 'Function':
+            if node.templateparams:
+                seen.templates.add((scope, node.name))
+            elif (node.is_specialization
+                  and (scope, node.name) in seen.templates):
+                # the template covers it
+                continue
+        key = _key(node)
+        if key is None:
+            res.append(node)
+            continue
+        if kind == 'Class':
+            node = _dedup_class(
+                node, f'{scope}::{node.name}' if scope else node.name, seen)
+
+        try:
+            lst, idx = seen.first[scope, key]
+        except KeyError:
+            seen.first[scope, key] = (res, len(res))
+            res.append(node)
+            continue
+        # a definition replaces a forward declaration where that was
+        if _completeness(node) > _completeness(lst[idx]):
+            lst[idx] = node
+    return res
+
+
+def _dedup_class(cls, scope, seen):
+    return cls._replace(
+        methods=_dedup_list(cls.methods, scope, seen),
+        typedefs=_dedup_list(cls.typedefs, scope, seen),
+        children=_dedup_list(cls.children, scope, seen),
+    )
+
+
+def _dedup_namespace(namespace, seen):
+    # nested namespace names are fully qualified
+    return namespace._replace(
+        children=_dedup_list(namespace.children, namespace.name, seen))
+
+
+def dedup(namespaces):
+    '''Copy of the IR with every declaration only once.
+
+    Parameters
+    ----------
+    namespaces : Namespace or dict
+        Global namespace, or a dict of them (e.g., by header).  A
+        declaration repeated in another header is dropped from there.
+
+    Returns
+    -------
+    Namespace or dict
+        Same as `namespaces`, but with redeclarations merged: functions
+        (and methods) with the same :func:`signature`, classes and
+        typedefs with the same name in the same scope.  The first
+        declaration is kept where it is, since Cython needs types to be
+        declared before they are used, but the most complete one is
+        kept, e.g., the definition of a forward declared class.
+        Explicit specializations of function templates are dropped as
+        well, since the template declares them already.
+
+    Notes
+    -----
+    This is a single pass over the IR: declarations are looked up by a
+    hash of their key, so it takes linear time however many overloads
+    there are.
+    '''
+
+    single = not isinstance(namespaces, dict)
+    items = {None: namespaces} if single else namespaces
+    seen = _Scopes()
+    res = {key: _dedup_namespace(ns, seen) for key, ns in items.items()}
+    return res[None] if single else res
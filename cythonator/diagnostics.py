@@ -0,0 +1,49 @@
+'''Report problems found while converting, without printing them.'''
+
+import contextlib
+import contextvars
+from collections import namedtuple
+from warnings import warn
+
+# severity is "warning" (something is left out or changed) or "note"
+# (something isn't handled); id is that of the declaration, if known
+Diagnostic = namedtuple('Diagnostic', 'severity message id')
+
+# List diagnostics are collected in; see collecting()
+_collected = contextvars.ContextVar('cythonator_diagnostics', default=None)
+
+
+def report(severity, message, id=None):
+    '''Report a problem with the declaration `id`.
+
+    Inside of :func:`collecting` the diagnostic is added to the list
+    being collected.  Otherwise warnings are issued with
+    :func:`warnings.warn` and notes are printed.
+    '''
+    diagnostics = _collected.get()
+    if diagnostics is not None:
+        diagnostics.append(Diagnostic(severity, message, id))
+    elif severity == 'warning':
+        warn(message, stacklevel=3)
+    else:
+        print(message)
+
+
+def report_all(diagnostics):
+    '''Report diagnostics again, e.g., ones collected by another process.'''
+    for d in diagnostics:
+        report(*d)
+
+
+@contextlib.contextmanager
+def collecting():
+    '''Collect the diagnostics reported in this context into a list.
+
+    Every thread (and :mod:`contextvars` context) collects its own.
+    '''
+    diagnostics = []
+    token = _collected.set(diagnostics)
+    try:
+        yield diagnostics
+    finally:
+        _collected.reset(token)
@@ -0,0 +1,163 @@
+'''Look up declarations of the IR by id and by qualified name.'''
+
+import itertools
+import re
+
+from cythonator.qualtype import Type
+
+# Leading tag keyword of a base class
+_TAG = re.compile(r'^(?:struct|class|union)\s+')
+
+
+def _type_names(t, names):
+    '''Add the names of `t`, its template arguments and canonical type.'''
+    names.add(t.name)
+    for a in t.template_args:
+        _type_names(a, names)
+    if t.canonical is not None:
+        _type_names(t.canonical, names)
+    return names
+
+
+def _types_of(obj, names):
+    '''Add the names of all types in `obj`, a (nested) tuple or list.'''
+    if isinstance(obj, Type):
+        _type_names(obj, names)
+    elif isinstance(obj, (list, tuple)):
+        for val in obj:
+            _types_of(val, names)
+    return names
+
+
+class DeclIndex:
+    '''Index of the declarations of one or more global namespaces.
+
+    Attributes
+    ----------
+    by_id : dict
+        Maps clang ids to IR nodes.
+    by_name : dict
+        Maps fully qualified names (e.g., ``'ns::C::f'``) to the list of
+        nodes declared with that name (overloads, reopened namespaces).
+    users : dict
+        Maps type names to the ids of the declarations using them.
+    '''
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_name = {}
+        self.users = {}
+        self._uses = {}  # id -> frozenset of type names
+        self._scopes = {}  # id -> qualified name of the enclosing scope
+
+    def add(self, namespace):
+        '''Index the declarations of a global namespace (or any node).'''
+        self._add(namespace, '')
+        return self
+
+    def _add(self, node, scope):
+        kind = node.__class__.__name__
+        if kind == 'Method':
+            node = node.function
+            kind = 'Function'
+
+        if kind == 'Namespace':
+            # Nested namespace names are not fully qualified
+            name = node.name.split('::')[-1]
+        else:
+            name = node.name
+        qualname = f'{scope}::{name}' if scope and name else (name or scope)
+
+        names = set()
+        if kind in ('Field', 'Typedef'):
+            _type_names(node.type, names)
+        elif kind == 'Function':
+            _types_of(
+                (node.return_type, node.params, node.templateparams), names)
+        elif kind == 'Class':
+            _types_of(node.templateparams, names)
+            for item in itertools.chain(
+                    node.typedefs, node.fields, node.methods):
+                names |= self._add(item, qualname)
+        for child in getattr(node, 'children', ()):
+            names |= self._add(child, qualname)
+
+        if node.id is not None:
+            self.by_id[node.id] = node
+            self._uses[node.id] = frozenset(names)
+            self._scopes[node.id] = scope
+            for n in names:
+                self.users.setdefault(n, set()).add(node.id)
+        if name:
+            self.by_name.setdefault(qualname, []).append(node)
+        return names
+
+    def lookup(self, qualname):
+        '''All declarations named `qualname` (empty list if there are none).'''
+        return self.by_name.get(qualname.lstrip(':'), [])
+
+    def types_used(self, node):
+        '''Names of all types used by a declaration (given by node or id).
+
+        Classes and namespaces include the types used by their members.
+        '''
+        if not isinstance(node, str):
+            node = node.function.id if hasattr(node, 'function') else node.id
+        return self._uses.get(node, frozenset())
+
+    def used_by(self, type_name):
+        '''Ids of all declarations using the type named `type_name`.'''
+        return self.users.get(type_name, set())
+
+    def resolve(self, name, scope=''):
+        '''Find what `name` refers to when used in `scope`.
+
+        Like C++ name lookup, enclosing scopes are searched from the
+        innermost outwards.
+        '''
+        if name.startswith('::'):
+            return self.lookup(name)
+        while True:
+            found = self.lookup(f'{scope}::{name}' if scope else name)
+            if found or not scope:
+                return found
+            scope = scope.rpartition('::')[0]
+
+    def scope_of(self, node):
+        '''Qualified name of the scope a declaration (or id) is in.'''
+        if not isinstance(node, str):
+            node = node.function.id if hasattr(node, 'function') else node.id
+        return self._scopes.get(node, '')
+
+    def qualname(self, node):
+        '''Fully qualified name of a declaration.'''
+        if hasattr(node, 'function'):
+            node = node.function
+        if node.__class__.__name__ == 'Namespace':
+            # already qualified
+            return node.name
+        scope = self.scope_of(node)
+        return f'{scope}::{node.name}' if scope else node.name
+
+    def resolve_type(self, name, scope=''):
+        '''Classes and typedefs the type named `name` refers to in `scope`.'''
+        name = _TAG.sub('', name.strip())
+        # Base<T> is declared as Base
+        name = name.split('<')[0].strip()
+        return [decl for decl in self.resolve(name, scope)
+                if decl.__class__.__name__ in ('Class', 'Typedef')]
+
+    def resolve_base(self, cls, base):
+        '''Class declaration of base `base` (a string of `cls.bases`).
+
+        Returns None for bases that are not in the index, e.g., from
+        headers that were filtered out.
+        '''
+        for decl in self.resolve_type(base, self.qualname(cls)):
+            if decl.__class__.__name__ == 'Class':
+                return decl
+        return None
+
+    def bases(self, cls):
+        '''Class declarations of all bases of `cls` (None if unknown).'''
+        return [self.resolve_base(cls, b) for b in cls.bases]
@@ -0,0 +1,121 @@
+'''Build the IR of namespaces and classes only when it is needed.'''
+
+import contextlib
+import contextvars
+from collections.abc import Sequence
+
+# Whether handlers should build lazy lists; see lazy_ir()
+_lazy = contextvars.ContextVar('cythonator_lazy', default=False)
+
+
+def is_lazy():
+    '''Whether the IR being built right now should be lazy.'''
+    return _lazy.get()
+
+
+@contextlib.contextmanager
+def lazy_ir(enable=True):
+    '''Build lazy IR inside this context if `enable`.'''
+    token = _lazy.set(enable)
+    try:
+        yield
+    finally:
+        _lazy.reset(token)
+
+
+class LazyList(Sequence):
+    '''Read-only list of IR nodes that are only built when needed.
+
+    Parameters
+    ----------
+    raw : list
+        What the nodes are built from, e.g., clang's JSON AST nodes.
+    build : callable
+        Builds the IR node of an item of `raw`, or returns None to leave
+        the item out.
+    names : list of str, optional
+        Name of each item of `raw`, for :meth:`get`.
+
+    Notes
+    -----
+    Items are built (once) when the list is first indexed, iterated over
+    or measured, after which the raw nodes are dropped.  :meth:`get`
+    only builds the items of a given name.  Items are built in the
+    context (see :mod:`contextvars`) the list was created in, so nested
+    lists are built lazily as well.  A LazyList compares equal to a list
+    with the same items and pickles as a list.
+    '''
+    __slots__ = ('_raw', '_build', '_names', '_built', '_items', '_context')
+
+    def __init__(self, raw, build, names=None):
+        self._raw = list(raw)
+        self._build = build
+        self._names = names
+        self._built = {}
+        self._items = None
+        self._context = contextvars.copy_context()
+
+    @classmethod
+    def deferred(cls, fun):
+        '''List returned by `fun()` when it is first needed.'''
+        lst = cls([], fun)
+        # nothing is built item by item
+        lst._built = None
+        return lst
+
+    def _build_item(self, ii):
+        try:
+            return self._built[ii]
+        except KeyError:
+            pass
+        item = self._context.run(self._build, self._raw[ii])
+        self._built[ii] = item
+        return item
+
+    def _list(self):
+        if self._items is None:
+            if self._built is None:
+                items = list(self._context.run(self._build))
+            else:
+                items = [self._build_item(ii) for ii in range(len(self._raw))]
+                items = [item for item in items if item is not None]
+            self._items = items
+            self._raw = self._build = self._built = self._context = None
+        return self._items
+
+    def get(self, name):
+        '''Items called `name` (by the name given for the raw items).'''
+        if self._items is not None or self._names is None:
+            return [x for x in self._list()
+                    if getattr(x, 'name', None) == name]
+        items = [self._build_item(ii)
+                 for ii, n in enumerate(self._names) if n == name]
+        return [item for item in items if item is not None]
+
+    @property
+    def is_built(self):
+        return self._items is not None
+
+    def __getitem__(self, idx):
+        return self._list()[idx]
+
+    def __len__(self):
+        return len(self._list())
+
+    def __iter__(self):
+        return iter(self._list())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyList)):
+            return self._list() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        if self._items is None:
+            return f'<LazyList of {len(self._raw)} unbuilt items>'
+        return repr(self._items)
+
+    def __reduce__(self):
+        return (list, (self._list(),))
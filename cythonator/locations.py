@@ -0,0 +1,122 @@
+'''Figure out where the nodes of clang's JSON AST dump come from.'''
+
+import os
+
+
+def _last_file(obj):
+    '''Last "file" written anywhere inside `obj`, in dump order.'''
+
+    # Search backwards so we can stop at the first hit
+    if isinstance(obj, dict):
+        for key in reversed(list(obj)):
+            # includedFrom doesn't change the current file
+            if key == 'includedFrom':
+                continue
+            val = obj[key]
+            if key == 'file':
+                return val
+            if isinstance(val, (dict, list)):
+                f = _last_file(val)
+                if f is not None:
+                    return f
+    elif isinstance(obj, list):
+        for val in reversed(obj):
+            if isinstance(val, (dict, list)):
+                f = _last_file(val)
+                if f is not None:
+                    return f
+    return None
+
+
+class LocationTracker:
+    '''Follow the current file through a JSON AST dump.
+
+    Notes
+    -----
+    Clang only writes the "file" of a source location when it differs
+    from the one written before it, so the file of a node depends on
+    every node dumped before it.  All nodes must be passed to
+    :meth:`locate` in dump order, including the ones that end up being
+    thrown away.
+    '''
+
+    def __init__(self):
+        self.current_file = None
+
+    def locate(self, node):
+        '''Return the file `node` is declared in (None if it has none).'''
+
+        loc = node.get('loc', {})
+        f = _last_file(loc)
+        if f is not None:
+            self.current_file = f
+        # builtins and implicit declarations have an empty location
+        decl_file = self.current_file if loc else None
+
+        # Skip ahead to the last location mentioned by the node
+        for key in reversed(list(node)):
+            if key == 'loc':
+                break
+            f = _last_file(node[key])
+            if f is not None:
+                self.current_file = f
+                break
+        return decl_file
+
+    def split(self, node):
+        '''Split `node` into the parts declared in each file.
+
+        Returns a list of ``(file, node)`` pairs.  Namespaces can be
+        (re)opened in many files, so they are split into copies that only
+        hold the children declared in one file.
+        '''
+
+        if node.get('kind') != 'NamespaceDecl' or not node.get('inner'):
+            return [(self.locate(node), node)]
+
+        # "inner" is dumped last, so the namespace itself comes first
+        shallow = {k: v for k, v in node.items() if k != 'inner'}
+        ns_file = self.locate(shallow)
+        parts = {}
+        for child in node['inner']:
+            for f, n in self.split(child):
+                parts.setdefault(f, []).append(n)
+        if list(parts) == [None]:
+            return [(ns_file, node)]
+        return [(f, {**shallow, 'inner': inner})
+                for f, inner in parts.items() if f is not None]
+
+
+class LocationFilter:
+    '''Keep only nodes declared in `headers` or under `include_roots`.
+
+    Parameters
+    ----------
+    headers : list of str
+        Headers whose declarations should be kept.
+    include_roots : list of str, optional
+        Directories whose headers' declarations should also be kept.
+    '''
+
+    def __init__(self, headers, include_roots=None):
+        self.headers = {os.path.realpath(h) for h in headers}
+        self.include_roots = tuple(
+            os.path.join(os.path.realpath(r), '')
+            for r in (include_roots or ()))
+        self.tracker = LocationTracker()
+        self._keep = {}
+
+    def file_allowed(self, filename):
+        '''Whether declarations from `filename` should be kept.'''
+        if filename is None:
+            return False
+        try:
+            return self._keep[filename]
+        except KeyError:
+            path = os.path.realpath(filename)
+            keep = path in self.headers or path.startswith(self.include_roots)
+            self._keep[filename] = keep
+            return keep
+
+    def __call__(self, node):
+        return self.file_allowed(self.tracker.locate(node))
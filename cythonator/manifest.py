@@ -0,0 +1,227 @@
+'''Only rewrite what changed since the last run.'''
+
+import filecmp
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import uuid
+from collections.abc import Sequence
+
+from cythonator.diagnostics import report
+from cythonator.qualtype import Type
+from cythonator.write_cython import iter_decls, iter_pxd_headers
+
+# Bumped whenever the layout of the manifest changes
+MANIFEST_VERSION = 1
+
+# Number of changed declarations named by Manifest.report_changes()
+_SHOWN = 10
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _type_key(t):
+    # types are interned and hold no ids, so their repr is stable
+    return repr(t)
+
+
+def _key(obj):
+    '''Stable representation of an IR node, leaving out clang's ids.'''
+    if isinstance(obj, Type):
+        return _type_key(obj)
+    if isinstance(obj, tuple) and hasattr(obj, '_fields'):
+        # ids are addresses, they differ between runs
+        return (obj.__class__.__name__,) + tuple(
+            _key(val) for field, val in zip(obj._fields, obj)
+            if field != 'id')
+    if isinstance(obj, Sequence) and not isinstance(obj, str):
+        # lists and lazy lists
+        return tuple(_key(val) for val in obj)
+    return obj
+
+
+def fingerprint(node):
+    '''Fingerprint of a declaration, the same as long as its IR is.
+
+    Everything but the ids clang gives declarations goes into it, so a
+    header can change (e.g., in comments or function bodies) without
+    changing the fingerprints of its declarations.
+    '''
+    return hashlib.sha256(repr(_key(node)).encode()).hexdigest()[:24]
+
+
+@functools.lru_cache(maxsize=None)
+def writer_fingerprint():
+    '''Fingerprint of the code writing PXD files.
+
+    Output written by a different version of cythonator is rewritten even
+    if the IR didn't change.
+    '''
+    h = hashlib.sha256()
+    here = pathlib.Path(__file__).parent
+    for name in ['write_cython.py', 'shards.py', 'manifest.py']:
+        h.update((here / name).read_bytes())
+    return h.hexdigest()[:24]
+
+
+def fingerprint_headers(namespaces, extra=()):
+    '''Fingerprints of a file of declarations of many headers.
+
+    Parameters
+    ----------
+    namespaces : dict
+        Maps headers to their global namespace.
+    extra : tuple, optional
+        Anything else the file depends on (e.g., cimports).
+
+    Returns
+    -------
+    fingerprint : str
+        Fingerprint of the whole file.
+    decls : dict
+        Maps the qualified names of the declarations to their
+        fingerprints (a list of them for overloads).
+    '''
+    h = hashlib.sha256(repr((writer_fingerprint(), extra)).encode())
+    decls = {}
+    for header, global_ns in namespaces.items():
+        # the resolved path is what goes into the extern blocks
+        h.update(str(pathlib.Path(header).resolve()).encode() + b'\0')
+        for ns, decl in iter_decls(global_ns):
+            fp = fingerprint(decl)
+            h.update(f'{ns.name}\0{fp}\0'.encode())
+            qualname = f'{ns.name}::{decl.name}' if ns.name else decl.name
+            decls.setdefault(qualname, []).append(fp)
+    return h.hexdigest()[:24], decls
+
+
+class Manifest:
+    '''Fingerprints of the files written to a directory by the last run.
+
+    Parameters
+    ----------
+    path : str
+        The manifest, a JSON file.  It is fine if it doesn't exist (yet).
+
+    Notes
+    -----
+    A manifest that can't be read (e.g., it is from an incompatible
+    version) is ignored, and everything is written again.
+    '''
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.files = {}  # recorded in this run
+        self._old = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as fp:
+                data = json.load(fp)
+            if data['version'] == MANIFEST_VERSION:
+                self._old = data['files']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def unchanged(self, name, fingerprint):
+        '''Whether `name` was last written with `fingerprint` and exists.'''
+        entry = self._old.get(name)
+        return (entry is not None and entry['fingerprint'] == fingerprint
+                and (self.path.parent / name).exists())
+
+    def changed_decls(self, name, decls):
+        '''Qualified names of the declarations new or changed in `name`.'''
+        old = self._old.get(name, {}).get('decls', {})
+        return sorted(q for q, fps in decls.items() if old.get(q) != fps)
+
+    def report_changes(self, name, decls):
+        '''Report which declarations of `name` changed as a note.
+
+        Nothing is reported for files the last run didn't write, since
+        everything in them is new.
+        '''
+        if name not in self._old:
+            return
+        changed = self.changed_decls(name, decls)
+        if changed:
+            shown = ', '.join(changed[:_SHOWN])
+            if len(changed) > _SHOWN:
+                shown += f', ... ({len(changed) - _SHOWN} more)'
+            report('note', f'{name}: changed {shown}')
+
+    def record(self, name, fingerprint, decls=None):
+        '''Remember what file `name` was written from.'''
+        self.files[name] = {'fingerprint': fingerprint, 'decls': decls or {}}
+
+    def stale(self):
+        '''Files of the last run that weren't recorded in this one.'''
+        return [name for name in self._old if name not in self.files]
+
+    def save(self):
+        '''Write the manifest (only if it changed).'''
+        text = json.dumps({'version': MANIFEST_VERSION, 'files': self.files},
+                          indent=1, sort_keys=True)
+        write_if_changed(self.path, [text + '\n'])
+
+
+def write_if_changed(path, lines):
+    '''Write `lines` to `path` unless it already holds exactly that.
+
+    The lines are written to a temporary file next to `path` first, so
+    big files are compared without keeping them in memory.  An identical
+    file is left alone (along with its mtime), otherwise it is replaced
+    atomically.
+
+    Returns
+    -------
+    bool
+        Whether `path` was written.
+    '''
+
+    path = pathlib.Path(path)
+    # not mkstemp: the file gets the usual permissions
+    tmp = path.with_name(f'.{path.name}.{uuid.uuid4().hex}.tmp')
+    try:
+        with open(tmp, 'x', encoding='utf-8', newline='') as fp:
+            fp.writelines(lines)
+        if path.exists() and filecmp.cmp(tmp, path, shallow=False):
+            return False
+        os.replace(tmp, path)
+        return True
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def manifest_path(output):
+    '''Where the manifest of a single output file is kept.'''
+    output = pathlib.Path(output)
+    return output.with_name(output.name + '.manifest.json')
+
+
+def update_pxd(namespaces, output, jobs=1):
+    '''Write the PXD file of many headers unless it is up to date.
+
+    Like :func:`cythonator.write_cython.emit_pxd` to a file, but with a
+    manifest (see :func:`manifest_path`) of the fingerprints of the
+    declarations written.  If none changed, nothing is written at all;
+    if the new PXD is the same as the old one anyway, the file is left
+    alone.  Either way its mtime stays the same, so nothing downstream
+    needs to be rebuilt.  The declarations that changed are reported as
+    a note (see :meth:`Manifest.report_changes`).
+
+    Returns
+    -------
+    bool
+        Whether `output` was written.
+    '''
+
+    output = pathlib.Path(output)
+    manifest = Manifest(manifest_path(output))
+    fp, decls = fingerprint_headers(namespaces)
+    if manifest.unchanged(output.name, fp):
+        return False
+    manifest.report_changes(output.name, decls)
+    written = write_if_changed(output, iter_pxd_headers(namespaces, jobs))
+    manifest.record(output.name, fp, decls)
+    manifest.save()
+    return written
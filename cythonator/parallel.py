@@ -0,0 +1,191 @@
+'''Convert and write big translation units on many cores.'''
+
+import multiprocessing
+import os
+import threading
+
+# Items of map_shards(), inherited by forked workers so they don't have
+# to be pickled.  Only set while a pool is forked, under the lock.
+_items = None
+_fork_lock = threading.Lock()
+
+
+def default_jobs():
+    '''Number of processes to use by default: one per core.'''
+    return os.cpu_count() or 1
+
+
+def start_method():
+    '''How to start worker processes from the current thread.
+
+    Forking copies only the calling thread, so locks held by other
+    threads (e.g., of logging or the allocator) would stay locked in the
+    children.  Only fork while the process has a single thread.
+    '''
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods and threading.active_count() == 1:
+        return 'fork'
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+def shard_size(count, jobs):
+    '''Number of items per shard, so every process gets a few shards.'''
+    return max(1, -(-count // (jobs * 4)))
+
+
+def count_decls(node):
+    '''Number of declarations in a node of clang's AST.
+
+    Namespaces count their members (at any depth), everything else
+    counts as one.
+    '''
+    if node.get('kind') != 'NamespaceDecl':
+        return 1
+    return sum(count_decls(child) for child in node.get('inner', ()))
+
+
+def split_namespace(node, size):
+    '''Split a NamespaceDecl of clang's AST into pieces of `size` decls.
+
+    The pieces are copies of the namespace holding consecutive parts of
+    its members, as if it had been reopened.  Nested namespaces too big
+    for a piece are split the same way, so a header with everything in
+    ``mylib::core`` is split just as well as one with everything in
+    ``mylib``.  Pieces keep the ids of the namespaces they are copies
+    of, so :func:`merge_pieces` can put them back together.  Other
+    nodes are returned as they are.
+    '''
+    if node.get('kind') != 'NamespaceDecl' or count_decls(node) <= size:
+        return [node]
+    pieces, part, count = [], [], 0
+    for child in node.get('inner', ()):
+        n = count_decls(child)
+        if n > size and child.get('kind') == 'NamespaceDecl':
+            if part:
+                pieces.append({**node, 'inner': part})
+                part, count = [], 0
+            pieces.extend({**node, 'inner': [piece]}
+                          for piece in split_namespace(child, size))
+            continue
+        if part and count + n > size:
+            pieces.append({**node, 'inner': part})
+            part, count = [], 0
+        part.append(child)
+        count += n
+    if part:
+        pieces.append({**node, 'inner': part})
+    return pieces
+
+
+def _is_namespace(node):
+    return node.__class__.__name__ == 'Namespace'
+
+
+def merge_pieces(children):
+    '''Merge the IR of consecutive pieces of the same namespace.
+
+    Pieces of nested namespaces are merged as well.
+    '''
+    groups = []
+    for child in children:
+        if (groups and _is_namespace(child) and _is_namespace(groups[-1][0])
+                and groups[-1][0].id == child.id):
+            groups[-1].append(child)
+        else:
+            groups.append([child])
+    res = []
+    for group in groups:
+        if len(group) == 1:
+            res.append(group[0])
+        else:
+            res.append(group[0]._replace(children=merge_pieces(
+                [c for piece in group for c in piece.children])))
+    return res
+
+
+def _run_shard(task):
+    fn, lo, hi, shard, args = task
+    if shard is None:
+        shard = _items[lo:hi]
+    return fn(shard, *args)
+
+
+def map_shards(fn, items, jobs=None, size=None, args=(), initializer=None,
+               initargs=()):
+    '''Call ``fn(shard, *args)`` for consecutive shards of `items`.
+
+    Parameters
+    ----------
+    fn : callable
+        Module-level function returning a list for a list of items.
+    items : list
+        What to work on.
+    jobs : int, optional
+        Number of processes.  One per core by default.
+    size : int, optional
+        Number of items per shard (see :func:`shard_size` for the
+        default).
+    args : tuple, optional
+        More arguments of `fn`.  They must be picklable.
+    initializer : callable, optional
+        Called as ``initializer(*initargs)`` by every worker process
+        before it works on any shard, e.g., to set up state of the
+        parent that isn't there after importing a module again.
+    initargs : tuple, optional
+        Arguments of `initializer`.  They must be picklable.
+
+    Returns
+    -------
+    list
+        Concatenation of the results of all shards, in order.
+
+    Notes
+    -----
+    Where processes are forked, they inherit `items` instead of getting
+    a pickled copy of every shard.  Only the results are pickled.  Many
+    threads can map shards at the same time, but while other threads
+    run, workers are started by a fork server (or spawned) instead, see
+    :func:`start_method`.  `fn` and the items must then be picklable,
+    and workers only have what importing the modules sets up, plus
+    what `initializer` does.
+    '''
+    return list(iter_shards(fn, items, jobs, size, args, initializer,
+                            initargs))
+
+
+def iter_shards(fn, items, jobs=None, size=None, args=(), initializer=None,
+                initargs=()):
+    '''Like :func:`map_shards`, but yield results as shards are done.
+
+    Results are still yielded in order, so the results of the first
+    shards can be used while later ones are being worked on.
+    '''
+    global _items
+
+    if jobs is None:
+        jobs = default_jobs()
+    if size is None:
+        size = shard_size(len(items), jobs)
+    bounds = [(lo, min(lo + size, len(items)))
+              for lo in range(0, len(items), size)]
+    if jobs == 1 or len(bounds) <= 1:
+        for lo, hi in bounds:
+            yield from fn(items[lo:hi], *args)
+        return
+
+    method = start_method()
+    forked = method == 'fork'
+    ctx = multiprocessing.get_context(method)
+    with _fork_lock:
+        # workers are forked when the pool is created
+        if forked:
+            _items = items
+        try:
+            pool = ctx.Pool(min(jobs, len(bounds)), initializer, initargs)
+        finally:
+            _items = None
+    with pool:
+        for res in pool.imap(_run_shard, [
+                (fn, lo, hi, None if forked else items[lo:hi], args)
+                for lo, hi in bounds]):
+            yield from res
@@ -0,0 +1,120 @@
+'''Build and reuse precompiled headers for commonly included headers.'''
+
+import hashlib
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+import tempfile
+
+from cythonator.manifest import write_if_changed
+
+
+def default_cache_dir():
+    '''Directory cythonator keeps its build artifacts in.'''
+    root = os.environ.get('XDG_CACHE_HOME', pathlib.Path.home() / '.cache')
+    return pathlib.Path(root) / 'cythonator'
+
+
+def _include_line(include):
+    # <vector> stays a system include, anything else is a path
+    if include.startswith('<'):
+        return f'#include {include}\n'
+    return f'#include "{pathlib.Path(include).resolve()}"\n'
+
+
+def _clang_fingerprint(clang_exe):
+    exe = shutil.which(clang_exe) or clang_exe
+    try:
+        st = os.stat(exe)
+    except OSError:
+        return exe
+    return f'{os.path.realpath(exe)}:{st.st_size}:{st.st_mtime_ns}'
+
+
+def _read_depfile(path):
+    '''Files listed as prerequisites in a make-style dependency file.'''
+    with open(path, 'r') as fp:
+        contents = fp.read().replace('\\\n', ' ')
+    # Everything after the target; spaces in paths are escaped
+    _target, deps = contents.split(': ', 1)
+    return [d.replace('\\ ', ' ') for d in re.findall(r'(?:\\ |\S)+', deps)]
+
+
+def _is_fresh(pch, depfile):
+    try:
+        built = os.stat(pch).st_mtime_ns
+        deps = _read_depfile(depfile)
+    except (OSError, ValueError):
+        return False
+    for dep in deps:
+        try:
+            if os.stat(dep).st_mtime_ns > built:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def build_pch(includes, flags=(), clang_exe='clang++-10', cache_dir=None):
+    '''Return the path of a PCH containing `includes`, building it if needed.
+
+    Parameters
+    ----------
+    includes : list of str
+        Headers to precompile, either system includes such as
+        ``'<vector>'`` or paths to header files.
+    flags : list of str, optional
+        Compiler flags the PCH will be used with.  A PCH is only valid
+        for the flags it was built with, so these must match the flags
+        of the AST dump invocation.
+    clang_exe : str, optional
+        Clang executable.
+    cache_dir : str, optional
+        Where to keep PCHs.  Defaults to ``$XDG_CACHE_HOME/cythonator``.
+
+    Notes
+    -----
+    PCHs are keyed on the includes, the flags and the clang binary.  A
+    cached PCH is rebuilt when any file it depends on (according to
+    clang's dependency output) is newer than it.
+    '''
+
+    prefix = ''.join(_include_line(i) for i in includes)
+    key = hashlib.sha256('\0'.join(
+        [_clang_fingerprint(clang_exe), prefix] + list(flags)
+    ).encode()).hexdigest()[:24]
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    pch_dir = pathlib.Path(cache_dir) / 'pch' / key
+    pch = pch_dir / 'prefix.hpp.pch'
+    depfile = pch_dir / 'prefix.hpp.d'
+    if _is_fresh(pch, depfile):
+        return str(pch)
+
+    pch_dir.mkdir(parents=True, exist_ok=True)
+    header = pch_dir / 'prefix.hpp'
+    # the key covers the prefix, so concurrent runs write the same one
+    write_if_changed(header, [prefix])
+
+    # Build next to the final locations and move into place so
+    # concurrent runs never see a half-written PCH or depfile
+    fd, tmp = tempfile.mkstemp(dir=pch_dir, suffix='.pch')
+    os.close(fd)
+    tmp_depfile = tmp + '.d'
+    try:
+        subprocess.run(
+            [clang_exe, '-x', 'c++-header', str(header), '-o', tmp,
+             '-MD', '-MF', tmp_depfile] + list(flags),
+            check=True)
+        # The depfile first: should the PCH not follow, whatever made
+        # the old one stale still does with the new depfile
+        os.replace(tmp_depfile, depfile)
+        os.replace(tmp, pch)
+    finally:
+        for path in (tmp, tmp_depfile):
+            if os.path.exists(path):
+                os.remove(path)
+    return str(pch)
@@ -0,0 +1,213 @@
+'''Parse the type strings ("qualType") of clang's AST dump.'''
+
+import functools
+import re
+from collections import namedtuple
+
+_TypeBase = namedtuple(
+    'Type',
+    'name is_ref is_ptr is_const is_const_ptr is_arr template_args clang_str '
+    'canonical')
+
+
+class Type(_TypeBase):
+    '''A type, interned: equal types are the same object.
+
+    `template_args` is a tuple of Types.  Since all the fields are
+    immutable, a single instance of every distinct type is shared by the
+    whole IR, and equal types compare (and are found) by identity.
+
+    `canonical` is the Type with all typedefs and aliases resolved, or
+    None if there are none to resolve (or they haven't been resolved
+    yet, see :mod:`cythonator.typedefs`).
+    '''
+    # tuples can't have slots of their own, and a __dict__ per type to
+    # cache the hash in costs more than hashing the fields does
+    __slots__ = ()
+    _table = {}
+
+    def __new__(cls, name, is_ref, is_ptr, is_const, is_const_ptr, is_arr,
+                template_args, clang_str, canonical=None):
+        key = (name, is_ref, is_ptr, is_const, is_const_ptr, is_arr,
+               tuple(template_args), clang_str, canonical)
+        try:
+            return cls._table[key]
+        except KeyError:
+            t = cls._table[key] = _TypeBase.__new__(cls, *key)
+            return t
+
+    @classmethod
+    def _make(cls, iterable):
+        # namedtuple's _make skips __new__
+        return cls(*iterable)
+
+    def __eq__(self, other):
+        # Only types created before the table was cleared aren't shared
+        return self is other or tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = _TypeBase.__hash__
+
+# Everything that nests or separates in a type string
+_PUNCT = re.compile(r'[<>()\[\],]')
+_OPENERS = {')': '(', ']': '['}
+
+# Types parsed so far, by clang_str.  Types are shared, so they must
+# never be modified.
+_cache = {}
+_CACHE_SIZE = 1 << 16
+
+
+class _Group:
+    '''A pair of angle brackets and the top-level commas between them.'''
+    __slots__ = ('open', 'close', 'commas', 'children')
+
+    def __init__(self, open_idx):
+        self.open = open_idx
+        self.close = None
+        self.commas = []
+        self.children = []
+
+
+def _scan(s):
+    '''Find the angle bracket pairs of `s` in a single pass.
+
+    Returns the list of outermost groups (and the index of the first
+    parenthesis outside of any angle brackets, or None).  Commas and
+    angle brackets inside parentheses or square brackets, e.g., of
+    ``std::function<void (int, int)>``, don't count.
+    '''
+
+    root = []
+    first_paren = None
+    # open brackets: (group, list it was added to) for '<', else the char
+    stack = []
+    # where groups go: root or the children of the innermost open group
+    groups = [root]
+    for m in _PUNCT.finditer(s):
+        c = m.group()
+        if c == '<':
+            g = _Group(m.start())
+            groups[-1].append(g)
+            stack.append((g, groups[-1]))
+            groups.append(g.children)
+        elif c == '>':
+            # anything else is a comparison or part of "->"
+            if stack and isinstance(stack[-1], tuple):
+                stack.pop()[0].close = m.start()
+                groups.pop()
+        elif c in '([':
+            if c == '(' and first_paren is None and len(groups) == 1:
+                first_paren = m.start()
+            stack.append(c)
+        elif c in ')]':
+            # unclosed '<' inside of parentheses were comparisons
+            while stack and stack[-1] != _OPENERS[c]:
+                _g, siblings = stack.pop()
+                # nothing was added after it but to its own children
+                siblings.pop()
+                groups.pop()
+            if stack:
+                stack.pop()
+        elif stack and isinstance(stack[-1], tuple):
+            stack[-1][0].commas.append(m.start())
+    return root, first_paren
+
+
+def _build(s, lo, hi, groups):
+    '''Type of s[lo:hi] given the outermost groups in that range.'''
+
+    clang_str = s[lo:hi]
+    try:
+        return _cache[clang_str]
+    except KeyError:
+        pass
+
+    # Everything but the outermost template part
+    type_str = clang_str
+    template_args = ()
+    if groups:
+        first, last = groups[0], groups[-1]
+        end = hi if last.close is None else last.close + 1
+        if first.open > lo:
+            type_str = s[lo:first.open] + s[end:hi]
+        template_args = _template_args(s, first)
+    type_str = type_str.strip()
+
+    name = type_str.replace('*', '').replace('&', '').strip()
+    name = ' '.join([t for t in name.split() if t != 'const'])
+
+    t = Type(
+        name=name.split('()')[0].strip(),
+        is_ref='&' in type_str,
+        is_ptr='*' in type_str,
+        is_const=len(type_str) > len('const ') and type_str.startswith('const '),
+        is_const_ptr='*const' in type_str.split(),
+        is_arr='[' in type_str,
+        template_args=template_args,
+        clang_str=clang_str,
+    )
+    if len(_cache) >= _CACHE_SIZE:
+        _cache.clear()
+        Type._table.clear()
+    _cache[clang_str] = t
+    return t
+
+
+def _template_args(s, group):
+    end = len(s) if group.close is None else group.close
+    lo, hi = group.open + 1, end
+    # Leading and trailing whitespace is not part of the arguments
+    while lo < hi and s[lo].isspace():
+        lo += 1
+    while hi > lo and s[hi-1].isspace():
+        hi -= 1
+    if lo == hi:
+        return ()
+
+    args = []
+    children = iter(group.children)
+    child = next(children, None)
+    for arg_hi in [c for c in group.commas if lo < c < hi] + [hi]:
+        nested = []
+        while child is not None and child.open < arg_hi:
+            nested.append(child)
+            child = next(children, None)
+        args.append(_build(s, lo, arg_hi, nested))
+        lo = arg_hi + 1
+    return tuple(args)
+
+
+def parse_qualtype(qual_type):
+    '''Parse a clang type string into a :class:`Type`.
+
+    The string is only scanned once, however deeply nested its template
+    arguments are, and results are memoized: equal strings give the
+    same (shared, so not to be modified) Type.
+    '''
+
+    try:
+        return _cache[qual_type]
+    except KeyError:
+        pass
+    groups, _first_paren = _scan(qual_type)
+    return _build(qual_type, 0, len(qual_type), groups)
+
+
+def with_canonical(t, canonical):
+    '''`t` with its canonical type set, unless it is the same type.'''
+    if canonical is None or canonical.clang_str.strip() == t.clang_str.strip():
+        return t
+    return t._replace(canonical=canonical)
+
+
+@functools.lru_cache(maxsize=_CACHE_SIZE)
+def return_type(qual_type):
+    '''Parse the return type out of the type string of a function.'''
+
+    _groups, first_paren = _scan(qual_type)
+    if first_paren is None:
+        first_paren = len(qual_type)
+    return parse_qualtype(qual_type[:first_paren])
@@ -0,0 +1,277 @@
+'''Select which declarations to convert.'''
+
+import contextlib
+import contextvars
+import fnmatch
+import json
+import re
+
+# Selector used while building the IR; see selecting()
+_selector = contextvars.ContextVar('cythonator_selector', default=None)
+
+# Kinds of declarations by the kind of clang's node
+_KINDS = {
+    'FunctionDecl': 'function',
+    'FunctionTemplateDecl': 'function',
+    'CXXRecordDecl': 'class',
+    'ClassTemplateDecl': 'class',
+    'TypedefDecl': 'typedef',
+    'NamespaceDecl': 'namespace',
+}
+
+# Kinds of declarations by the IR node
+_IR_KINDS = {
+    'Function': 'function',
+    'Class': 'class',
+    'Typedef': 'typedef',
+    'Namespace': 'namespace',
+}
+
+ACCESS = ('public', 'protected', 'private')
+
+# Header clang writes before every declaration it dumps with a filter
+_DUMPING = re.compile(rb'^Dumping (.*):\n', re.MULTILINE)
+
+
+def kind_of(clang_kind):
+    '''Kind of declaration (e.g., ``'class'``) of a clang node kind.'''
+    try:
+        return _KINDS[clang_kind]
+    except KeyError:
+        # e.g., EnumDecl -> enum
+        if clang_kind.endswith('Decl'):
+            clang_kind = clang_kind[:-len('Decl')]
+        return clang_kind.lower()
+
+
+def current_selector():
+    '''Selector of the IR being built right now (None if there is none).'''
+    return _selector.get()
+
+
+@contextlib.contextmanager
+def selecting(selector):
+    '''Only build the IR of declarations `selector` selects.'''
+    token = _selector.set(selector)
+    try:
+        yield
+    finally:
+        _selector.reset(token)
+
+
+class _Pattern:
+    '''A glob or (with a "re:" prefix) regular expression on names.'''
+    __slots__ = ('text', 'qualified', 'literal', '_match')
+
+    def __init__(self, text):
+        self.text = text
+        if text.startswith('re:'):
+            self._match = re.compile(text[len('re:'):]).search
+            # no telling what a regex can match
+            self.literal = None
+        else:
+            text = text.lstrip(':')
+            self._match = re.compile(fnmatch.translate(text)).match
+            self.literal = re.split(r'[*?\[]', text)[0]
+        self.qualified = '::' in text
+
+    def matches(self, qualname):
+        if not self.qualified:
+            qualname = qualname.rpartition('::')[2]
+        return self._match(qualname) is not None
+
+    def scope(self):
+        '''Scope everything the glob matches is in ('' if unknown).'''
+        if self.literal is None or not self.qualified:
+            return ''
+        return self.literal.rpartition('::')[0]
+
+    def may_contain(self, qualname):
+        '''Whether the glob may match a declaration inside `qualname`.'''
+        if self.literal is None or not self.qualified:
+            return True
+        inside = qualname + '::'
+        return (self.literal.startswith(inside)
+                or inside.startswith(self.literal))
+
+
+def _scopes(qualname):
+    '''`qualname` and the names of all scopes enclosing it.'''
+    while qualname:
+        yield qualname
+        qualname = qualname.rpartition('::')[0]
+
+
+class Selector:
+    '''Which declarations to convert.
+
+    Parameters
+    ----------
+    include : list of str, optional
+        Only declarations matching one of these patterns (or declared
+        in a namespace or class that does) are converted.  Patterns are
+        globs, e.g., ``'mylib::core::*'``, or regular expressions with a
+        ``'re:'`` prefix, e.g., ``'re:^solve_'``.  Patterns containing
+        ``'::'`` are matched against fully qualified names, the others
+        against unqualified names.  Everything is included by default.
+    exclude : list of str, optional
+        Declarations matching one of these patterns (or declared inside
+        one that does) are never converted.
+    kinds : list of str, optional
+        Kinds of declarations to convert, e.g., ``['class',
+        'function']``.  Kinds are ``'function'``, ``'class'`` (including
+        structs), ``'typedef'`` and, for nodes with custom handlers, the
+        lowercase clang kind without "Decl" (e.g., ``'enum'``).
+        Namespaces are always searched.  All kinds by default.
+    access : list of str, optional
+        Access of the class members to convert.  Only public members by
+        default.
+
+    Notes
+    -----
+    Selectors are applied to clang's nodes before any IR is built for
+    them, and namespaces that can't contain anything selected are
+    skipped altogether.  If every `include` pattern is a qualified glob,
+    the innermost scope they all share (e.g., ``'mylib::core'``) is also
+    passed to clang (see :meth:`dump_filter`), so nothing outside of it
+    is even dumped.
+
+    Selectors are immutable, so they can be shared by any number of
+    threads (e.g., in a :class:`cythonator.cythonator.Config`).
+    '''
+    __slots__ = ('include', 'exclude', 'kinds', 'access')
+
+    def __init__(self, include=(), exclude=(), kinds=None, access=('public',)):
+        access = frozenset(access)
+        for a in access:
+            if a not in ACCESS:
+                raise ValueError(f'Unknown access "{a}"!')
+        for name, value in [
+                ('include', tuple(_Pattern(p) for p in include)),
+                ('exclude', tuple(_Pattern(p) for p in exclude)),
+                ('kinds', None if kinds is None else frozenset(kinds)),
+                ('access', access)]:
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Selectors are immutable!')
+
+    def __delattr__(self, name):
+        raise AttributeError('Selectors are immutable!')
+
+    def __reduce__(self):
+        # unpickled by __init__, since attributes can't be set
+        return (self.__class__, (
+            [p.text for p in self.include], [p.text for p in self.exclude],
+            self.kinds, self.access))
+
+    def __repr__(self):
+        return 'Selector(include={}, exclude={}, kinds={}, access={})'.format(
+            [p.text for p in self.include], [p.text for p in self.exclude],
+            None if self.kinds is None else sorted(self.kinds),
+            sorted(self.access))
+
+    def _excluded(self, qualname):
+        return any(p.matches(s) for s in _scopes(qualname)
+                   for p in self.exclude)
+
+    def selects(self, qualname, kind):
+        '''Whether to convert the declaration `qualname` of `kind`.'''
+        if kind == 'namespace':
+            return self.enters(qualname)
+        if self.kinds is not None and kind not in self.kinds:
+            return False
+        if self._excluded(qualname):
+            return False
+        return not self.include or any(
+            p.matches(s) for s in _scopes(qualname) for p in self.include)
+
+    def enters(self, qualname):
+        '''Whether anything in namespace `qualname` may be selected.'''
+        if self._excluded(qualname):
+            return False
+        return not self.include or any(
+            p.may_contain(qualname) or p.matches(qualname)
+            for p in self.include)
+
+    def selects_node(self, node, scope=''):
+        '''Whether to convert clang's `node` declared in `scope`.'''
+        name = node.get('name')
+        if not name:
+            qualname = scope
+        else:
+            qualname = f'{scope}::{name}' if scope else name
+        return self.selects(qualname, kind_of(node['kind']))
+
+    def dump_filter(self):
+        '''What to pass to clang's ``-ast-dump-filter`` (or None).
+
+        Clang only dumps the declarations whose qualified name contains
+        the filter (and doesn't look inside of them any further), so
+        this is the innermost scope shared by all `include` patterns.
+        '''
+        if not self.include:
+            return None
+        scopes = [p.scope() for p in self.include]
+        if not all(scopes):
+            return None
+        common = []
+        for parts in zip(*[s.split('::') for s in scopes]):
+            if len(set(parts)) > 1:
+                break
+            common.append(parts[0])
+        return '::'.join(common) or None
+
+
+def iter_filtered_dump(out, loads=json.loads):
+    '''Yield the nodes of an AST dump made with ``-ast-dump-filter``.
+
+    `out` is clang's output (bytes), decoded with `loads`.  Every
+    declaration is dumped on its own, after a "Dumping <qualified
+    name>:" line, so each is wrapped in a NamespaceDecl named after the
+    scope it is declared in (unless it is in the global one).  The scope
+    is assumed to be a namespace.  Declarations in anonymous namespaces
+    (or inside of functions) are skipped.
+
+    Yields
+    ------
+    (node, wrapped) : tuple of dict
+        The dumped node and the node to convert.
+    '''
+
+    parts = _DUMPING.split(out)
+    for qualname, text in zip(parts[1::2], parts[2::2]):
+        scope = qualname.decode().rpartition('::')[0]
+        if '(' in scope:
+            continue
+        node = loads(text)
+        if not scope:
+            yield node, node
+        else:
+            yield node, {'id': f'_scope_{scope}', 'kind': 'NamespaceDecl',
+                         'name': scope, 'inner': [node]}
+
+
+def select_ir(namespace, selector):
+    '''Copy of an IR namespace with only what `selector` selects.
+
+    For IR that wasn't built by the handlers, e.g., by the native
+    parser.  Class members aren't selected by access here; the native
+    parser leaves out the ones `selector` doesn't keep itself (see
+    :func:`cythonator._native.parse_header`).
+    '''
+
+    def select(ns, scope):
+        children = []
+        for child in ns.children:
+            kind = _IR_KINDS.get(child.__class__.__name__, '')
+            if kind == 'namespace':
+                # nested namespace names are fully qualified
+                if selector.enters(child.name):
+                    children.append(select(child, child.name))
+                continue
+            qualname = f'{scope}::{child.name}' if scope else child.name
+            if selector.selects(qualname, kind):
+                children.append(child)
+        return ns._replace(children=children)
+    return select(namespace, namespace.name)
@@ -0,0 +1,114 @@
+'''Leave out every declaration a set of roots doesn't need.'''
+
+from cythonator.index import DeclIndex
+
+
+def _kind(node):
+    return node.__class__.__name__
+
+
+def _outermost(index, decl):
+    '''Outermost class `decl` is nested in (or `decl` itself).'''
+    while True:
+        enclosing = [d for d in index.lookup(index.scope_of(decl))
+                     if _kind(d) == 'Class']
+        if not enclosing:
+            return decl
+        decl = enclosing[0]
+
+
+def needed(index, roots):
+    '''Ids of the declarations `roots` need, including themselves.
+
+    Parameters
+    ----------
+    index : DeclIndex
+        Index of all declarations.
+    roots : list of str
+        Fully qualified names of the declarations to keep, e.g.,
+        ``'mylib::solve'``.  All overloads of a name are kept, and
+        namespaces are kept with everything in them.
+
+    Notes
+    -----
+    Classes are kept whole (along with their enclosing classes), so
+    every type used by any of their members is needed, as are their
+    bases.  Functions need their parameter, return and template
+    argument types and typedefs the type they alias.  Types that aren't
+    in the index, e.g., from the standard library, are left to the
+    cimports.
+    '''
+
+    todo = []
+    for root in roots:
+        found = index.lookup(root)
+        if not found:
+            raise ValueError(f'Unknown root "{root}"!')
+        todo += found
+
+    keep = set()
+    while todo:
+        decl = todo.pop()
+        if hasattr(decl, 'function'):
+            decl = decl.function
+        decl = _outermost(index, decl)
+        if decl.id in keep:
+            continue
+        keep.add(decl.id)
+
+        kind = _kind(decl)
+        if kind == 'Namespace':
+            todo += decl.children
+            continue
+        # names used by members are looked up from inside the class
+        scope = index.qualname(decl) if kind == 'Class' else (
+            index.scope_of(decl))
+        for name in index.types_used(decl):
+            todo += index.resolve_type(name, scope)
+        if kind == 'Class':
+            todo += [b for b in index.bases(decl) if b is not None]
+    return keep
+
+
+def _prune(namespace, keep):
+    children = []
+    for child in namespace.children:
+        if child.id in keep:
+            children.append(child)
+        elif _kind(child) == 'Namespace':
+            child = _prune(child, keep)
+            if child.children:
+                children.append(child)
+    return namespace._replace(children=children)
+
+
+def shake(namespaces, roots, index=None):
+    '''Copy of the IR with only `roots` and what they need.
+
+    Parameters
+    ----------
+    namespaces : Namespace or dict
+        Global namespace, or a dict of them (e.g., by header, as
+        returned by :func:`cythonator.cythonator.cythonator_headers`).
+        Roots can need declarations from any of them.
+    roots : list of str
+        Names of the declarations to keep (see :func:`needed`).
+    index : DeclIndex, optional
+        Index of `namespaces`, if there already is one.
+
+    Returns
+    -------
+    Namespace or dict
+        Same as `namespaces`, but with everything that isn't needed left
+        out (including namespaces left empty).
+    '''
+
+    single = not isinstance(namespaces, dict)
+    items = {None: namespaces} if single else namespaces
+    if index is None:
+        index = DeclIndex()
+        for ns in items.values():
+            index.add(ns)
+    keep = needed(index, roots)
+    res = {key: _prune(ns, keep) for key, ns in items.items()}
+    return res[None] if single else res
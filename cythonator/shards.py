@@ -0,0 +1,242 @@
+'''Write one PXD module per namespace or header instead of one big file.'''
+
+import pathlib
+import re
+from collections import namedtuple
+from keyword import iskeyword
+
+from cythonator.diagnostics import report
+from cythonator.index import DeclIndex
+from cythonator.manifest import (
+    Manifest, fingerprint_headers, write_if_changed)
+from cythonator.parallel import map_shards
+from cythonator.shake import _outermost, _prune
+from cythonator.write_cython import iter_decls, iter_pxd_headers
+
+# namespaces maps headers to the global namespace pruned down to the
+# declarations of the shard; cimports maps modules to the names taken
+# from them
+Shard = namedtuple('Shard', 'module namespaces cimports')
+
+# Module holding the declarations of the global namespace
+GLOBAL_MODULE = '_global'
+
+
+def _kind(node):
+    return node.__class__.__name__
+
+
+def module_name(key, by):
+    '''Name of the module of a namespace (qualified name) or header.'''
+    if by == 'namespace':
+        name = key.replace('::', '__') or GLOBAL_MODULE
+    elif by == 'header':
+        name = pathlib.Path(key).stem
+    else:
+        raise ValueError(f'Unknown shard kind "{by}"!')
+    name = re.sub(r'\W', '_', name)
+    if name[0].isdigit():
+        name = '_' + name
+    return name + '_'*iskeyword(name)
+
+
+def _used(index, decl):
+    '''Outermost declarations of the types `decl` uses.'''
+    kind = _kind(decl)
+    # names used by members are looked up from inside the class
+    scope = index.qualname(decl) if kind == 'Class' else index.scope_of(decl)
+    found = [d for name in index.types_used(decl)
+             for d in index.resolve_type(name, scope)]
+    if kind == 'Class':
+        found += [b for b in index.bases(decl) if b is not None]
+    return [_outermost(index, d) for d in found]
+
+
+def split(namespaces, by='namespace', index=None):
+    '''Split the IR of many headers into shards.
+
+    Parameters
+    ----------
+    namespaces : dict
+        Maps headers to their global namespace, e.g., as returned by
+        :func:`cythonator.cythonator.cythonator_headers`.
+    by : {'namespace', 'header'}, optional
+        Put the declarations of each namespace (from all headers) or of
+        each header into a module of their own.
+    index : DeclIndex, optional
+        Index of `namespaces`, if there already is one.
+
+    Returns
+    -------
+    dict
+        Maps module names to their :class:`Shard`, in the order the
+        declarations came in.
+
+    Notes
+    -----
+    A shard cimports the classes and typedefs it uses from the other
+    shards.  Types that aren't in the index, e.g., from the standard
+    library, are left alone.
+    '''
+
+    if index is None:
+        index = DeclIndex()
+        for ns in namespaces.values():
+            index.add(ns)
+
+    modules = {}  # key -> module
+    owner = {}  # id -> module
+    members = {}  # module -> [declarations]
+    headers = {}  # module -> headers with declarations in it
+    for header, global_ns in namespaces.items():
+        for ns, decl in iter_decls(global_ns):
+            key = ns.name if by == 'namespace' else header
+            if key not in modules:
+                name = module_name(key, by)
+                taken = set(modules.values())
+                # e.g., headers of the same name in different directories
+                module, ii = name, 2
+                while module in taken:
+                    module, ii = f'{name}_{ii}', ii + 1
+                modules[key] = module
+                members[module] = []
+                headers[module] = {}
+            module = modules[key]
+            owner[decl.id] = module
+            members[module].append(decl)
+            headers[module][header] = None
+
+    shards = {}
+    for module, decls in members.items():
+        keep = {decl.id for decl in decls}
+        cimports = {}
+        for decl in decls:
+            for used in _used(index, decl):
+                other = owner.get(used.id)
+                if other is not None and other != module:
+                    cimports.setdefault(other, set()).add(used.name)
+        _check_clashes(module, cimports)
+        shards[module] = Shard(
+            module=module,
+            namespaces={h: _prune(namespaces[h], keep)
+                        for h in headers[module]},
+            cimports={m: sorted(names)
+                      for m, names in sorted(cimports.items())})
+    return shards
+
+
+def _check_clashes(module, cimports):
+    seen = {}
+    for other, names in sorted(cimports.items()):
+        for name in sorted(names):
+            if name in seen:
+                report('warning',
+                       f'{module} cimports "{name}" from both {seen[name]} '
+                       f'and {other}')
+            seen[name] = other
+
+
+def iter_shard(shard):
+    '''Yield the lines of the PXD module of a shard.'''
+    for module, names in shard.cimports.items():
+        yield f'from {module} cimport {", ".join(names)}\n'
+    if shard.cimports:
+        yield '\n'
+    yield from iter_pxd_headers(shard.namespaces)
+
+
+def iter_index(modules):
+    '''Yield the lines of a module cimporting everything of all shards.'''
+    for module in modules:
+        yield f'from {module} cimport *\n'
+
+
+def _write_shards(items, output_dir):
+    written = []
+    for shard in items:
+        path = pathlib.Path(output_dir) / f'{shard.module}.pxd'
+        if write_if_changed(path, iter_shard(shard)):
+            written.append(path)
+    return written
+
+
+def write_shards(namespaces, output_dir, by='namespace', index='index',
+                 jobs=1, manifest='manifest.json'):
+    '''Write one PXD module per namespace or header into `output_dir`.
+
+    Parameters
+    ----------
+    namespaces : dict
+        Maps headers to their global namespace, see :func:`split`.
+    output_dir : str
+        Directory to write to; it is created if it doesn't exist.
+    by : {'namespace', 'header'}, optional
+        How to split the declarations, see :func:`split`.
+    index : str or None, optional
+        Name of a module cimporting everything from all shards.  It isn't
+        written if None.
+    jobs : int, optional
+        Number of processes writing shards, see
+        :func:`cythonator.parallel.map_shards`.
+    manifest : str or None, optional
+        Name of the file in `output_dir` keeping the fingerprints of the
+        declarations of every shard, see
+        :class:`cythonator.manifest.Manifest`.  Without one, every shard
+        is generated again.
+
+    Returns
+    -------
+    list of pathlib.Path
+        Files written, the index (if any) last.
+
+    Notes
+    -----
+    Shards cimport each other by module name, so `output_dir` needs to be
+    in the include path of Cython, e.g., ``cythonize(...,
+    include_path=[output_dir])``.  Every shard can then be compiled by
+    itself (and at the same time).
+
+    Only shards with declarations (or cimports) that changed since the
+    last run are generated again, and only files that came out different
+    are written, so the mtime of the others stays the same.  The
+    declarations that changed are reported as notes.  Shards left over
+    from the last run are removed.
+    '''
+
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    shards = split(namespaces, by)
+    if index in shards:
+        raise ValueError(f'Index module "{index}" is also a shard!')
+
+    if manifest is not None:
+        manifest = Manifest(output_dir / manifest)
+    todo = []
+    for shard in shards.values():
+        if manifest is None:
+            todo.append(shard)
+            continue
+        name = f'{shard.module}.pxd'
+        fp, decls = fingerprint_headers(
+            shard.namespaces, tuple(shard.cimports.items()))
+        if not manifest.unchanged(name, fp):
+            todo.append(shard)
+            manifest.report_changes(name, decls)
+        manifest.record(name, fp, decls)
+
+    paths = map_shards(_write_shards, todo, jobs, args=(output_dir,))
+    if index is not None:
+        path = output_dir / f'{index}.pxd'
+        if write_if_changed(path, iter_index(shards)):
+            paths.append(path)
+        if manifest is not None:
+            manifest.record(path.name, None)
+
+    if manifest is not None:
+        for name in manifest.stale():
+            try:
+                (output_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+        manifest.save()
+    return paths
@@ -0,0 +1,162 @@
+'''Resolve typedefs and aliases to canonical types.'''
+
+import re
+
+from cythonator.qualtype import Type, parse_qualtype, with_canonical
+from cythonator.lazy import LazyList
+
+# Possibly qualified names in a type string, e.g., "ns::myInt"; names
+# of tags ("struct A") are never typedefs
+_NAME = re.compile(
+    r'(?P<tag>(?:struct|class|union|enum)\s+)?'
+    r'(?P<name>(?:::)?[A-Za-z_]\w*(?:::[A-Za-z_]\w*)*)')
+
+
+class TypeResolver:
+    '''Canonical forms of types, using the typedefs of the parsed headers.
+
+    Notes
+    -----
+    Where clang provided the desugared type (``desugaredQualType``) that
+    is used.  Everything else, e.g., template arguments or types from
+    the native parser, is resolved by replacing typedef names in the
+    type string with their canonical types, following chains of
+    typedefs once and caching every result.
+
+    Like C++ name lookup, a name used in a scope is looked for in that
+    scope first and then in each enclosing one, so typedefs of the same
+    name in different scopes (e.g., ``value_type``) don't mix.
+    '''
+
+    def __init__(self):
+        self._typedefs = {}  # qualified name -> (Type it aliases, scope)
+        self._canonical = {}  # (scope, clang_str) -> canonical clang_str
+        self._resolved = {}  # (scope, Type) -> Type with canonical set
+
+    def add_typedef(self, name, t, scope=''):
+        '''Make `name` (declared in `scope`) an alias of Type `t`.'''
+        self._typedefs[f'{scope}::{name}' if scope else name] = (t, scope)
+        # new names can change what was resolved so far
+        self._canonical.clear()
+        self._resolved.clear()
+
+    def _lookup(self, name, scope):
+        if name.startswith('::'):
+            return self._typedefs.get(name[2:])
+        while True:
+            found = self._typedefs.get(f'{scope}::{name}' if scope else name)
+            if found is not None or not scope:
+                return found
+            scope = scope.rpartition('::')[0]
+
+    def canonical_str(self, clang_str, scope=''):
+        '''`clang_str` (used in `scope`) with every typedef name replaced.'''
+        key = (scope, clang_str)
+        try:
+            return self._canonical[key]
+        except KeyError:
+            pass
+        # typedef struct A A; refers back to itself
+        self._canonical[key] = clang_str
+        res = _NAME.sub(lambda m: self._expand(m, scope), clang_str)
+        self._canonical[key] = res
+        return res
+
+    def _expand(self, match, scope):
+        if match.group('tag'):
+            return match.group()
+        found = self._lookup(match.group('name'), scope)
+        if found is None:
+            return match.group()
+        t, declared_in = found
+        if t.canonical is not None:
+            t = t.canonical
+        # what the typedef aliases is looked up where it is declared
+        return self.canonical_str(t.clang_str.strip(), declared_in)
+
+    def resolve(self, t, scope=''):
+        '''`t` (and its template arguments) with the canonical type set.
+
+        `scope` is the qualified name of the namespace or class `t` is
+        used in.
+        '''
+        key = (scope, t)
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+
+        canonical = t.canonical
+        if canonical is None:
+            canonical = parse_qualtype(self.canonical_str(t.clang_str, scope))
+        if canonical.template_args:
+            canonical = canonical._replace(template_args=tuple(
+                self.resolve(a, scope) for a in canonical.template_args))
+        res = with_canonical(t._replace(
+            template_args=tuple(
+                self.resolve(a, scope) for a in t.template_args),
+            canonical=None), canonical)
+        self._resolved[key] = res
+        return res
+
+
+def _collect_typedefs(node, resolver, scope):
+    for td in getattr(node, 'typedefs', ()):
+        resolver.add_typedef(td.name, td.type, scope)
+    for child in node.children:
+        kind = child.__class__.__name__
+        if kind == 'Typedef':
+            resolver.add_typedef(child.name, child.type, scope)
+        elif kind == 'Namespace':
+            # namespace names are already qualified
+            _collect_typedefs(child, resolver, child.name)
+        elif kind == 'Class':
+            _collect_typedefs(
+                child, resolver,
+                f'{scope}::{child.name}' if scope else child.name)
+
+
+def _map_types(obj, resolver, scope):
+    if isinstance(obj, Type):
+        return resolver.resolve(obj, scope)
+    # members are used from inside their namespace or class
+    kind = obj.__class__.__name__
+    if kind == 'Namespace':
+        # namespace names are already qualified
+        scope = obj.name
+    elif kind == 'Class':
+        scope = f'{scope}::{obj.name}' if scope else obj.name
+    if isinstance(obj, (list, LazyList)):
+        return [_map_types(o, resolver, scope) for o in obj]
+    if isinstance(obj, tuple):
+        vals = [_map_types(o, resolver, scope) for o in obj]
+        return obj._make(vals) if hasattr(obj, '_fields') else tuple(vals)
+    return obj
+
+
+def resolve_types(namespaces, resolver=None):
+    '''Set the canonical type of every Type in the IR.
+
+    Parameters
+    ----------
+    namespaces : Namespace or list of Namespace
+        Global namespace(s) of the parsed headers.  Typedefs of all of
+        them are known when resolving the types of each one.
+    resolver : TypeResolver, optional
+        Resolver to add the typedefs to and resolve with.
+
+    Returns
+    -------
+    Namespace or list of Namespace
+        Copy of `namespaces` with resolved types.
+    '''
+
+    if resolver is None:
+        resolver = TypeResolver()
+    single = not isinstance(namespaces, list)
+    if single:
+        namespaces = [namespaces]
+    for ns in namespaces:
+        _collect_typedefs(ns, resolver, ns.name)
+    res = [_map_types(ns, resolver, '') for ns in namespaces]
+    return res[0] if single else res
@@ -1,11 +1,19 @@
 '''Traverse the AST and prettyprint Cython.'''
 
+import inspect
+import itertools
 import pathlib
 from collections import namedtuple
 from keyword import iskeyword
 
+from cythonator.parallel import default_jobs, iter_shards
+
 TAB = '    '
 
+# Declarations handed to the pool at a time per process, so the written
+# text waiting to be yielded stays bounded however big the PXD gets
+_BATCH = 1024
+
 Typedef = namedtuple('Typedef', 'id name type referenced')
 
 
@@ -46,16 +54,15 @@ def _templ_str(params):
     return ''
 
 
-def _print_typedef(t, indent_lvl):
+def _iter_typedef(t, indent_lvl):
 
     # Cython can get confused with nested typedefs (especially with
     # templates), so let's separate things out
-    td = ''
     subs = {}
     workaround_prefix = '_cython_nested_templated_typedef_workaround_'
     for ta in t.type.template_args:
         if ta.template_args:
-            td += _print_typedef(Typedef(
+            yield from _iter_typedef(Typedef(
                 id=-1,
                 name=workaround_prefix + ta.name,
                 type=ta,
@@ -68,7 +75,11 @@ def _print_typedef(t, indent_lvl):
     for s in subs:
         type_str = type_str.replace(s, subs[s])
 
-    return td + TAB*indent_lvl + f'ctypedef {type_str} {_safe_name(t.name)}\n'
+    yield TAB*indent_lvl + f'ctypedef {type_str} {_safe_name(t.name)}\n'
+
+
+def _print_typedef(t, indent_lvl):
+    return ''.join(_iter_typedef(t, indent_lvl))
 
 
 def _print_field(f, indent_lvl):
@@ -103,66 +114,211 @@ def _print_method(m, indent_lvl):
     )
 
 
-def _print_class(c, indent_lvl):
-    pxd = ''
-    pxd += TAB*indent_lvl + 'cppclass {name}{templates}:\n'.format(
+def _iter_class(c, indent_lvl):
+    yield TAB*indent_lvl + 'cppclass {name}{templates}:\n'.format(
         name=_safe_name(c.name),
         templates=_templ_str(c.templateparams),
     )
 
     indent_lvl += 1
     for t in c.typedefs:
-        pxd += _print_typedef(t, indent_lvl)
+        yield from _iter_typedef(t, indent_lvl)
 
     for f in c.fields:
-        pxd += _print_field(f, indent_lvl)
+        yield _print_field(f, indent_lvl)
 
     for m in c.methods:
-        pxd += _print_method(m, indent_lvl)
+        yield _print_method(m, indent_lvl)
 
     # Recursively handle children
     for ic in c.children:
         if ic.__class__.__name__ == 'Class':
-            pxd += _print_class(ic, indent_lvl)
+            yield from _iter_class(ic, indent_lvl)
 
     if not (c.typedefs or c.fields or c.methods or c.children):
-        pxd += TAB*indent_lvl + 'pass\n'
+        yield TAB*indent_lvl + 'pass\n'
 
-    indent_lvl -= 1
-    return pxd
+
+def _print_class(c, indent_lvl):
+    return ''.join(_iter_class(c, indent_lvl))
 
 
-def _print_extern(namespace, headerfile, indent_lvl):
+def _print_extern(namespace, header, indent_lvl):
+    # header is resolved already: it is the same for a whole file
     return TAB*indent_lvl + 'cdef extern from "{headerfile}"{namespace} nogil:\n'.format(
-        headerfile=pathlib.Path(headerfile).resolve(),
+        headerfile=header,
         namespace='' if not namespace.name else f' namespace "{namespace.name}"',
     )
 
 
-def write_pxd(namespace, headerfile: str, indent_lvl=0):
-    '''Translate a namespace tree into a PXD file.'''
+def _iter_decl(child, indent_lvl):
+    typestr = child.__class__.__name__
+    if typestr == 'Typedef':
+        yield from _iter_typedef(child, indent_lvl)
+    elif typestr == 'Function':
+        # redeclarations were merged by cythonator.dedup
+        yield _print_function(child, indent_lvl)
+    elif typestr == 'Class':
+        yield from _iter_class(child, indent_lvl)
+
+
+def iter_decls(namespace):
+    '''Yield the declarations of a namespace tree with their namespace.'''
+    for child in namespace.children:
+        if child.__class__.__name__ == 'Namespace':
+            yield from iter_decls(child)
+        else:
+            yield namespace, child
+
 
-    pxd = ''
+def _iter_decls(namespace, header, indent_lvl):
+    '''Yield the extern line and the declarations of a namespace tree.
 
-    # handle children in order
+    Declarations are yielded in order, each with the first line of the
+    extern block it goes into.
+    '''
+    extern = _print_extern(namespace, header, indent_lvl)
     for child in namespace.children:
-        typestr = child.__class__.__name__
-        if typestr == 'Typedef':
-            pxd += _print_extern(namespace, headerfile, indent_lvl)
-            pxd += _print_typedef(child, indent_lvl+1)
-        elif typestr == 'Function':
-            # TODO: handle redeclaration
-            pxd += _print_extern(namespace, headerfile, indent_lvl)
-            pxd += _print_function(child, indent_lvl+1)
-        elif typestr == 'Class':
-            pxd += _print_extern(namespace, headerfile, indent_lvl)
-            pxd += _print_class(child, indent_lvl+1)
-        elif typestr == 'Namespace':
-            # Start a new extern block for this namespace
-            pxd += write_pxd(
-                child, headerfile, indent_lvl=0)
-
-    return pxd
+        if child.__class__.__name__ == 'Namespace':
+            yield from _iter_decls(child, header, indent_lvl=0)
+        else:
+            yield extern, child
+
+
+def _iter_blocks(pieces):
+    '''Open an extern block only where the previous one doesn't fit.
+
+    `pieces` are pairs of the first line of the extern block and what
+    goes into it.  Consecutive declarations of the same namespace of the
+    same header share a single block; a new one is opened after the
+    declarations of a nested namespace.
+    '''
+    current = None
+    for extern, lines in pieces:
+        if extern != current:
+            yield extern
+            current = extern
+        yield from lines
+
+
+def _resolve_all(namespaces):
+    if isinstance(namespaces, dict):
+        namespaces = namespaces.items()
+    # resolve every header once, not for every declaration
+    return [(pathlib.Path(header).resolve(), ns) for header, ns in namespaces]
+
+
+def iter_pxd(namespace, headerfile: str, indent_lvl=0):
+    '''Yield the lines of the PXD file of a namespace tree.'''
+    header = pathlib.Path(headerfile).resolve()
+    yield from _iter_blocks(
+        (extern, _iter_decl(child, indent_lvl+1))
+        for extern, child in _iter_decls(namespace, header, indent_lvl))
+
+
+def write_pxd(namespace, headerfile: str, indent_lvl=0):
+    '''Translate a namespace tree into a PXD file.'''
+    return ''.join(iter_pxd(namespace, headerfile, indent_lvl))
+
+
+def _write_shard(decls):
+    return [(extern, ''.join(_iter_decl(child, 1))) for extern, child in decls]
+
+
+def _batches(iterable, size):
+    '''Lists of up to `size` consecutive items of `iterable`.'''
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_pxd_headers(namespaces, jobs=1):
+    '''Yield the PXD file of the namespace trees of many headers.
+
+    `namespaces` maps headers to their global namespace, e.g., as
+    returned by :func:`cythonator.cythonator.cythonator_headers` (or is
+    an iterable of such pairs).  The declarations of each header go into
+    extern blocks of that header.
+
+    If `jobs` isn't 1, the declarations are written by a pool of `jobs`
+    processes (one per core if None), see
+    :func:`cythonator.parallel.iter_shards`.  The PXD is the same, but
+    comes in one piece per declaration instead of line by line.  The
+    declarations are handed to the pool in batches of a fixed size per
+    process, so only the pieces of one batch are held at a time.
+    '''
+
+    decls = (decl for header, ns in _resolve_all(namespaces)
+             for decl in _iter_decls(ns, header, 0))
+    if jobs == 1:
+        yield from _iter_blocks(
+            (extern, _iter_decl(child, 1)) for extern, child in decls)
+    else:
+        if jobs is None:
+            jobs = default_jobs()
+        pieces = (piece for batch in _batches(decls, jobs * _BATCH)
+                  for piece in iter_shards(_write_shard, batch, jobs))
+        yield from _iter_blocks(
+            (extern, (text,)) for extern, text in pieces)
+
+
+def write_pxd_headers(namespaces, jobs=1):
+    '''Translate the namespace trees of many headers into one PXD file.
+
+    See :func:`iter_pxd_headers`.
+    '''
+    return ''.join(iter_pxd_headers(namespaces, jobs))
+
+
+def _writer(sink):
+    if hasattr(sink, 'write'):
+        return sink.write
+    if inspect.isgenerator(sink):
+        if inspect.getgeneratorstate(sink) == inspect.GEN_CREATED:
+            # run it up to its first yield
+            next(sink)
+        return sink.send
+    if callable(sink):
+        return sink
+    raise ValueError(f'Unknown sink "{sink!r}"!')
+
+
+def emit_pxd(namespaces, sink, jobs=1):
+    '''Write the PXD file of many headers to `sink` as it is generated.
+
+    Parameters
+    ----------
+    namespaces : dict or iterable
+        Headers and their global namespace, see :func:`iter_pxd_headers`.
+    sink : file, generator or callable
+        Where the PXD goes: a text stream (anything with a ``write``
+        method), a generator that is sent every piece or a function that
+        is called with every piece.
+    jobs : int, optional
+        Number of processes writing, see :func:`iter_pxd_headers`.
+
+    Returns
+    -------
+    int
+        Number of characters written.
+
+    Notes
+    -----
+    Nothing but the piece being written is held in memory, so output
+    starts right away and memory stays flat however big the PXD gets.
+    With `jobs`, the pieces of a batch of declarations are written
+    ahead, but no more (see :func:`iter_pxd_headers`).
+    '''
+
+    write = _writer(sink)
+    count = 0
+    for piece in iter_pxd_headers(namespaces, jobs):
+        write(piece)
+        count += len(piece)
+    return count
 
 
 if __name__ == '__main__':
@@ -203,6 +203,26 @@ def configuration(parent_package='', top_path=None):
     #     ],
     # )
 
+    # In-process declaration extraction
+    config.add_extension(
+        'cythonator._native',
+        sources=[
+            'cythonator/_native.pyx',
+            'src/cythonator/decl_collector.cpp',
+            'src/cythonator/parse_session.cpp',
+        ],
+        include_dirs=[
+            'src/',
+            CLANG_DIR / 'include',
+            LLVM_DIR / 'include',
+        ],
+        libraries=[l.name for l in libs[::-1]] + ['dl', 'm', 'rt', 'tinfo', 'z'],
+        language='c++',
+        define_macros=[
+            ('LLVM_ENABLE_ABI_BREAKING_CHECKS', 0),
+        ],
+    )
+
     # Build something that uses the libraries to make sure it worked
     config.add_extension(
         'tests.build_test',
@@ -0,0 +1,372 @@
+#include "decl_collector.hpp"
+
+#include "clang/AST/ASTConsumer.h"
+#include "clang/AST/ASTContext.h"
+#include "clang/AST/DeclCXX.h"
+#include "clang/AST/DeclTemplate.h"
+#include "clang/AST/RecursiveASTVisitor.h"
+#include "clang/Basic/SourceManager.h"
+#include "clang/Frontend/CompilerInstance.h"
+#include "clang/Frontend/FrontendAction.h"
+#include "clang/Tooling/CompilationDatabase.h"
+#include "clang/Tooling/Tooling.h"
+#include "llvm/ADT/StringExtras.h"
+
+using namespace clang;
+
+namespace cythonator {
+namespace {
+
+std::string pointerRepr(const void *Ptr) {
+  return "0x" + llvm::utohexstr(reinterpret_cast<uint64_t>(Ptr),
+                                /*LowerCase=*/true);
+}
+
+// Walks the same declarations the JSON handlers in cythonator.py look at
+// and records only the pieces of them that end up in the IR.
+class DeclCollector : public RecursiveASTVisitor<DeclCollector> {
+  using Base = RecursiveASTVisitor<DeclCollector>;
+
+public:
+  DeclCollector(ASTContext &Context,
+                const std::vector<std::string> &IncludeRoots, bool KeepAll,
+                std::vector<DeclRecord> &Records)
+      : Context(Context), SM(Context.getSourceManager()),
+        IncludeRoots(IncludeRoots), KeepAll(KeepAll), Records(Records),
+        Parent(-1), InClass(false) {}
+
+  bool TraverseDecl(Decl *D) {
+    if (!D)
+      return true;
+    if (isa<TranslationUnitDecl>(D))
+      return Base::TraverseDecl(D);
+
+    // Only top-level declarations are filtered by location
+    if (Parent == -1 && !isWanted(D))
+      return true;
+    if (InClass)
+      return traverseMember(D);
+
+    switch (D->getKind()) {
+    case Decl::Namespace:
+      return traverseNamespace(cast<NamespaceDecl>(D));
+    case Decl::Function:
+    case Decl::FunctionTemplate:
+      addFunction(D);
+      return true;
+    case Decl::Typedef:
+      // ignore double underscored typedefs
+      if (Parent == -1 && cast<TypedefDecl>(D)->getName().startswith("__"))
+        return true;
+      addTypedef(cast<TypedefDecl>(D));
+      return true;
+    case Decl::CXXRecord:
+    case Decl::ClassTemplate:
+      return traverseClass(D);
+    default:
+      return true;
+    }
+  }
+
+private:
+  bool traverseMember(Decl *D) {
+    if (auto *MD = dyn_cast<CXXMethodDecl>(D))
+      if (MD->isVirtualAsWritten())
+        add(RK_VirtualMethod, MD).name = MD->getNameAsString();
+
+    switch (D->getKind()) {
+    case Decl::CXXConstructor:
+    case Decl::CXXMethod:
+    case Decl::FunctionTemplate:
+      addFunction(D);
+      return true;
+    case Decl::Field: {
+      auto *FD = cast<FieldDecl>(D);
+      DeclRecord &R = add(RK_Field, FD);
+      R.name = FD->getNameAsString();
+      setType(R, FD->getType());
+      setAccess(R, FD->getAccess());
+      return true;
+    }
+    case Decl::Typedef:
+      addTypedef(cast<TypedefDecl>(D));
+      return true;
+    case Decl::CXXRecord:
+      // the injected class name refers back to the class itself
+      if (cast<CXXRecordDecl>(D)->isInjectedClassName())
+        return true;
+      return traverseClass(D);
+    case Decl::ClassTemplate:
+      return traverseClass(D);
+    default:
+      return true;
+    }
+  }
+
+  bool traverseNamespace(NamespaceDecl *NS) {
+    if (NS->isAnonymousNamespace())
+      return true;
+
+    // Same naming as handle_namespace: fully qualified, e.g. "a::b::c"
+    std::string Name = NS->getNameAsString();
+    for (const DeclContext *DC = NS->getDeclContext();
+         !DC->isTranslationUnit(); DC = DC->getParent())
+      if (auto *P = dyn_cast<NamespaceDecl>(DC))
+        Name = P->getNameAsString() + "::" + Name;
+    DeclRecord &R = add(RK_Namespace, NS);
+    R.name = Name;
+
+    return traverseChildren(NS, Records.size() - 1, false);
+  }
+
+  bool traverseClass(Decl *D) {
+    auto *CTD = dyn_cast<ClassTemplateDecl>(D);
+    CXXRecordDecl *RD =
+        CTD ? CTD->getTemplatedDecl() : cast<CXXRecordDecl>(D);
+    if (RD->getName().empty())
+      return true;
+
+    DeclRecord &R = add(RK_Class, RD);
+    R.name = RD->getNameAsString();
+    R.tag = RD->getKindName().str();
+    if (CTD)
+      R.flags |= RF_Template;
+    int Idx = Records.size() - 1;
+
+    if (RD->isCompleteDefinition()) {
+      Records[Idx].flags |= RF_Definition;
+      for (const CXXBaseSpecifier &B : RD->bases())
+        add(RK_Base, nullptr, Idx).type = qualType(B.getType());
+    }
+    if (CTD)
+      addTemplateParams(CTD->getTemplateParameters(), Idx);
+
+    return traverseChildren(RD, Idx, true);
+  }
+
+  bool traverseChildren(DeclContext *DC, int Idx, bool IsClass) {
+    int SavedParent = Parent;
+    bool SavedInClass = InClass;
+    Parent = Idx;
+    InClass = IsClass;
+    bool Ok = true;
+    for (Decl *Child : DC->decls())
+      if (!(Ok = TraverseDecl(Child)))
+        break;
+    Parent = SavedParent;
+    InClass = SavedInClass;
+    return Ok;
+  }
+
+  void addFunction(Decl *D) {
+    auto *FTD = dyn_cast<FunctionTemplateDecl>(D);
+    FunctionDecl *FD = FTD ? FTD->getTemplatedDecl() : cast<FunctionDecl>(D);
+
+    DeclRecord &R = add(RK_Function, FD);
+    R.name = FD->getNameAsString();
+    setType(R, FD->getType());
+    if (FD->getPreviousDecl())
+      R.flags |= RF_PreviouslyDeclared;
+    if (isa<CXXConstructorDecl>(D))
+      R.flags |= RF_Ctor;
+    setAccess(R, D->getAccess());
+    if (D->isImplicit())
+      R.flags |= RF_Implicit;
+    if (FTD)
+      R.flags |= RF_Template;
+    // The JSON dump lists the template arguments of these
+    if (FD->getTemplateSpecializationKind() == TSK_ExplicitSpecialization)
+      R.flags |= RF_Specialization | RF_HasInner;
+    // The JSON dump only has "inner" if there is something to put in it
+    if (FD->getNumParams() || FD->doesThisDeclarationHaveABody() ||
+        FD->hasAttrs())
+      R.flags |= RF_HasInner;
+    int Idx = Records.size() - 1;
+
+    if (FTD)
+      addTemplateParams(FTD->getTemplateParameters(), Idx);
+    for (const ParmVarDecl *P : FD->parameters()) {
+      DeclRecord &PR = add(RK_Param, P, Idx);
+      PR.name = P->getNameAsString();
+      if (!PR.name.empty())
+        PR.flags |= RF_HasName;
+      setType(PR, P->getType());
+    }
+  }
+
+  void addTypedef(TypedefDecl *TD) {
+    DeclRecord &R = add(RK_Typedef, TD);
+    R.name = TD->getNameAsString();
+    setType(R, TD->getUnderlyingType());
+    if (TD->isReferenced())
+      R.flags |= RF_Referenced;
+  }
+
+  void addTemplateParams(const TemplateParameterList *Params, int Idx) {
+    for (const NamedDecl *P : *Params) {
+      if (auto *TTP = dyn_cast<TemplateTypeParmDecl>(P)) {
+        DeclRecord &R = add(RK_TemplateParam, TTP, Idx);
+        R.name = TTP->getNameAsString();
+        if (!R.name.empty())
+          R.flags |= RF_HasName;
+        R.tag = TTP->wasDeclaredWithTypename() ? "typename" : "class";
+        if (TTP->isReferenced())
+          R.flags |= RF_Referenced;
+        if (TTP->isParameterPack())
+          R.flags |= RF_ParameterPack;
+        if (TTP->hasDefaultArgument()) {
+          R.flags |= RF_HasDefault;
+          R.extra = qualType(TTP->getDefaultArgument());
+        }
+      } else if (auto *NTTP = dyn_cast<NonTypeTemplateParmDecl>(P)) {
+        if (NTTP->getName().empty())
+          continue;
+        DeclRecord &R = add(RK_NonTypeTemplateParam, NTTP, Idx);
+        R.name = NTTP->getNameAsString();
+        R.type = qualType(NTTP->getType());
+      } else {
+        add(RK_TemplateTemplateParam, P, Idx).name = P->getNameAsString();
+      }
+    }
+  }
+
+  DeclRecord &add(RecordKind Kind, const void *Ptr) {
+    return add(Kind, Ptr, Parent);
+  }
+
+  DeclRecord &add(RecordKind Kind, const void *Ptr, int P) {
+    Records.emplace_back();
+    DeclRecord &R = Records.back();
+    R.kind = Kind;
+    R.parent = P;
+    R.flags = 0;
+    if (Ptr)
+      R.id = pointerRepr(Ptr);
+    return R;
+  }
+
+  std::string qualType(QualType QT) {
+    return QualType::getAsString(QT.split(), Context.getPrintingPolicy());
+  }
+
+  void setAccess(DeclRecord &R, AccessSpecifier AS) {
+    if (AS == AS_public)
+      R.flags |= RF_Public;
+    else if (AS == AS_protected)
+      R.flags |= RF_Protected;
+  }
+
+  // Like JSONNodeDumper::createQualType, so typedefs resolve the same way
+  void setType(DeclRecord &R, QualType QT) {
+    SplitQualType SQT = QT.split();
+    R.type = QualType::getAsString(SQT, Context.getPrintingPolicy());
+    SplitQualType DSQT = QT.getSplitDesugaredType();
+    if (DSQT != SQT)
+      R.desugared =
+          QualType::getAsString(DSQT, Context.getPrintingPolicy());
+  }
+
+  bool isWanted(const Decl *D) {
+    if (KeepAll)
+      return true;
+    SourceLocation Loc = SM.getExpansionLoc(D->getLocation());
+    if (Loc.isInvalid())
+      return false;
+    if (SM.isInMainFile(Loc))
+      return true;
+    const FileEntry *FE = SM.getFileEntryForID(SM.getFileID(Loc));
+    if (!FE)
+      return false;
+    StringRef Path = FE->tryGetRealPathName();
+    if (Path.empty())
+      Path = FE->getName();
+    for (const std::string &Root : IncludeRoots)
+      if (Path.startswith(Root))
+        return true;
+    return false;
+  }
+
+  ASTContext &Context;
+  SourceManager &SM;
+  const std::vector<std::string> &IncludeRoots;
+  bool KeepAll;
+  std::vector<DeclRecord> &Records;
+  int Parent;
+  bool InClass;
+};
+
+class CollectConsumer : public ASTConsumer {
+public:
+  CollectConsumer(const std::vector<std::string> &IncludeRoots, bool KeepAll,
+                  std::vector<DeclRecord> &Records)
+      : IncludeRoots(IncludeRoots), KeepAll(KeepAll), Records(Records) {}
+
+  void HandleTranslationUnit(ASTContext &Context) override {
+    DeclCollector Collector(Context, IncludeRoots, KeepAll, Records);
+    Collector.TraverseDecl(Context.getTranslationUnitDecl());
+  }
+
+private:
+  const std::vector<std::string> &IncludeRoots;
+  bool KeepAll;
+  std::vector<DeclRecord> &Records;
+};
+
+class CollectAction : public ASTFrontendAction {
+public:
+  CollectAction(const std::vector<std::string> &IncludeRoots, bool KeepAll,
+                std::vector<DeclRecord> &Records)
+      : IncludeRoots(IncludeRoots), KeepAll(KeepAll), Records(Records) {}
+
+  std::unique_ptr<ASTConsumer> CreateASTConsumer(CompilerInstance &,
+                                                 StringRef) override {
+    return std::make_unique<CollectConsumer>(IncludeRoots, KeepAll, Records);
+  }
+
+private:
+  const std::vector<std::string> &IncludeRoots;
+  bool KeepAll;
+  std::vector<DeclRecord> &Records;
+};
+
+class CollectActionFactory : public tooling::FrontendActionFactory {
+public:
+  CollectActionFactory(const std::vector<std::string> &IncludeRoots,
+                       bool KeepAll, std::vector<DeclRecord> &Records)
+      : IncludeRoots(IncludeRoots), KeepAll(KeepAll), Records(Records) {}
+
+  std::unique_ptr<FrontendAction> create() override {
+    return make_collect_action(IncludeRoots, KeepAll, Records);
+  }
+
+private:
+  const std::vector<std::string> &IncludeRoots;
+  bool KeepAll;
+  std::vector<DeclRecord> &Records;
+};
+
+} // namespace
+
+std::unique_ptr<FrontendAction>
+make_collect_action(const std::vector<std::string> &include_roots,
+                    bool keep_all, std::vector<DeclRecord> &records) {
+  return std::make_unique<CollectAction>(include_roots, keep_all, records);
+}
+
+ParseResult collect_decls(const std::string &header,
+                          const std::vector<std::string> &flags,
+                          const std::vector<std::string> &include_roots,
+                          bool keep_all) {
+  // Headers are parsed as C++ like `clang++ -fsyntax-only header.h` would
+  std::vector<std::string> Args{"-xc++"};
+  Args.insert(Args.end(), flags.begin(), flags.end());
+  tooling::FixedCompilationDatabase Compilations(".", Args);
+  tooling::ClangTool Tool(Compilations, {header});
+
+  ParseResult Result;
+  CollectActionFactory Factory(include_roots, keep_all, Result.records);
+  Result.status = Tool.run(&Factory);
+  return Result;
+}
+
+} // namespace cythonator
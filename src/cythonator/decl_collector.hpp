@@ -0,0 +1,81 @@
+#ifndef CYTHONATOR_DECL_COLLECTOR_HPP
+#define CYTHONATOR_DECL_COLLECTOR_HPP
+
+#include <memory>
+#include <string>
+#include <vector>
+
+namespace clang {
+class FrontendAction;
+}
+
+namespace cythonator {
+
+// Kinds of records handed back to Python; see cythonator/_native.pyx for
+// how they are turned into the IR of cythonator/cythonator.py
+enum RecordKind {
+  RK_Namespace = 0,
+  RK_Class,
+  RK_Function,
+  RK_Typedef,
+  RK_Field,
+  RK_Param,
+  RK_TemplateParam,
+  RK_NonTypeTemplateParam,
+  RK_TemplateTemplateParam,
+  RK_Base,
+  RK_VirtualMethod,
+};
+
+enum RecordFlags {
+  RF_PreviouslyDeclared = 1 << 0,
+  RF_Referenced = 1 << 1,
+  RF_ParameterPack = 1 << 2,
+  RF_HasDefault = 1 << 3,
+  RF_Ctor = 1 << 4,
+  RF_Public = 1 << 5,
+  RF_Implicit = 1 << 6,
+  RF_HasName = 1 << 7,
+  RF_Template = 1 << 8,
+  RF_Definition = 1 << 9,
+  RF_HasInner = 1 << 10,
+  RF_Specialization = 1 << 11,
+  RF_Protected = 1 << 12,  // members neither public nor protected are private
+};
+
+// One declaration (or part of one).  Records are stored in pre-order, so
+// a record's parent always comes before it.
+struct DeclRecord {
+  RecordKind kind;
+  int parent;         // index of the enclosing record, -1 for the TU
+  unsigned flags;
+  std::string id;     // same format as the "id" of clang's JSON dump
+  std::string name;
+  std::string type;   // "qualType" as clang's JSON dump would print it
+  std::string desugared;  // "desugaredQualType", empty if it's the same
+  std::string tag;    // tagUsed of classes and template type parameters
+  std::string extra;  // default argument of template type parameters
+};
+
+struct ParseResult {
+  int status;  // return value of the clang tool, 0 on success
+  std::vector<DeclRecord> records;
+};
+
+// Frontend action appending the records of the main file's declarations
+// to `records`.  The arguments must outlive the action.
+std::unique_ptr<clang::FrontendAction>
+make_collect_action(const std::vector<std::string> &include_roots,
+                    bool keep_all, std::vector<DeclRecord> &records);
+
+// Parse `header` as C++ with `flags` and collect the declarations located
+// in it or in headers below one of `include_roots` (all of them if
+// `keep_all` is set).
+ParseResult collect_decls(const std::string &header,
+                          const std::vector<std::string> &flags,
+                          const std::vector<std::string> &include_roots,
+                          bool keep_all);
+
+} // namespace cythonator
+
+#endif
@@ -0,0 +1,131 @@
+#include "parse_session.hpp"
+
+#include "clang/Basic/DiagnosticOptions.h"
+#include "clang/Basic/FileManager.h"
+#include "clang/Frontend/CompilerInstance.h"
+#include "clang/Frontend/CompilerInvocation.h"
+#include "clang/Frontend/FrontendAction.h"
+#include "clang/Frontend/PrecompiledPreamble.h"
+#include "clang/Frontend/Utils.h"
+#include "clang/Lex/PreprocessorOptions.h"
+#include "clang/Serialization/PCHContainerOperations.h"
+#include "llvm/Support/VirtualFileSystem.h"
+#include "llvm/Support/raw_ostream.h"
+
+#include <map>
+
+using namespace clang;
+
+namespace cythonator {
+
+struct ParseSession::Impl {
+  struct CachedPreamble {
+    std::string Text; // the bytes of the header the preamble covers
+    std::unique_ptr<PrecompiledPreamble> Preamble;
+  };
+
+  Impl(const std::vector<std::string> &Flags,
+       const std::vector<std::string> &IncludeRoots, bool KeepAll)
+      : Flags(Flags), IncludeRoots(IncludeRoots), KeepAll(KeepAll),
+        FS(llvm::vfs::getRealFileSystem()),
+        PCHOps(std::make_shared<PCHContainerOperations>()),
+        PreambleBuilds(0) {
+    resetFiles();
+  }
+
+  void resetFiles() { Files = new FileManager(FileSystemOptions(), FS); }
+
+  std::vector<std::string> Flags;
+  std::vector<std::string> IncludeRoots;
+  bool KeepAll;
+  IntrusiveRefCntPtr<llvm::vfs::FileSystem> FS;
+  IntrusiveRefCntPtr<FileManager> Files;
+  std::shared_ptr<PCHContainerOperations> PCHOps;
+  std::map<std::string, CachedPreamble> Preambles;
+  unsigned PreambleBuilds;
+};
+
+ParseSession::ParseSession(const std::vector<std::string> &flags,
+                           const std::vector<std::string> &include_roots,
+                           bool keep_all)
+    : P(std::make_unique<Impl>(flags, include_roots, keep_all)) {}
+
+ParseSession::~ParseSession() = default;
+
+unsigned ParseSession::preamble_builds() const { return P->PreambleBuilds; }
+
+void ParseSession::invalidate() {
+  P->Preambles.clear();
+  P->resetFiles();
+}
+
+ParseResult ParseSession::parse(const std::string &header) {
+  ParseResult Result;
+  Result.status = 1;
+
+  // Same command line collect_decls() hands to the ClangTool
+  std::vector<const char *> Argv{"clang-tool", "-xc++", "-fsyntax-only"};
+  for (const std::string &F : P->Flags)
+    Argv.push_back(F.c_str());
+  Argv.push_back(header.c_str());
+  IntrusiveRefCntPtr<DiagnosticsEngine> Diags =
+      CompilerInstance::createDiagnostics(new DiagnosticOptions);
+  std::shared_ptr<CompilerInvocation> CI =
+      createInvocationFromCommandLine(Argv, Diags, P->FS);
+  if (!CI)
+    return Result;
+  // The driver asks to leak everything on exit, we keep running
+  CI->getFrontendOpts().DisableFree = false;
+
+  // Read the header itself rather than through the FileManager, whose
+  // cached size of it is stale when it was edited since the last parse
+  auto Buffer = P->FS->getBufferForFile(header);
+  if (!Buffer) {
+    llvm::errs() << "error: cannot read '" << header
+                 << "': " << Buffer.getError().message() << "\n";
+    return Result;
+  }
+
+  PreambleBounds Bounds =
+      ComputePreambleBounds(*CI->getLangOpts(), Buffer->get(), 0);
+  Impl::CachedPreamble &Cached = P->Preambles[header];
+  std::string Text = Buffer->get()->getBuffer().substr(0, Bounds.Size).str();
+  if (!Cached.Preamble ||
+      !Cached.Preamble->CanReuse(*CI, Buffer->get(), Bounds, P->FS.get())) {
+    // Same #includes but a stale preamble: something they pull in changed
+    // and the FileManager's view of it is out of date as well
+    if (Cached.Preamble && Cached.Text == Text)
+      P->resetFiles();
+    Cached.Preamble.reset();
+    Cached.Text = std::move(Text);
+
+    PreambleCallbacks Callbacks;
+    auto Built = PrecompiledPreamble::Build(
+        *CI, Buffer->get(), Bounds, *Diags, P->FS, P->PCHOps,
+        /*StoreInMemory=*/false, Callbacks);
+    ++P->PreambleBuilds;
+    // Without a preamble the whole header is parsed, which still works
+    if (Built)
+      Cached.Preamble =
+          std::make_unique<PrecompiledPreamble>(std::move(*Built));
+  }
+
+  // The preamble is kept in a file, so this doesn't swap the file system
+  // out from under the shared FileManager
+  IntrusiveRefCntPtr<llvm::vfs::FileSystem> VFS = P->FS;
+  if (Cached.Preamble)
+    Cached.Preamble->AddImplicitPreamble(*CI, VFS, Buffer->get());
+  CI->getPreprocessorOpts().addRemappedFile(header, Buffer->release());
+
+  CompilerInstance Clang(P->PCHOps);
+  Clang.setInvocation(std::move(CI));
+  Clang.createDiagnostics();
+  Clang.setFileManager(P->Files.get());
+
+  std::unique_ptr<FrontendAction> Action =
+      make_collect_action(P->IncludeRoots, P->KeepAll, Result.records);
+  Result.status = Clang.ExecuteAction(*Action) ? 0 : 1;
+  return Result;
+}
+
+} // namespace cythonator
@@ -0,0 +1,41 @@
+#ifndef CYTHONATOR_PARSE_SESSION_HPP
+#define CYTHONATOR_PARSE_SESSION_HPP
+
+#include "decl_collector.hpp"
+
+#include <memory>
+#include <string>
+#include <vector>
+
+namespace cythonator {
+
+// State kept alive across parses of many headers with the same flags: one
+// FileManager (and with it the stat cache and header search lookups) and
+// a precompiled preamble per header.  A session must not be used by two
+// threads at the same time.
+class ParseSession {
+public:
+  ParseSession(const std::vector<std::string> &flags,
+               const std::vector<std::string> &include_roots, bool keep_all);
+  ~ParseSession();
+
+  // Same as collect_decls(header, flags, include_roots, keep_all), but
+  // when the preamble of `header` (the leading #includes) has not changed
+  // since the last parse only the rest of the file is parsed again.
+  ParseResult parse(const std::string &header);
+
+  // Forget cached file system state and preambles, e.g., after headers
+  // included by the preambles changed on disk.
+  void invalidate();
+
+  // Number of preambles (re)built so far; for testing.
+  unsigned preamble_builds() const;
+
+private:
+  struct Impl;
+  std::unique_ptr<Impl> P;
+};
+
+} // namespace cythonator
+
+#endif
@@ -52,6 +52,10 @@ static cl::opt<std::string> ASTDumpFilter(
     "ast-dump-filter",
     cl::desc(Options.getOptionHelpText(options::OPT_ast_dump_filter)),
     cl::cat(ClangCheckCategory));
+static cl::opt<bool>
+    DeclsOnly("decls-only",
+              cl::desc("Skip function bodies; only parse and dump declarations"),
+              cl::cat(ClangCheckCategory));
 static cl::opt<bool>
     Analyze("analyze",
             cl::desc(Options.getOptionHelpText(options::OPT_analyze)),
@@ -158,6 +162,13 @@ int simple(int argc, const char **argv) {
   Tool.appendArgumentsAdjuster(getInsertArgumentAdjuster(
       Analyze ? "--analyze" : "-fsyntax-only", ArgumentInsertPosition::BEGIN));
 
+  // Bodies are never looked at when generating declarations, so don't
+  // bother parsing (or dumping) them.
+  if (DeclsOnly)
+    Tool.appendArgumentsAdjuster(getInsertArgumentAdjuster(
+        CommandLineArguments{"-Xclang", "-skip-function-bodies"},
+        ArgumentInsertPosition::END));
+
   ClangCheckActionFactory CheckFactory;
   std::unique_ptr<FrontendActionFactory> FrontendFactory;
 
@@ -0,0 +1,101 @@
+'''Tests on the thread-safe library API.'''
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from cythonator.cythonator import (
+    Config, Result, default_clang, handle_class, run, _convert_parallel)
+from cythonator.diagnostics import collecting, report
+
+
+def _virtual_class(id, name):
+    return {'id': id, 'kind': 'CXXRecordDecl', 'name': name,
+            'tagUsed': 'struct', 'inner': [
+                {'id': f'{id}m', 'kind': 'CXXMethodDecl', 'name': 'f',
+                 'virtual': True, 'type': {'qualType': 'void ()'}}]}
+
+
+class TestConfig(unittest.TestCase):
+    def test_immutable(self):
+        config = Config(extra_flags=['-DX'], include_roots=['a'])
+        self.assertEqual(config.extra_flags, ('-DX',))
+        self.assertEqual(config._replace(extra_flags=['-DY']).extra_flags,
+                         ('-DY',))
+        with self.assertRaises(AttributeError):
+            config.stream = True
+
+    def test_default_clang(self):
+        with mock.patch.dict(os.environ, {'CYTHONATOR_CLANG': 'my-clang'}):
+            self.assertEqual(default_clang(), 'my-clang')
+        with mock.patch.dict(os.environ, {'CYTHONATOR_CLANG': ''}), \
+                mock.patch('shutil.which', return_value=None):
+            self.assertEqual(default_clang(), 'clang++-10')
+
+
+class TestDiagnostics(unittest.TestCase):
+    def test_collect(self):
+        with collecting() as diagnostics:
+            handle_class(_virtual_class('0x1', 'A'))
+        self.assertEqual(len(diagnostics), 1)
+        self.assertEqual(diagnostics[0].severity, 'warning')
+        self.assertEqual(diagnostics[0].id, '0x1')
+
+    def test_warn_outside(self):
+        with self.assertWarns(UserWarning):
+            report('warning', 'not collected')
+
+    def test_unnamed_class(self):
+        with collecting() as diagnostics:
+            self.assertIsNone(handle_class(
+                {'id': '0x1', 'kind': 'CXXRecordDecl', 'tagUsed': 'struct'}))
+        self.assertEqual([d.id for d in diagnostics], ['0x1'])
+
+    def test_threads(self):
+        found = {}
+
+        def convert(name):
+            with collecting() as diagnostics:
+                for ii in range(50):
+                    handle_class(_virtual_class(f'{name}{ii}', name))
+            found[name] = diagnostics
+
+        threads = [threading.Thread(target=convert, args=(name,))
+                   for name in 'ABCD']
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for name, diagnostics in found.items():
+            self.assertEqual([d.id for d in diagnostics],
+                             [f'{name}{ii}' for ii in range(50)])
+
+    def test_from_processes(self):
+        nodes = [_virtual_class(f'0x{ii}', f'C{ii}') for ii in range(8)]
+        with collecting() as diagnostics:
+            _convert_parallel(nodes, 2, False, None)
+        self.assertEqual([d.id for d in diagnostics],
+                         [n['id'] for n in nodes])
+
+
+class TestRun(unittest.TestCase):
+    def test_run(self):
+        with tempfile.NamedTemporaryFile(suffix='.hpp') as fp:
+            fp.write(b'struct A { virtual void f(); };')
+            fp.flush()
+            res = run(fp.name, Config(decls_only=True))
+        self.assertIsInstance(res, Result)
+        self.assertEqual(res.ir.children[0].name, 'A')
+        self.assertEqual([d.severity for d in res.diagnostics], ['warning'])
+
+    def test_session(self):
+        session = mock.Mock()
+        res = run('test.hpp', Config(session=session))
+        session.parse.assert_called_once_with('test.hpp')
+        self.assertIs(res.ir, session.parse.return_value)
+
+
+if __name__ == '__main__':
+    unittest.main()
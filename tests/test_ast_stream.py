@@ -0,0 +1,78 @@
+'''Tests on incremental reading of the JSON AST dump.'''
+
+import io
+import json
+import unittest
+
+from cythonator.ast_stream import iter_ast_nodes
+from cythonator.write_cython import write_pxd
+from .utils import _code_runner
+
+
+def _tu(inner, indent=2):
+    return json.dumps({
+        'id': '0x1',
+        'kind': 'TranslationUnitDecl',
+        'loc': {},
+        'range': {'begin': {}, 'end': {}},
+        'inner': inner,
+    }, indent=indent)
+
+
+class TestIterAstNodes(unittest.TestCase):
+    def setUp(self):
+        self.inner = [
+            {'id': '0x2', 'kind': 'TypedefDecl', 'name': 'myInt',
+             'type': {'qualType': 'int'}},
+            {'id': '0x3', 'kind': 'NamespaceDecl', 'name': 'ns', 'inner': [
+                {'id': '0x4', 'kind': 'FunctionDecl', 'name': 'f{[,]}',
+                 'type': {'qualType': 'void (int)'}},
+            ]},
+            {'id': '0x5', 'kind': 'FunctionDecl', 'name': 'g',
+             'type': {'qualType': 'double ()'}},
+        ]
+
+    def test_all_nodes_in_order(self):
+        nodes = list(iter_ast_nodes(io.StringIO(_tu(self.inner))))
+        self.assertEqual(nodes, self.inner)
+
+    def test_tiny_chunks(self):
+        # nodes straddle many reads
+        for chunk_size in (1, 2, 7):
+            nodes = list(iter_ast_nodes(
+                io.StringIO(_tu(self.inner)), chunk_size=chunk_size))
+            self.assertEqual(nodes, self.inner)
+
+    def test_compact(self):
+        nodes = list(iter_ast_nodes(
+            io.StringIO(_tu(self.inner, indent=None)), chunk_size=3))
+        self.assertEqual(nodes, self.inner)
+
+    def test_empty_inner(self):
+        self.assertEqual(list(iter_ast_nodes(io.StringIO(_tu([])))), [])
+
+    def test_lazy(self):
+        it = iter_ast_nodes(io.StringIO(_tu(self.inner)), chunk_size=16)
+        self.assertEqual(next(it)['name'], 'myInt')
+
+    def test_truncated(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_ast_nodes(io.StringIO(_tu(self.inner)[:-40])))
+
+
+class TestStreamingCythonator(unittest.TestCase):
+    def test_same_as_batch(self):
+        code = [
+            'typedef int myInt;',
+            'namespace ns { struct S { int a; }; void f(S s); }',
+            'double g(myInt i);',
+        ]
+        # clang ids are addresses and change between runs, so compare
+        # the generated declarations instead
+        self.assertEqual(
+            write_pxd(_code_runner(code, stream=True), 'test.hpp'),
+            write_pxd(_code_runner(code), 'test.hpp'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+'''Tests on caching the IR of headers.'''
+
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from cythonator.cache import IRCache
+from cythonator.cythonator import Namespace, cythonator
+
+
+class TestIRCache(unittest.TestCase):
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.d = pathlib.Path(self._tmpdir.name)
+        self.header = self.d / 'a.hpp'
+        self.header.write_text('#include "b.hpp"\nvoid f(int x);\n')
+        self.dep = self.d / 'b.hpp'
+        self.dep.write_text('typedef int myInt;\n')
+        self.depfile = self.d / 'a.d'
+        self.depfile.write_text(f'a.o: {self.header} {self.dep}\n')
+        self.ir = Namespace(id='_global_namespace', name='', children=[])
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def test_hit_and_stale(self):
+        cache = IRCache(self.d / 'cache')
+        key = cache.key(str(self.header), 'clang++', ['-DFOO'])
+        self.assertIsNone(cache.get(key))
+        cache.put(key, self.ir, self.depfile)
+        self.assertEqual(cache.get(key), self.ir)
+
+        # touching an include is fine, changing it is not
+        os.utime(self.dep, ns=(0, 0))
+        self.assertEqual(cache.get(key), self.ir)
+        self.dep.write_text('typedef long myInt;\n')
+        self.assertIsNone(cache.get(key))
+
+        # flags and header contents are part of the key
+        self.assertNotEqual(
+            cache.key(str(self.header), 'clang++', ['-DBAR']), key)
+        self.header.write_text('void g();\n')
+        self.assertNotEqual(
+            cache.key(str(self.header), 'clang++', ['-DFOO']), key)
+
+    def test_converter_version(self):
+        cache = IRCache(self.d / 'cache')
+        key = cache.key(str(self.header), 'clang++', [])
+        with mock.patch('cythonator.cache.converter_fingerprint',
+                        return_value='other version'):
+            self.assertNotEqual(
+                cache.key(str(self.header), 'clang++', []), key)
+
+    def test_evict_when_full(self):
+        cache = IRCache(self.d / 'cache')
+        with mock.patch.object(cache, 'evict', wraps=cache.evict) as m:
+            for flag in ['-DA', '-DB', '-DC']:
+                cache.put(cache.key(str(self.header), 'clang++', [flag]),
+                          self.ir, self.depfile)
+            # the first put finds out how big the cache is
+            self.assertEqual(m.call_count, 1)
+            cache.max_size = 0
+            cache.put(cache.key(str(self.header), 'clang++', []),
+                      self.ir, self.depfile)
+            self.assertEqual(m.call_count, 2)
+        self.assertEqual(list(cache.root.glob('*/*.pickle')), [])
+
+    def test_evict(self):
+        cache = IRCache(self.d / 'cache', max_size=0)
+        key = cache.key(str(self.header), 'clang++', [])
+        cache.put(key, self.ir, self.depfile)
+        self.assertIsNone(cache.get(key))
+
+
+class TestCachedCythonator(unittest.TestCase):
+    def test_cached(self):
+        with tempfile.TemporaryDirectory() as d:
+            header = pathlib.Path(d) / 'test.hpp'
+            header.write_text('void f(int x);\n')
+            ns = cythonator(str(header), cache=True, cache_dir=d)
+            self.assertEqual(len(list(pathlib.Path(d).glob('ir/*/*'))), 1)
+            self.assertEqual(
+                cythonator(str(header), cache=True, cache_dir=d), ns)
+
+
+if __name__ == '__main__':
+    unittest.main()
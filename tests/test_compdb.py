@@ -0,0 +1,92 @@
+'''Tests on reading flags from compilation databases.'''
+
+import json
+import pathlib
+import tempfile
+import unittest
+
+from cythonator.compdb import (
+    load_compdb, header_flags, find_command, group_headers)
+
+
+class TestCompdb(unittest.TestCase):
+    def test_header_flags(self):
+        args = ['g++', '-Iinclude', '-I', '/abs', '-isystem', '../ext',
+                '-DFOO=1', '-D', 'BAR', '-std=c++17', '-O2', '-Wall',
+                '-fPIC', '-c', '-o', 'foo.o', 'src/foo.cpp']
+        self.assertEqual(header_flags(args, '/proj/build'), (
+            '-I', '/proj/build/include', '-I', '/abs',
+            '-isystem', '/proj/ext', '-DFOO=1', '-DBAR', '-std=c++17'))
+
+    def test_standard_library(self):
+        args = ['clang++', '-stdlib=libc++', '-nostdinc++', '-c', 'a.cpp']
+        self.assertEqual(header_flags(args, '/proj'),
+                         ('-stdlib=libc++', '-nostdinc++'))
+
+    def test_target(self):
+        for args, flags in [
+                (['-target', 'arm64-apple-macos'],
+                 ('-target', 'arm64-apple-macos')),
+                (['--target=arm64-apple-macos'],
+                 ('--target=arm64-apple-macos',)),
+                (['-m32'], ('-m32',))]:
+            self.assertEqual(header_flags(['cc'] + args, '/proj'), flags)
+
+    def test_sysroot(self):
+        for args, flags in [
+                (['-isysroot', 'sdk'], ('-isysroot', '/proj/sdk')),
+                (['-isysroot/sdk'], ('-isysroot', '/sdk')),
+                (['--sysroot', 'sdk'], ('--sysroot=/proj/sdk',)),
+                (['--sysroot=/sdk'], ('--sysroot=/sdk',))]:
+            self.assertEqual(header_flags(['cc'] + args, '/proj'), flags)
+
+    def test_language(self):
+        for args, flags in [
+                (['-x', 'c++'], ('-x', 'c++')),
+                (['-xc++'], ('-x', 'c++')),
+                (['-Xclang', '-fno-validate-pch'],
+                 ('-Xclang', '-fno-validate-pch')),
+                (['-fno-exceptions', '-fno-rtti'],
+                 ('-fno-exceptions', '-fno-rtti'))]:
+            self.assertEqual(header_flags(['cc'] + args, '/proj'), flags)
+
+    def test_codegen_flags_dropped(self):
+        args = ['cc', '-fPIC', '-fsanitize=address',
+                '-fno-omit-frame-pointer', '-march=native', '-O2', '-g',
+                '-fcolor-diagnostics', '-std=c++17', '-c', 'a.cpp']
+        self.assertEqual(header_flags(args, '/proj'), ('-std=c++17',))
+
+    def test_load_and_group(self):
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            (d / 'compile_commands.json').write_text(json.dumps([
+                {'directory': str(d), 'file': 'a/foo.cpp',
+                 'command': 'c++ -Ia -std=c++14 -c a/foo.cpp'},
+                {'directory': str(d), 'file': 'a/bar.cpp',
+                 'arguments': ['c++', '-Ia', '-std=c++14', '-c',
+                               'a/bar.cpp']},
+                {'directory': str(d), 'file': 'b/baz.cpp',
+                 'arguments': ['c++', '-Ib', '-DBAZ', '-c', 'b/baz.cpp']},
+            ]))
+            for sub in 'ab':
+                (d / sub).mkdir()
+            db = load_compdb(str(d))
+            self.assertEqual(len(db), 3)
+
+            # same stem first, then the closest source file
+            self.assertEqual(
+                find_command(str(d / 'a/foo.hpp'), db)[0][-1], 'a/foo.cpp')
+            self.assertEqual(
+                find_command(str(d / 'b/other.hpp'), db)[0][-1], 'b/baz.cpp')
+
+            headers = [str(d / 'a/foo.hpp'), str(d / 'b/x.hpp'),
+                       str(d / 'a/bar.hpp')]
+            groups = group_headers(headers, db)
+            self.assertEqual(list(groups.values()), [
+                [headers[0], headers[2]], [headers[1]]])
+            self.assertEqual(list(groups)[1], (
+                '-I', str(d / 'b'), '-DBAZ'))
+
+
+if __name__ == '__main__':
+    unittest.main()
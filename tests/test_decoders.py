@@ -0,0 +1,85 @@
+'''Tests on the JSON decoder backends.'''
+
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from cythonator.cythonator import _iter_toplevel
+from cythonator.decoders import available_backends, get_decoder, load_file
+from cythonator.diagnostics import collecting
+
+
+class TestDecoders(unittest.TestCase):
+    def setUp(self):
+        self.ast = {'kind': 'TranslationUnitDecl', 'inner': [
+            {'kind': 'FunctionDecl', 'name': 'fé'}]}
+        self.data = json.dumps(self.ast).encode()
+
+    def test_backends_agree(self):
+        for backend in available_backends():
+            loads = get_decoder(backend)
+            self.assertEqual(loads(self.data), self.ast)
+
+    def test_mmap(self):
+        for backend in available_backends():
+            with tempfile.TemporaryFile() as fp:
+                fp.write(self.data)
+                fp.flush()
+                self.assertEqual(load_file(fp, get_decoder(backend)), self.ast)
+
+    def test_memoryview(self):
+        for backend in available_backends():
+            with memoryview(self.data) as view:
+                self.assertEqual(get_decoder(backend)(view), self.ast)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_decoder('yaml')
+
+    def test_auto(self):
+        self.assertEqual(get_decoder('auto')(self.data), self.ast)
+
+
+class TestCapture(unittest.TestCase):
+    def _clang(self, out, status):
+        # stands in for clang writing `out` and exiting with `status`
+        return [sys.executable, '-c',
+                f'import sys; sys.stdout.write({out!r}); sys.exit({status})']
+
+    def test_failed(self):
+        for stream, capture in [(False, 'pipe'), (False, 'file'),
+                                (True, 'pipe')]:
+            with self.assertRaises(subprocess.CalledProcessError):
+                list(_iter_toplevel(self._clang('', 1), stream, 'stdlib',
+                                    capture))
+
+    def test_errors(self):
+        out = json.dumps({'kind': 'TranslationUnitDecl', 'inner': [
+            {'kind': 'FunctionDecl', 'name': 'f'}]})
+        for stream, capture in [(False, 'pipe'), (False, 'file'),
+                                (True, 'pipe')]:
+            with collecting() as diagnostics:
+                nodes = list(_iter_toplevel(
+                    self._clang(out, 1), stream, 'stdlib', capture))
+            self.assertEqual(nodes[0]['name'], 'f')
+            self.assertEqual([d.severity for d in diagnostics], ['warning'])
+
+    def test_stream_cut_short(self):
+        out = json.dumps({'kind': 'TranslationUnitDecl', 'inner': [
+            {'kind': 'FunctionDecl', 'name': 'f'},
+            {'kind': 'FunctionDecl', 'name': 'g'}]})
+        cut = out[:out.index('"g"')]
+        with collecting() as diagnostics:
+            nodes = list(_iter_toplevel(
+                self._clang(cut, 1), True, 'stdlib', 'pipe'))
+        self.assertEqual([n['name'] for n in nodes], ['f'])
+        self.assertEqual([d.severity for d in diagnostics], ['warning'])
+        # a malformed dump isn't clang's fault if it didn't fail
+        with self.assertRaises(ValueError):
+            list(_iter_toplevel(self._clang(cut, 0), True, 'stdlib', 'pipe'))
+
+
+if __name__ == '__main__':
+    unittest.main()
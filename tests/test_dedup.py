@@ -0,0 +1,141 @@
+'''Tests on merging redeclarations.'''
+
+import time
+import unittest
+
+from cythonator.cythonator import (
+    Namespace, Class, Function, Method, Param, TemplateParam, Typedef)
+from cythonator.dedup import dedup, signature
+from cythonator.qualtype import parse_qualtype, with_canonical
+from cythonator.typedefs import resolve_types
+from .utils import _code_runner
+
+
+def _class(id, name, methods=(), children=()):
+    return Class(id=id, name=name, is_struct=True, methods=list(methods),
+                 fields=[], templateparams=(), bases=[], typedefs=[],
+                 children=list(children))
+
+
+def _function(id, name, *params, templated=False, specialization=False):
+    templateparams = ()
+    if templated:
+        templateparams = [TemplateParam(
+            id=f'{id}t', name='T', referenced=True, tag_used='class',
+            default=None, is_parameter_pack=False)]
+    return Function(
+        id=id, name=name, previously_declared=False,
+        return_type=parse_qualtype('void'), templateparams=templateparams,
+        params=[Param(id=f'{id}p{ii}', name=f'x{id}', type=p)
+                for ii, p in enumerate(params)],
+        is_specialization=specialization)
+
+
+INT = parse_qualtype('int')
+MY_INT = with_canonical(parse_qualtype('myInt'), INT)
+
+
+class TestDedup(unittest.TestCase):
+    def test_functions(self):
+        ns = Namespace(id='_global_namespace', name='', children=[
+            _function('0x1', 'f', INT),
+            _function('0x2', 'f', parse_qualtype('double')),
+            _function('0x3', 'f', MY_INT),
+            _function('0x4', 'g', INT),
+        ])
+        self.assertEqual(signature(ns.children[0]),
+                         signature(ns.children[2]))
+        self.assertEqual([c.id for c in dedup(ns).children],
+                         ['0x1', '0x2', '0x4'])
+
+    def test_specializations(self):
+        ns = Namespace(id='_global_namespace', name='', children=[
+            _function('0x1', 'f', parse_qualtype('T'), templated=True),
+            _function('0x2', 'f', parse_qualtype('int *'),
+                      specialization=True),
+            _function('0x3', 'g', INT, specialization=True),
+        ])
+        self.assertEqual([c.id for c in dedup(ns).children], ['0x1', '0x3'])
+
+    def test_forward_declared_class(self):
+        method = Method(function=_function('0x4', 'm'), is_ctor=False)
+        ns = Namespace(id='_global_namespace', name='', children=[
+            _class('0x1', 'A'),
+            Typedef(id='0x2', name='B', type=parse_qualtype('A'),
+                    referenced=True),
+            _class('0x3', 'A', methods=[method, method]),
+        ])
+        res = dedup(ns)
+        self.assertEqual([c.id for c in res.children], ['0x3', '0x2'])
+        self.assertEqual(res.children[0].methods, [method])
+
+    def test_member_typedefs(self):
+        def cls(id, name, aliased, methods=()):
+            return _class(id, name, methods=methods)._replace(typedefs=[
+                Typedef(id=f'{id}t', name='value_type',
+                        type=parse_qualtype(aliased), referenced=True)])
+
+        value_type = parse_qualtype('value_type')
+        ns = resolve_types(Namespace(
+            id='_global_namespace', name='', children=[
+                cls('0x1', 'A', 'int'),
+                cls('0x2', 'B', 'double', methods=[
+                    Method(function=_function('0x3', 'set', value_type),
+                           is_ctor=False),
+                    Method(function=_function('0x4', 'set', INT),
+                           is_ctor=False)]),
+            ]))
+        # B::value_type is double, so these are different overloads
+        res = dedup(ns)
+        self.assertEqual(
+            [m.function.id for m in res.children[1].methods], ['0x3', '0x4'])
+
+    def test_reopened_namespaces(self):
+        ns = Namespace(id='_global_namespace', name='', children=[
+            Namespace(id='0x1', name='ns', children=[
+                _function('0x2', 'f', INT)]),
+            Namespace(id='0x3', name='ns', children=[
+                _function('0x4', 'f', INT), _function('0x5', 'f')]),
+        ])
+        res = dedup(ns)
+        self.assertEqual([c.id for c in res.children[1].children], ['0x5'])
+
+    def test_headers(self):
+        a = Namespace(id='_global_namespace', name='', children=[
+            _class('0x1', 'A')])
+        b = a._replace(children=[_class('0x2', 'A', children=[
+            _class('0x3', 'B')])])
+        res = dedup({'a.hpp': a, 'b.hpp': b})
+        self.assertEqual([c.id for c in res['a.hpp'].children], ['0x2'])
+        self.assertEqual(res['b.hpp'].children, [])
+
+    def test_linear(self):
+        def run(n):
+            ns = Namespace(id='_global_namespace', name='', children=[
+                _function(str(ii), 'f', parse_qualtype(f'T{ii % (n // 2)}'))
+                for ii in range(n)])
+            tic = time.perf_counter()
+            res = dedup(ns)
+            self.assertEqual(len(res.children), n // 2)
+            return time.perf_counter() - tic
+        small, large = run(2000), run(20000)
+        # quadratic would be 100 times slower
+        self.assertLess(large, small * 40)
+
+
+class TestDedupCythonator(unittest.TestCase):
+    def test_redeclarations(self):
+        ns = _code_runner([
+            'struct A;',
+            'void f(A* a);',
+            'struct A { int x; };',
+            'void f(A* b);',
+            'template<class T> void g(T t);',
+            'template<> void g(int* t);',
+        ])
+        self.assertEqual([c.name for c in ns.children], ['A', 'f', 'g'])
+        self.assertEqual(ns.children[0].fields[0].name, 'x')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+'''Tests on writing PXD files as they are generated.'''
+
+import io
+import pathlib
+import unittest
+from unittest import mock
+
+from cythonator.cythonator import Namespace, _convert_toplevel
+from cythonator.parallel import iter_shards
+from cythonator.write_cython import (
+    emit_pxd, iter_pxd, iter_pxd_headers, write_pxd, write_pxd_headers)
+
+
+def _struct(id, name, nested=()):
+    return {'id': id, 'kind': 'CXXRecordDecl', 'name': name,
+            'tagUsed': 'struct', 'inner': [
+                {'id': f'{id}f', 'kind': 'FieldDecl', 'name': 'x',
+                 'type': {'qualType': 'std::vector<std::vector<int> >'}},
+                {'id': f'{id}t', 'kind': 'TypedefDecl', 'name': 'vv',
+                 'type': {'qualType': 'std::vector<std::vector<int> >'}},
+            ] + list(nested)}
+
+
+NODES = [
+    _struct('0x1', 'A', [_struct('0x2', 'B')]),
+    {'id': '0x3', 'kind': 'NamespaceDecl', 'name': 'ns', 'inner': [
+        _struct('0x4', 'C'),
+        {'id': '0x5', 'kind': 'FunctionDecl', 'name': 'f',
+         'type': {'qualType': 'int (int)'}}]},
+]
+
+
+def _global(nodes):
+    return Namespace(id='_global_namespace', name='', children=[
+        _convert_toplevel(node) for node in nodes])
+
+
+class TestEmit(unittest.TestCase):
+    def setUp(self):
+        self.namespaces = {'a.hpp': _global(NODES), 'b.hpp': _global([
+            _struct('0x6', 'D')])}
+        self.pxd = write_pxd_headers(self.namespaces)
+
+    def test_lines(self):
+        lines = list(iter_pxd(self.namespaces['a.hpp'], 'a.hpp'))
+        self.assertTrue(all(line.endswith('\n') for line in lines))
+        self.assertEqual(''.join(lines),
+                         write_pxd(self.namespaces['a.hpp'], 'a.hpp'))
+
+    def test_stream(self):
+        fp = io.StringIO()
+        self.assertEqual(emit_pxd(self.namespaces, fp), len(self.pxd))
+        self.assertEqual(fp.getvalue(), self.pxd)
+
+    def test_generator(self):
+        received = []
+
+        def sink():
+            while True:
+                received.append((yield))
+
+        emit_pxd(self.namespaces, sink())
+        self.assertEqual(''.join(received), self.pxd)
+
+    def test_callable(self):
+        received = []
+        emit_pxd(list(self.namespaces.items()), received.append)
+        self.assertEqual(''.join(received), self.pxd)
+
+    def test_jobs(self):
+        received = []
+        emit_pxd(self.namespaces, received.append, jobs=2)
+        self.assertEqual(''.join(received), self.pxd)
+
+    def test_jobs_in_batches(self):
+        received = []
+        with mock.patch('cythonator.write_cython._BATCH', 1), \
+                mock.patch('cythonator.write_cython.iter_shards',
+                           wraps=iter_shards) as m:
+            emit_pxd(self.namespaces, received.append, jobs=2)
+        self.assertEqual(''.join(received), self.pxd)
+        # at most jobs * _BATCH declarations are handed out at a time
+        self.assertGreater(m.call_count, 1)
+        self.assertTrue(all(len(c[0][1]) <= 2 for c in m.call_args_list))
+
+    def test_incremental(self):
+        # pieces are generated as they are asked for
+        pieces = iter_pxd_headers(self.namespaces)
+        first = next(pieces) + next(pieces)
+        self.assertEqual(first, self.pxd[:len(first)])
+        self.assertIn('cppclass A', first)
+
+    def test_unknown_sink(self):
+        with self.assertRaises(ValueError):
+            emit_pxd(self.namespaces, 42)
+
+
+class TestExternBlocks(unittest.TestCase):
+    def setUp(self):
+        funs = [{'id': f'0x{ii}', 'kind': 'FunctionDecl', 'name': f'f{ii}',
+                 'type': {'qualType': 'void (int)'}} for ii in range(100)]
+        self.ns = _global(funs[:50] + [
+            {'id': '0x1000', 'kind': 'NamespaceDecl', 'name': 'ns',
+             'inner': funs[:10]}] + funs[50:])
+
+    def test_one_per_namespace(self):
+        pxd = write_pxd(self.ns._replace(children=self.ns.children[:50]),
+                        'a.hpp')
+        self.assertEqual(pxd.count('cdef extern'), 1)
+        self.assertEqual(pxd.count('cdef void'), 50)
+
+    def test_nested_namespace(self):
+        # declarations stay in order, so the outer block is reopened
+        lines = [line for line in write_pxd(self.ns, 'a.hpp').splitlines()
+                 if line.startswith('cdef extern')]
+        self.assertEqual(len(lines), 3)
+        self.assertIn('namespace "ns"', lines[1])
+        self.assertEqual(lines[0], lines[2])
+
+    def test_headers(self):
+        namespaces = {'a.hpp': self.ns, 'b.hpp': _global(NODES[:1])}
+        with mock.patch.object(pathlib.Path, 'resolve',
+                               autospec=True, side_effect=lambda p: p) as m:
+            write_pxd_headers(namespaces)
+        self.assertEqual(m.call_count, 2)
+        pxd = write_pxd_headers(namespaces)
+        self.assertEqual(pxd.count('cdef extern'), 4)
+        self.assertEqual(write_pxd_headers(namespaces, jobs=2), pxd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -204,5 +204,25 @@ class TestFunctionsWithArgs(unittest.TestCase):
         ])
         # print(f)
 
+
+class TestDeclsOnly(unittest.TestCase):
+    def test_bodies_skipped(self):
+        code = [
+            'int fun(int a, double b) { int c = a*2; return c + b; }',
+            'struct S {',
+            '    S(int a) : m(a) { if (a) { m++; } }',
+            '    int get() const { return m; }',
+            '    int m = 0;',
+            '};',
+        ]
+        ns = _code_runner(code, decls_only=True)
+        self.assertEqual(len(ns.children), 2)
+        fun, s = ns.children
+        self.assertEqual(fun.name, 'fun')
+        self.assertEqual([p.name for p in fun.params], ['a', 'b'])
+        self.assertEqual(len(s.methods), 2)
+        self.assertEqual(s.fields[0].name, 'm')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+'''Tests on dispatching AST nodes to handlers.'''
+
+import copy
+import unittest
+from collections import namedtuple
+
+from cythonator.cythonator import (
+    handle_class, handle_namespace, register_handler,
+    _NAMESPACE_HANDLERS, _CLASS_HANDLERS)
+
+Enum = namedtuple('Enum', 'id name')
+
+
+def _method(id, name, **kwargs):
+    return {'id': id, 'kind': 'CXXMethodDecl', 'name': name,
+            'type': {'qualType': 'void ()'}, **kwargs}
+
+
+def _field(id, name):
+    return {'id': id, 'kind': 'FieldDecl', 'name': name,
+            'type': {'qualType': 'int'}}
+
+
+CLASS = {
+    'id': '0x1', 'kind': 'CXXRecordDecl', 'name': 'C', 'tagUsed': 'class',
+    'inner': [
+        {'id': '0x2', 'kind': 'CXXRecordDecl', 'name': 'C',
+         'tagUsed': 'class', 'isImplicit': True},
+        _field('0x3', 'hidden'),
+        {'id': '0x4', 'kind': 'AccessSpecDecl', 'access': 'public'},
+        _method('0x5', 'f'),
+        _field('0x6', 'x'),
+        _method('0x7', 'operator=', isImplicit=True),
+        {'id': '0x8', 'kind': 'AccessSpecDecl', 'access': 'protected'},
+        _method('0x9', 'g'),
+        {'id': '0xa', 'kind': 'EnumDecl', 'name': 'E'},
+    ]}
+
+
+class TestHandlers(unittest.TestCase):
+    def test_class_single_pass(self):
+        node = copy.deepcopy(CLASS)
+        c = handle_class(node)
+        self.assertEqual([m.function.name for m in c.methods], ['f'])
+        self.assertEqual([f.name for f in c.fields], ['x'])
+        self.assertEqual(c.children, [])
+        # clang's nodes are left alone
+        self.assertEqual(node, CLASS)
+
+    def test_register(self):
+        saved = dict(_NAMESPACE_HANDLERS), dict(_CLASS_HANDLERS)
+        self.addCleanup(_NAMESPACE_HANDLERS.update, saved[0])
+        self.addCleanup(_CLASS_HANDLERS.update, saved[1])
+        self.addCleanup(_NAMESPACE_HANDLERS.pop, 'EnumDecl', None)
+        self.addCleanup(_CLASS_HANDLERS.pop, 'EnumDecl', None)
+
+        @register_handler('EnumDecl')
+        def _enum(node, parent):
+            return Enum(id=node['id'], name=node['name'])
+
+        seen = []
+
+        @register_handler('EnumDecl', scope='class')
+        def _class_enum(node, visitor):
+            seen.append((node['name'], visitor.name, visitor.access))
+
+        ns = handle_namespace({
+            'id': '0x10', 'kind': 'NamespaceDecl', 'name': 'ns', 'inner': [
+                {'id': '0x11', 'kind': 'EnumDecl', 'name': 'Color'},
+                copy.deepcopy(CLASS),
+            ]})
+        self.assertEqual(ns.children[0], Enum(id='0x11', name='Color'))
+        self.assertEqual(seen, [('E', 'C', 'protected')])
+
+        with self.assertRaises(ValueError):
+            register_handler('EnumDecl', scope='function')
+
+
+if __name__ == '__main__':
+    unittest.main()
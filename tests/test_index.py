@@ -0,0 +1,84 @@
+'''Tests on the declaration index.'''
+
+import unittest
+
+from cythonator.cythonator import (
+    Namespace, Class, Function, Method, Field, Param, _get_all_types)
+from cythonator.index import DeclIndex
+from cythonator.qualtype import parse_qualtype
+from .utils import _code_runner
+
+
+def _class(id, name, bases=(), fields=(), methods=(), children=()):
+    return Class(id=id, name=name, is_struct=True, methods=list(methods),
+                 fields=list(fields), templateparams=(), bases=list(bases),
+                 typedefs=[], children=list(children))
+
+
+def _function(id, name, ret, *params):
+    return Function(
+        id=id, name=name, previously_declared=False,
+        return_type=parse_qualtype(ret), templateparams=(),
+        params=[Param(id=f'{id}p{ii}', name=None, type=parse_qualtype(p))
+                for ii, p in enumerate(params)])
+
+
+class TestDeclIndex(unittest.TestCase):
+    def setUp(self):
+        base = _class('0x1', 'Base')
+        derived = _class(
+            '0x3', 'Derived', bases=['Base', 'struct ns::Other'],
+            fields=[Field(id='0x4', name='x', type=parse_qualtype(
+                'std::vector<double>'))],
+            methods=[Method(function=_function(
+                '0x5', 'get', 'Base &', 'const char *'), is_ctor=False)])
+        other = _class('0x7', 'Other')
+        self.ns = Namespace(id='_global_namespace', name='', children=[
+            base,
+            Namespace(id='0x2', name='ns', children=[
+                derived, other, _function('0x6', 'f', 'int', 'float')]),
+        ])
+        self.index = DeclIndex().add(self.ns)
+
+    def test_lookup(self):
+        self.assertIs(self.index.by_id['0x3'], self.ns.children[1].children[0])
+        self.assertEqual(
+            [c.name for c in self.index.lookup('ns::Derived')], ['Derived'])
+        self.assertEqual(self.index.lookup('::ns::f')[0].id, '0x6')
+        self.assertEqual(self.index.lookup('ns::Derived::get')[0].id, '0x5')
+        self.assertEqual(self.index.lookup('Derived'), [])
+        self.assertEqual(self.index.resolve('Other', 'ns::Derived')[0].id,
+                         '0x7')
+
+    def test_bases(self):
+        derived = self.index.by_id['0x3']
+        self.assertEqual([b.id for b in self.index.bases(derived)],
+                         ['0x1', '0x7'])
+        self.assertIsNone(self.index.resolve_base(derived, 'Missing'))
+
+    def test_types_used(self):
+        self.assertEqual(self.index.types_used('0x3'), {
+            'std::vector', 'double', 'Base', 'char'})
+        self.assertEqual(self.index.types_used('0x2'), {
+            'std::vector', 'double', 'Base', 'char', 'int', 'float'})
+        self.assertEqual(self.index.used_by('Base'), {
+            '0x5', '0x3', '0x2', '_global_namespace'})
+        self.assertEqual(_get_all_types(self.ns.children[1].children[2]),
+                         {'int', 'float'})
+
+
+class TestIndexedCythonator(unittest.TestCase):
+    def test_index(self):
+        index = DeclIndex()
+        ns = _code_runner([
+            'namespace ns { struct Base { }; }',
+            'struct Derived : public ns::Base { double d; };',
+        ], index=index)
+        derived = index.lookup('Derived')[0]
+        self.assertIs(derived, ns.children[1])
+        self.assertIs(index.bases(derived)[0], ns.children[0].children[0])
+        self.assertIn('double', index.types_used(derived))
+
+
+if __name__ == '__main__':
+    unittest.main()
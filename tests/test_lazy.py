@@ -0,0 +1,102 @@
+'''Tests on building the IR lazily.'''
+
+import pickle
+import unittest
+
+from cythonator.cythonator import handle_namespace
+from cythonator.lazy import LazyList, is_lazy, lazy_ir
+from cythonator.typedefs import resolve_types
+from cythonator.write_cython import write_pxd
+
+
+def _class(id, name, inner=()):
+    return {'id': id, 'kind': 'CXXRecordDecl', 'name': name,
+            'tagUsed': 'struct', 'inner': list(inner)}
+
+
+NAMESPACE = {
+    'id': '0x1', 'kind': 'NamespaceDecl', 'name': 'ns', 'inner': [
+        _class('0x2', 'A', [
+            {'id': '0x3', 'kind': 'FieldDecl', 'name': 'x',
+             'type': {'qualType': 'int'}}]),
+        {'id': '0x4', 'kind': 'NamespaceDecl', 'name': 'inner', 'inner': [
+            _class('0x5', 'B')]},
+        {'id': '0x6', 'kind': 'NamespaceDecl'},  # anonymous
+        {'id': '0x7', 'kind': 'UsingDecl', 'name': 'u'},
+    ]}
+
+
+class TestLazyList(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def _build(self, x):
+        self.calls.append(x)
+        return None if x < 0 else x * 10
+
+    def test_builds_once(self):
+        lst = LazyList([1, -1, 2], self._build)
+        self.assertFalse(lst.is_built)
+        self.assertEqual(self.calls, [])
+        self.assertEqual(len(lst), 2)
+        self.assertEqual(list(lst), [10, 20])
+        self.assertEqual(lst[-1], 20)
+        self.assertEqual(self.calls, [1, -1, 2])
+
+    def test_get(self):
+        lst = LazyList([1, 2, 3], self._build, ['a', 'b', 'a'])
+        self.assertEqual(lst.get('a'), [10, 30])
+        self.assertEqual(self.calls, [1, 3])
+        # items built by get() aren't built again
+        self.assertEqual(lst, [10, 20, 30])
+        self.assertEqual(self.calls, [1, 3, 2])
+
+    def test_deferred(self):
+        lst = LazyList.deferred(lambda: self.calls.append(0) or [1, 2])
+        self.assertEqual(self.calls, [])
+        self.assertTrue(lst)
+        self.assertEqual(lst, [1, 2])
+        self.assertEqual(self.calls, [0])
+
+    def test_builds_lazily(self):
+        with lazy_ir():
+            lst = LazyList([0], lambda _x: is_lazy())
+        self.assertFalse(is_lazy())
+        self.assertEqual(lst, [True])
+
+    def test_pickle(self):
+        lst = LazyList([1, 2], self._build)
+        self.assertEqual(pickle.loads(pickle.dumps(lst)), [10, 20])
+
+
+class TestLazyNamespace(unittest.TestCase):
+    def _handle(self, lazy):
+        with lazy_ir(lazy):
+            return handle_namespace(NAMESPACE)
+
+    def test_untouched(self):
+        ns = self._handle(True)
+        self.assertFalse(ns.children.is_built)
+        inner, = ns.children.get('inner')
+        self.assertEqual(inner.name, 'ns::inner')
+        self.assertFalse(ns.children.is_built)
+        self.assertFalse(inner.children.is_built)
+
+    def test_class_members(self):
+        ns = self._handle(True)
+        a, = ns.children.get('A')
+        self.assertFalse(a.fields.is_built)
+        self.assertEqual([f.name for f in a.fields], ['x'])
+        self.assertEqual(a.methods, [])
+
+    def test_same_as_eager(self):
+        lazy, eager = self._handle(True), self._handle(False)
+        self.assertIsInstance(eager.children, list)
+        self.assertEqual(lazy, eager)
+        self.assertEqual(write_pxd(lazy, 'h.hpp'), write_pxd(eager, 'h.hpp'))
+        self.assertEqual(resolve_types(self._handle(True)),
+                         resolve_types(eager))
+
+
+if __name__ == '__main__':
+    unittest.main()
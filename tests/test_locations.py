@@ -0,0 +1,94 @@
+'''Tests on filtering declarations by source location.'''
+
+import unittest
+
+from cythonator.locations import LocationTracker, LocationFilter
+from .utils import _code_runner
+
+
+def _loc(file=None, line=1):
+    loc = {'offset': 0}
+    if file is not None:
+        loc['file'] = file
+    loc['line'] = line
+    loc['col'] = 1
+    loc['tokLen'] = 1
+    return loc
+
+
+class TestLocationTracker(unittest.TestCase):
+    def test_file_is_inherited(self):
+        nodes = [
+            {'id': '0x1', 'kind': 'TypedefDecl', 'loc': {}},
+            {'id': '0x2', 'kind': 'FunctionDecl', 'loc': {
+                **_loc('/usr/include/a.h'),
+                'includedFrom': {'file': '/main.hpp'}}},
+            {'id': '0x3', 'kind': 'FunctionDecl', 'loc': _loc()},
+            {'id': '0x4', 'kind': 'NamespaceDecl', 'loc': _loc(), 'inner': [
+                {'id': '0x5', 'kind': 'FunctionDecl', 'loc': _loc('/main.hpp')},
+            ]},
+            {'id': '0x6', 'kind': 'FunctionDecl', 'loc': _loc()},
+        ]
+        tracker = LocationTracker()
+        self.assertEqual([tracker.locate(n) for n in nodes], [
+            None, '/usr/include/a.h', '/usr/include/a.h',
+            '/usr/include/a.h', '/main.hpp'])
+
+    def test_macro_expansion(self):
+        tracker = LocationTracker()
+        node = {'id': '0x1', 'kind': 'FunctionDecl', 'loc': {
+            'spellingLoc': _loc('/macros.h'),
+            'expansionLoc': _loc('/main.hpp'),
+        }}
+        self.assertEqual(tracker.locate(node), '/main.hpp')
+
+    def test_range_end_changes_file(self):
+        tracker = LocationTracker()
+        nodes = [
+            {'id': '0x1', 'kind': 'FunctionDecl', 'loc': _loc('/main.hpp'),
+             'range': {'begin': _loc(), 'end': _loc('/other.h')}},
+            {'id': '0x2', 'kind': 'FunctionDecl', 'loc': _loc()},
+        ]
+        self.assertEqual(
+            [tracker.locate(n) for n in nodes], ['/main.hpp', '/other.h'])
+
+    def test_split_namespaces(self):
+        tracker = LocationTracker()
+        node = {'id': '0x1', 'kind': 'NamespaceDecl', 'loc': _loc('/a.hpp'),
+                'name': 'ns', 'inner': [
+                    {'id': '0x2', 'kind': 'FunctionDecl', 'loc': _loc()},
+                    {'id': '0x3', 'kind': 'FunctionDecl',
+                     'loc': _loc('/b.hpp')},
+                    {'id': '0x4', 'kind': 'FunctionDecl', 'loc': _loc()},
+                ]}
+        parts = tracker.split(node)
+        self.assertEqual([f for f, _n in parts], ['/a.hpp', '/b.hpp'])
+        self.assertEqual(
+            [[c['id'] for c in n['inner']] for _f, n in parts],
+            [['0x2'], ['0x3', '0x4']])
+        self.assertEqual(parts[1][1]['name'], 'ns')
+        self.assertNotIn('inner', node['inner'][0])
+
+
+class TestLocationFilter(unittest.TestCase):
+    def test_headers_and_roots(self):
+        keep = LocationFilter(['/proj/main.hpp'], include_roots=['/proj/inc'])
+        self.assertTrue(keep.file_allowed('/proj/main.hpp'))
+        self.assertTrue(keep.file_allowed('/proj/inc/sub/a.hpp'))
+        self.assertFalse(keep.file_allowed('/proj/include/a.hpp'))
+        self.assertFalse(keep.file_allowed('/usr/include/stdio.h'))
+        self.assertFalse(keep.file_allowed(None))
+
+
+class TestIncludedDeclarations(unittest.TestCase):
+    def test_included_dropped(self):
+        ns = _code_runner([
+            '#include <cstddef>',
+            'void fun(int n);',
+        ])
+        self.assertEqual(len(ns.children), 1)
+        self.assertEqual(ns.children[0].name, 'fun')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+'''Tests on only writing what changed since the last run.'''
+
+import os
+import pathlib
+import tempfile
+import unittest
+
+from cythonator.cythonator import Namespace, _convert_toplevel
+from cythonator.diagnostics import collecting
+from cythonator.manifest import (
+    Manifest, fingerprint, fingerprint_headers, manifest_path, update_pxd,
+    write_if_changed)
+from cythonator.shards import write_shards
+
+
+def _struct(id, name, field_type='double'):
+    return {'id': id, 'kind': 'CXXRecordDecl', 'name': name,
+            'tagUsed': 'struct', 'inner': [
+                {'id': f'{id}f', 'kind': 'FieldDecl', 'name': 'x',
+                 'type': {'qualType': field_type}}]}
+
+
+def _ns(id, name, inner):
+    return {'id': id, 'kind': 'NamespaceDecl', 'name': name, 'inner': inner}
+
+
+def _global(nodes):
+    return Namespace(id='_global_namespace', name='', children=[
+        _convert_toplevel(node) for node in nodes])
+
+
+def _namespaces(point_type='double', id='0x'):
+    # ids change from run to run
+    return {'a.hpp': _global([
+        _struct(f'{id}1', 'A'),
+        _ns(f'{id}2', 'geo', [_struct(f'{id}3', 'Point', point_type)]),
+        _ns(f'{id}4', 'io', [_struct(f'{id}5', 'File', 'int')]),
+    ])}
+
+
+def _mtimes(d):
+    return {p.name: p.stat().st_mtime_ns for p in pathlib.Path(d).iterdir()}
+
+
+def _age(d):
+    # so rewritten files get a different mtime
+    for p in pathlib.Path(d).iterdir():
+        os.utime(p, ns=(0, 0))
+
+
+class TestFingerprint(unittest.TestCase):
+    def test_ids(self):
+        a = _namespaces()['a.hpp']
+        b = _namespaces(id='0xff')['a.hpp']
+        self.assertEqual(fingerprint(a.children[0]),
+                         fingerprint(b.children[0]))
+        self.assertEqual(fingerprint_headers({'a.hpp': a}),
+                         fingerprint_headers({'a.hpp': b}))
+
+    def test_changed(self):
+        a = _namespaces()['a.hpp']
+        b = _namespaces('float')['a.hpp']
+        self.assertEqual(fingerprint(a.children[0]),
+                         fingerprint(b.children[0]))
+        self.assertNotEqual(fingerprint(a.children[1].children[0]),
+                            fingerprint(b.children[1].children[0]))
+        fp_a, decls_a = fingerprint_headers({'a.hpp': a})
+        fp_b, decls_b = fingerprint_headers({'a.hpp': b})
+        self.assertNotEqual(fp_a, fp_b)
+        self.assertEqual(list(decls_a), ['A', 'geo::Point', 'io::File'])
+
+
+class TestWriteIfChanged(unittest.TestCase):
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = pathlib.Path(d) / 'a.pxd'
+            self.assertTrue(write_if_changed(path, ['a\n', 'b\n']))
+            _age(d)
+            self.assertFalse(write_if_changed(path, ['a\nb\n']))
+            self.assertEqual(path.stat().st_mtime_ns, 0)
+            self.assertTrue(write_if_changed(path, ['a\n']))
+            self.assertEqual(path.read_text(), 'a\n')
+            self.assertEqual(os.listdir(d), ['a.pxd'])
+
+
+class TestUpdate(unittest.TestCase):
+    def test_update(self):
+        with tempfile.TemporaryDirectory() as d:
+            out = pathlib.Path(d) / 'out.pyx'
+            self.assertTrue(update_pxd(_namespaces(), out))
+            self.assertTrue(manifest_path(out).exists())
+            _age(d)
+            self.assertFalse(update_pxd(_namespaces(id='0xff'), out))
+            self.assertEqual(_mtimes(d)['out.pyx'], 0)
+
+            manifest = Manifest(manifest_path(out))
+            _, decls = fingerprint_headers(_namespaces('float'))
+            self.assertEqual(manifest.changed_decls('out.pyx', decls),
+                             ['geo::Point'])
+            with collecting() as diagnostics:
+                self.assertTrue(update_pxd(_namespaces('float'), out))
+            self.assertIn('float x', out.read_text())
+            self.assertEqual([d.message for d in diagnostics],
+                             ['out.pyx: changed geo::Point'])
+
+    def test_bad_manifest(self):
+        with tempfile.TemporaryDirectory() as d:
+            out = pathlib.Path(d) / 'out.pyx'
+            manifest_path(out).write_text('{"version": 0}')
+            self.assertTrue(update_pxd(_namespaces(), out))
+            out.unlink()
+            # the manifest is up to date, but the file is gone
+            self.assertTrue(update_pxd(_namespaces(), out))
+
+
+class TestShards(unittest.TestCase):
+    def test_incremental(self):
+        with tempfile.TemporaryDirectory() as d:
+            written = write_shards(_namespaces(), d)
+            self.assertEqual([p.name for p in written], [
+                '_global.pxd', 'geo.pxd', 'io.pxd', 'index.pxd'])
+            _age(d)
+            self.assertEqual(write_shards(_namespaces(id='0xff'), d), [])
+            self.assertEqual(set(_mtimes(d).values()), {0})
+
+            with collecting() as diagnostics:
+                written = write_shards(_namespaces('float'), d)
+            self.assertEqual([p.name for p in written], ['geo.pxd'])
+            self.assertEqual([d.message for d in diagnostics],
+                             ['geo.pxd: changed geo::Point'])
+            self.assertEqual(_mtimes(d)['io.pxd'], 0)
+
+    def test_stale(self):
+        namespaces = _namespaces()
+        with tempfile.TemporaryDirectory() as d:
+            write_shards(namespaces, d)
+            ns = namespaces['a.hpp']
+            write_shards({'a.hpp': ns._replace(children=ns.children[:2])}, d)
+            self.assertEqual(sorted(os.listdir(d)), [
+                '_global.pxd', 'geo.pxd', 'index.pxd', 'manifest.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
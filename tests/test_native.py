@@ -0,0 +1,166 @@
+'''Tests on the in-process clang extension.'''
+
+import pathlib
+import tempfile
+import unittest
+
+from cythonator.cythonator import Config, open_session, run
+from cythonator.diagnostics import collecting
+from cythonator.manifest import fingerprint
+from cythonator.selectors import Selector
+from cythonator.write_cython import write_pxd
+from .utils import _code_runner
+
+try:
+    from cythonator import _native
+except ImportError:
+    _native = None
+
+
+@unittest.skipIf(_native is None, 'clang extension not built')
+class TestNative(unittest.TestCase):
+    def _compare(self, code):
+        # ids are addresses, so compare what ends up in the PXD
+        ns = _code_runner(code, native=True)
+        self.assertEqual(
+            write_pxd(ns, 'test.hpp'),
+            write_pxd(_code_runner(code), 'test.hpp'))
+        return ns
+
+    def test_functions(self):
+        ns = self._compare([
+            'void f();',
+            'const int* g(double a, int&);',
+            'template<class T, typename U = double&> T h(U u);',
+        ])
+        self.assertEqual(ns.children[1].params[1].name, None)
+        self.assertTrue(ns.children[2].templateparams[1].default.is_ref)
+
+    def test_namespaces_and_typedefs(self):
+        self._compare([
+            'typedef int myInt;',
+            'namespace outer { namespace inner { void f(myInt i); } }',
+            'namespace { void hidden(); }',
+        ])
+
+    def test_classes(self):
+        ns = self._compare([
+            'struct Base { };',
+            'class C : public Base {',
+            '    int priv;',
+            'public:',
+            '    C(int a) {}',
+            '    typedef double dbl;',
+            '    dbl field;',
+            '    struct Inner { int x; };',
+            '    template<class T> void method(T t) const;',
+            'protected:',
+            '    void prot();',
+            '};',
+        ])
+        c = ns.children[1]
+        self.assertEqual(c.bases, ['Base'])
+        self.assertEqual([m.function.name for m in c.methods], ['C', 'method'])
+        self.assertEqual([f.name for f in c.fields], ['field'])
+        self.assertEqual(c.children[0].name, 'Inner')
+
+    def test_same_ir(self):
+        # canonical types and specializations are what dedup goes by
+        code = [
+            'typedef int myInt;',
+            'struct A { typedef double value_type; value_type get(); };',
+            'template<class T> void f(T t);',
+            'template<> void f<int>(int t);',
+            'void g(myInt i);',
+        ]
+        ns = _code_runner(code, native=True)
+        self.assertEqual(fingerprint(ns), fingerprint(_code_runner(code)))
+        self.assertEqual(
+            ns.children[1].methods[0].function.return_type.canonical.name,
+            'double')
+
+    def test_deep_namespaces_and_access(self):
+        code = ['namespace a { namespace b { namespace c {',
+                'struct S { int x; protected: int y; private: int z; };',
+                '} } }']
+        selector = Selector(access=['public', 'protected'])
+        ns = _code_runner(code, native=True, selector=selector)
+        self.assertEqual(fingerprint(ns),
+                         fingerprint(_code_runner(code, selector=selector)))
+        c = ns.children[0].children[0].children[0]
+        self.assertEqual(c.name, 'a::b::c')
+        self.assertEqual([f.name for f in c.children[0].fields], ['x', 'y'])
+
+    def test_failed(self):
+        with self.assertRaises(RuntimeError):
+            _native.parse_header('does/not/exist.hpp')
+        with self.assertRaises(RuntimeError):
+            _native.Session().parse('does/not/exist.hpp')
+
+    def test_errors(self):
+        with tempfile.TemporaryDirectory() as d:
+            header = pathlib.Path(d) / 'test.hpp'
+            header.write_text('void f();\nint g() { return missing; }\n')
+            for parse in [_native.parse_header, _native.Session().parse]:
+                with collecting() as diagnostics:
+                    ns = parse(str(header))
+                self.assertEqual(ns.children[0].name, 'f')
+                self.assertEqual([d.severity for d in diagnostics],
+                                 ['warning'])
+
+    def test_warnings(self):
+        with self.assertWarns(UserWarning):
+            _code_runner(
+                'struct V { virtual int f() { return 0; } };', native=True)
+
+
+@unittest.skipIf(_native is None, 'clang extension not built')
+class TestSession(unittest.TestCase):
+    def test_preamble_reused(self):
+        with tempfile.TemporaryDirectory() as d:
+            header = pathlib.Path(d) / 'test.hpp'
+            header.write_text('#include <vector>\nvoid f(int n);\n')
+            session = _native.Session()
+            ns = session.parse(str(header))
+            self.assertEqual([c.name for c in ns.children], ['f'])
+
+            # only the body changed: no new preamble
+            header.write_text('#include <vector>\nvoid g(double x);\n')
+            ns = session.parse(str(header))
+            self.assertEqual([c.name for c in ns.children], ['g'])
+            self.assertEqual(session.preamble_builds, 1)
+
+            # the includes changed
+            header.write_text('#include <map>\nvoid g(double x);\n')
+            session.parse(str(header))
+            self.assertEqual(session.preamble_builds, 2)
+
+    def test_same_as_parse_header(self):
+        with tempfile.TemporaryDirectory() as d:
+            header = pathlib.Path(d) / 'test.hpp'
+            header.write_text(
+                'struct A { int x; };\nvoid f(A a, int& b);\n')
+            session = _native.Session()
+            self.assertEqual(
+                write_pxd(session.parse(str(header)), 'test.hpp'),
+                write_pxd(_native.parse_header(str(header)), 'test.hpp'))
+
+    def test_run(self):
+        code = ['typedef int myInt;', 'void f(myInt i);', 'void f(int i);',
+                'struct S { int x; protected: int y; };', 'void g();']
+        selector = Selector(exclude=['g'], access=['public', 'protected'])
+        with tempfile.TemporaryDirectory() as d:
+            header = pathlib.Path(d) / 'test.hpp'
+            header.write_text('\n'.join(code) + '\n')
+            config = Config(selector=selector)
+            ns = run(str(header), config._replace(
+                session=open_session(config))).ir
+            # typedefs are resolved and redeclarations merged
+            self.assertEqual(fingerprint(ns),
+                             fingerprint(run(str(header), config).ir))
+        self.assertEqual([c.name for c in ns.children], ['myInt', 'f', 'S'])
+        self.assertEqual([f.name for f in ns.children[2].fields], ['x', 'y'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+'''Tests on converting and writing with many processes.'''
+
+import threading
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from cythonator.cythonator import (
+    Namespace, _NAMESPACE_HANDLERS, _convert_parallel, _convert_toplevel,
+    register_handler)
+from cythonator import parallel
+from cythonator.parallel import map_shards, merge_pieces, split_namespace
+from cythonator.selectors import Selector
+from cythonator.write_cython import write_pxd_headers
+from .utils import _code_runner
+
+
+def _fun(id, name):
+    return {'id': id, 'kind': 'FunctionDecl', 'name': name,
+            'type': {'qualType': f'{name} ({name}, int)'}}
+
+
+def _struct(id, name):
+    return {'id': id, 'kind': 'CXXRecordDecl', 'name': name,
+            'tagUsed': 'struct', 'inner': [
+                {'id': f'{id}f', 'kind': 'FieldDecl', 'name': 'x',
+                 'type': {'qualType': 'double'}}]}
+
+
+def _ns(id, name, inner):
+    return {'id': id, 'kind': 'NamespaceDecl', 'name': name, 'inner': inner}
+
+
+NODES = [
+    _struct('0x1', 'A'),
+    _ns('0x2', 'big', [_fun(f'0x2{ii}', f'f{ii}') for ii in range(20)]),
+    _fun('0x3', 'g'),
+    _ns('0x4', 'outer', [_ns('0x5', 'inner', [_struct('0x6', 'B')])]),
+]
+
+
+Enum = namedtuple('Enum', 'id name')
+
+
+def _enum(node, parent):
+    return Enum(node['id'], node['name'])
+
+
+def _squares(shard, offset):
+    return [x*x + offset for x in shard]
+
+
+class TestShards(unittest.TestCase):
+    def test_map_in_order(self):
+        items = list(range(100))
+        self.assertEqual(map_shards(_squares, items, jobs=3, args=(1,)),
+                         [x*x + 1 for x in items])
+
+    def test_from_thread(self):
+        found = []
+        thread = threading.Thread(target=lambda: found.append((
+            parallel.start_method(), map_shards(_squares, list(range(20)),
+                                                jobs=2, args=(0,)))))
+        thread.start()
+        thread.join()
+        self.assertNotEqual(found[0][0], 'fork')
+        self.assertEqual(found[0][1], [x*x for x in range(20)])
+
+    def test_split_and_merge(self):
+        pieces = split_namespace(NODES[1], 6)
+        self.assertEqual([len(p['inner']) for p in pieces], [6, 6, 6, 2])
+        nested = _ns('0x4', 'outer', [_ns('0x5', 'inner', [
+            _fun(f'0x5{ii}', f'f{ii}') for ii in range(3)])])
+        pieces = split_namespace(nested, 2)
+        self.assertEqual([p['id'] for p in pieces], ['0x4', '0x4'])
+        self.assertEqual([len(p['inner'][0]['inner']) for p in pieces],
+                         [2, 1])
+        self.assertEqual(split_namespace(NODES[0], 1), [NODES[0]])
+        merged = merge_pieces([
+            Namespace(id='0x2', name='big', children=[1]),
+            Namespace(id='0x2', name='big', children=[2]),
+            Namespace(id='0x7', name='big', children=[3]),
+        ])
+        self.assertEqual([ns.children for ns in merged], [[1, 2], [3]])
+
+
+class TestParallel(unittest.TestCase):
+    def test_same_ir(self):
+        serial = [_convert_toplevel(node) for node in NODES]
+        for jobs in [1, 2, 4]:
+            self.assertEqual(_convert_parallel(NODES, jobs, False, None),
+                             serial)
+
+    def test_one_big_namespace(self):
+        nodes = [_ns('0x1', 'big', [_fun(f'0x1{ii}', f'f{ii}')
+                                    for ii in range(400)])]
+        with mock.patch('cythonator.cythonator.map_shards',
+                        wraps=map_shards) as m:
+            res = _convert_parallel(nodes, 2, False, None)
+        # a few pieces of many members each, not one per member
+        self.assertEqual(len(m.call_args[0][1]), 8)
+        self.assertEqual(len(res[0].children), 400)
+
+    def test_nested_namespace(self):
+        nodes = [_ns('0x1', 'mylib', [
+            _fun('0x10', 'first'),
+            _ns('0x2', 'core', [_struct(f'0x2{ii}', f'S{ii}')
+                                for ii in range(100)]),
+            _fun('0x11', 'last')])]
+        serial = [_convert_toplevel(node) for node in nodes]
+        with mock.patch('cythonator.cythonator.map_shards',
+                        wraps=map_shards) as m:
+            res = _convert_parallel(nodes, 2, False, None)
+        # split inside of mylib::core, not one shard for all of mylib
+        self.assertGreater(len(m.call_args[0][1]), 1)
+        self.assertEqual(res, serial)
+        self.assertEqual(len(res[0].children[1].children), 100)
+
+    def test_handlers_spawned(self):
+        nodes = [_ns('0x1', 'big', [
+            {'id': f'0x1{ii}', 'kind': 'EnumDecl', 'name': f'E{ii}'}
+            for ii in range(20)])]
+        saved = dict(_NAMESPACE_HANDLERS)
+        try:
+            # registered at runtime, not by importing any module
+            register_handler('EnumDecl')(_enum)
+            with mock.patch('cythonator.parallel.start_method',
+                            return_value='spawn'):
+                res = _convert_parallel(nodes, 2, False, None)
+        finally:
+            _NAMESPACE_HANDLERS.clear()
+            _NAMESPACE_HANDLERS.update(saved)
+        self.assertEqual(res[0].children,
+                         [Enum(f'0x1{ii}', f'E{ii}') for ii in range(20)])
+
+    def test_selector(self):
+        res = _convert_parallel(NODES, 2, False, Selector(['big::f1*']))
+        self.assertEqual(
+            [f.name for f in res[1].children],
+            ['f1'] + [f'f{ii}' for ii in range(10, 20)])
+        self.assertEqual(res[0], None)
+
+    def test_same_pxd(self):
+        ns = Namespace(id='_global_namespace', name='', children=[
+            _convert_toplevel(node) for node in NODES])
+        namespaces = {'a.hpp': ns, 'b.hpp': ns._replace(children=[])}
+        self.assertEqual(write_pxd_headers(namespaces, jobs=3),
+                         write_pxd_headers(namespaces))
+
+
+class TestParallelCythonator(unittest.TestCase):
+    def test_jobs(self):
+        code = [f'namespace ns{ii} {{ struct S{ii} {{ int x; }}; '
+                f'void f{ii}(S{ii} s); }}' for ii in range(8)]
+        self.assertEqual(_code_runner(code, jobs=2), _code_runner(code))
+
+    def test_lazy(self):
+        with self.assertRaises(ValueError):
+            _code_runner('void f();', jobs=2, lazy=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
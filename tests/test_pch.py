@@ -0,0 +1,84 @@
+'''Tests on precompiled header support.'''
+
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from cythonator.pch import _read_depfile, _is_fresh, build_pch
+from .utils import _code_runner
+
+
+class TestDepfile(unittest.TestCase):
+    def test_read_depfile(self):
+        with tempfile.TemporaryDirectory() as d:
+            depfile = pathlib.Path(d) / 'prefix.d'
+            depfile.write_text(
+                'prefix.pch: /a/prefix.hpp /usr/include/c++/vector \\\n'
+                '  /home/my\\ dir/core.hpp\n')
+            self.assertEqual(_read_depfile(depfile), [
+                '/a/prefix.hpp', '/usr/include/c++/vector',
+                '/home/my dir/core.hpp'])
+
+    def test_stale_when_input_changes(self):
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            header, pch, depfile = d / 'a.hpp', d / 'a.pch', d / 'a.d'
+            header.write_text('int a;')
+            pch.write_bytes(b'')
+            depfile.write_text(f'a.pch: {header}\n')
+            os.utime(header, ns=(0, 0))
+            self.assertTrue(_is_fresh(pch, depfile))
+
+            header.write_text('int b;')
+            os.utime(pch, ns=(0, 0))
+            self.assertFalse(_is_fresh(pch, depfile))
+
+            # the PCH and its dependency info have to exist
+            self.assertFalse(_is_fresh(d / 'missing.pch', depfile))
+
+
+class TestBuild(unittest.TestCase):
+    def test_moved_into_place(self):
+        def clang(cmd, check):
+            # writes where it is told to, like clang would
+            out, depfile = cmd[cmd.index('-o') + 1], cmd[cmd.index('-MF') + 1]
+            self.assertNotEqual(os.path.basename(depfile), 'prefix.hpp.d')
+            pathlib.Path(out).write_bytes(b'pch')
+            pathlib.Path(depfile).write_text(f'{out}: {cmd[3]}\n')
+
+        with tempfile.TemporaryDirectory() as d, \
+                mock.patch('subprocess.run', side_effect=clang) as run:
+            pch = pathlib.Path(build_pch(['<vector>'], cache_dir=d))
+            self.assertEqual(sorted(os.listdir(pch.parent)), [
+                'prefix.hpp', 'prefix.hpp.d', 'prefix.hpp.pch'])
+            self.assertTrue(_is_fresh(pch, pch.parent / 'prefix.hpp.d'))
+            build_pch(['<vector>'], cache_dir=d)
+            self.assertEqual(run.call_count, 1)
+
+
+class TestPCH(unittest.TestCase):
+    def test_reused(self):
+        with tempfile.TemporaryDirectory() as d:
+            pch = build_pch(['<vector>'], cache_dir=d)
+            built = os.stat(pch).st_mtime_ns
+            self.assertEqual(build_pch(['<vector>'], cache_dir=d), pch)
+            self.assertEqual(os.stat(pch).st_mtime_ns, built)
+
+            # different flags need a different PCH
+            self.assertNotEqual(
+                build_pch(['<vector>'], flags=['-DFOO'], cache_dir=d), pch)
+
+    def test_dump_with_pch(self):
+        with tempfile.TemporaryDirectory() as d:
+            ns = _code_runner([
+                '#include <vector>',
+                'void fun(int n);',
+            ], pch_includes=['<vector>'], pch_dir=d)
+        self.assertEqual(len(ns.children), 1)
+        self.assertEqual(ns.children[0].name, 'fun')
+
+
+if __name__ == '__main__':
+    unittest.main()
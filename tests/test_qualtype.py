@@ -0,0 +1,89 @@
+'''Tests on parsing clang type strings.'''
+
+import pickle
+import unittest
+
+from cythonator.qualtype import Type, parse_qualtype, return_type
+
+
+class TestParseQualType(unittest.TestCase):
+    def test_qualifiers(self):
+        t = parse_qualtype('const std::vector<int> &')
+        self.assertEqual(t.name, 'std::vector')
+        self.assertTrue(t.is_const)
+        self.assertTrue(t.is_ref)
+        self.assertFalse(t.is_ptr)
+
+        t = parse_qualtype('double *const')
+        self.assertEqual(t.name, 'double')
+        self.assertTrue(t.is_const_ptr)
+        self.assertFalse(t.is_const)
+
+    def test_nested_templates(self):
+        t = parse_qualtype(
+            'std::map<std::string, std::vector<std::pair<int, '
+            'const double *const> > >')
+        self.assertEqual([a.name for a in t.template_args],
+                         ['std::string', 'std::vector'])
+        pair = t.template_args[1].template_args[0]
+        self.assertEqual(pair.name, 'std::pair')
+        self.assertEqual(pair.template_args[1].name, 'double')
+        self.assertTrue(pair.template_args[1].is_const_ptr)
+        self.assertEqual(pair.template_args[1].clang_str,
+                         ' const double *const')
+
+    def test_function_type_args(self):
+        t = parse_qualtype('std::function<void (int, int)>')
+        self.assertEqual(len(t.template_args), 1)
+        self.assertEqual(t.template_args[0].clang_str, 'void (int, int)')
+
+    def test_memoized(self):
+        a = parse_qualtype('std::vector<std::vector<int> >')
+        b = parse_qualtype('std::vector<std::vector<int> >')
+        self.assertIs(a, b)
+        self.assertIs(a.template_args[0].template_args[0],
+                      parse_qualtype('int'))
+
+    def test_deep_nesting(self):
+        depth = 200
+        t = parse_qualtype('A<' * depth + 'int' + '>' * depth)
+        for _ii in range(depth):
+            self.assertEqual(t.name, 'A')
+            t = t.template_args[0]
+        self.assertEqual(t.name, 'int')
+
+    def test_return_type(self):
+        self.assertEqual(return_type('int (double, int)').name, 'int')
+        t = return_type('std::function<void (int)> (int) const')
+        self.assertEqual(t.name, 'std::function')
+        self.assertEqual(t.clang_str, 'std::function<void (int)> ')
+
+
+class TestInternedType(unittest.TestCase):
+    def test_shared(self):
+        t = parse_qualtype('std::vector<int>')
+        self.assertIsInstance(t.template_args, tuple)
+        self.assertIs(Type(*t), t)
+        self.assertIs(Type._make(list(t)), t)
+        self.assertIs(t._replace(name='std::vector'), t)
+        self.assertIs(pickle.loads(pickle.dumps(t)), t)
+
+        # lists of template arguments are stored as tuples
+        self.assertIs(Type(**{**t._asdict(), 'template_args': list(
+            t.template_args)}), t)
+
+    def test_equality(self):
+        t = parse_qualtype('const int &')
+        self.assertEqual(t, tuple(t))
+        self.assertNotEqual(t, parse_qualtype('int &'))
+        self.assertEqual(len({t, parse_qualtype('const int &')}), 1)
+
+    def test_hash(self):
+        t = parse_qualtype('std::map<std::string, std::vector<int> >')
+        self.assertEqual(hash(t), hash(tuple(t)))
+        # no __dict__ per interned type
+        self.assertFalse(hasattr(t, '__dict__'))
+
+
+if __name__ == '__main__':
+    unittest.main()
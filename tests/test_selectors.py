@@ -0,0 +1,166 @@
+'''Tests on selecting which declarations to convert.'''
+
+import json
+import pickle
+import subprocess
+import sys
+import unittest
+
+from cythonator.cythonator import (
+    Namespace, handle_class, handle_namespace, _iter_filtered)
+from cythonator.selectors import (
+    Selector, selecting, iter_filtered_dump, select_ir)
+
+from .utils import _code_runner
+
+
+def _fun(id, name):
+    return {'id': id, 'kind': 'FunctionDecl', 'name': name,
+            'type': {'qualType': 'void ()'}}
+
+
+def _ns(id, name, inner):
+    return {'id': id, 'kind': 'NamespaceDecl', 'name': name, 'inner': inner}
+
+
+MYLIB = _ns('0x1', 'mylib', [
+    _fun('0x2', 'solve_a'),
+    _fun('0x3', 'helper'),
+    _ns('0x4', 'core', [
+        {'id': '0x5', 'kind': 'CXXRecordDecl', 'name': 'A',
+         'tagUsed': 'struct'},
+        _ns('0x6', 'detail', [_fun('0x7', 'f')]),
+    ]),
+    _ns('0x8', 'io', [_fun('0x9', 'read')]),
+])
+
+
+def _names(ns):
+    names = []
+    for child in ns.children:
+        names.append(child.name)
+        if child.__class__.__name__ == 'Namespace':
+            names += _names(child)
+    return names
+
+
+class TestSelector(unittest.TestCase):
+    def test_qualified_glob(self):
+        sel = Selector(['mylib::core::*'])
+        self.assertTrue(sel.selects('mylib::core::A', 'class'))
+        self.assertTrue(sel.selects('mylib::core::x::y', 'function'))
+        self.assertFalse(sel.selects('mylib::io::read', 'function'))
+        self.assertTrue(sel.enters('mylib'))
+        self.assertFalse(sel.enters('mylib::io'))
+        self.assertFalse(sel.enters('other'))
+
+    def test_unqualified_regex(self):
+        sel = Selector(['re:^solve_'], kinds=['function'])
+        self.assertTrue(sel.selects('mylib::solve_a', 'function'))
+        self.assertFalse(sel.selects('mylib::resolve_a', 'function'))
+        self.assertFalse(sel.selects('solve_t', 'class'))
+        self.assertTrue(sel.enters('anything'))
+
+    def test_exclude(self):
+        sel = Selector(exclude=['*::detail'])
+        self.assertFalse(sel.enters('mylib::core::detail'))
+        self.assertFalse(sel.selects('mylib::core::detail::f', 'function'))
+        self.assertTrue(sel.selects('mylib::core::A', 'class'))
+
+    def test_dump_filter(self):
+        self.assertEqual(Selector(['mylib::core::*']).dump_filter(),
+                         'mylib::core')
+        self.assertEqual(Selector(['a::b::*', 'a::c::X']).dump_filter(), 'a')
+        self.assertIsNone(Selector(['a::*', 'b::*']).dump_filter())
+        self.assertIsNone(Selector(['a::*', 're:^solve_']).dump_filter())
+        self.assertIsNone(Selector(exclude=['a::*']).dump_filter())
+
+    def test_unknown_access(self):
+        with self.assertRaises(ValueError):
+            Selector(access=['friends'])
+
+    def test_immutable(self):
+        sel = Selector(['a::*'], kinds=['class'])
+        with self.assertRaises(AttributeError):
+            sel.access = frozenset(['private'])
+        self.assertIsInstance(sel.include, tuple)
+        copy = pickle.loads(pickle.dumps(sel))
+        self.assertEqual(repr(copy), repr(sel))
+        self.assertTrue(copy.selects('a::X', 'class'))
+
+
+class TestSelecting(unittest.TestCase):
+    def test_namespace(self):
+        with selecting(Selector(['mylib::core::*', 're:^solve_'])):
+            ns = handle_namespace(MYLIB)
+        # the regex could match in any namespace, so io is searched
+        self.assertEqual(_names(ns), [
+            'solve_a', 'mylib::core', 'A', 'mylib::core::detail', 'f',
+            'mylib::io'])
+        self.assertEqual(ns.children[-1].children, [])
+
+    def test_nested_names(self):
+        ns = handle_namespace(MYLIB)
+        detail = ns.children[2].children[1]
+        self.assertEqual(detail.name, 'mylib::core::detail')
+
+    def test_kinds(self):
+        with selecting(Selector(kinds=['class'])):
+            ns = handle_namespace(MYLIB)
+        self.assertEqual(_names(ns), [
+            'mylib::core', 'A', 'mylib::core::detail', 'mylib::io'])
+
+    def test_access(self):
+        node = {'id': '0x1', 'kind': 'CXXRecordDecl', 'name': 'C',
+                'tagUsed': 'class', 'inner': [
+                    {'id': '0x2', 'kind': 'FieldDecl', 'name': 'x',
+                     'type': {'qualType': 'int'}}]}
+        self.assertEqual(handle_class(node).fields, [])
+        with selecting(Selector(access=['public', 'private'])):
+            c = handle_class(node)
+        self.assertEqual([f.name for f in c.fields], ['x'])
+
+    def test_select_ir(self):
+        ns = handle_namespace(MYLIB)
+        ns = select_ir(Namespace(id=None, name='', children=[ns]),
+                       Selector(exclude=['mylib::core']))
+        self.assertEqual(_names(ns), [
+            'mylib', 'solve_a', 'helper', 'mylib::io', 'read'])
+
+
+class TestFilteredDump(unittest.TestCase):
+    def test_wrapped(self):
+        out = ''.join(f'Dumping {q}:\n{json.dumps(n, indent=2)}\n' for q, n in [
+            ('mylib::core', MYLIB['inner'][2]),
+            ('(anonymous namespace)::core', MYLIB['inner'][2]),
+            ('core', MYLIB['inner'][2]),
+        ]).encode()
+        nodes = list(iter_filtered_dump(out))
+        self.assertEqual(len(nodes), 2)
+        node, wrapped = nodes[0]
+        self.assertEqual(node, MYLIB['inner'][2])
+        self.assertEqual(wrapped['name'], 'mylib')
+        self.assertEqual(wrapped['inner'], [node])
+        self.assertIs(nodes[1][0], nodes[1][1])
+
+    def test_clang_failed(self):
+        # stands in for clang failing before it dumps anything
+        cmd = [sys.executable, '-c', 'import sys; sys.exit(1)']
+        with self.assertRaises(subprocess.CalledProcessError):
+            list(_iter_filtered(cmd, 'stdlib'))
+
+
+class TestSelectedCythonator(unittest.TestCase):
+    def test_pushdown(self):
+        ns = _code_runner([
+            'namespace mylib {',
+            '    namespace core { struct A {}; }',
+            '    namespace io { void read(); }',
+            '    void solve();',
+            '}',
+        ], selector=Selector(['mylib::core::*']))
+        self.assertEqual(_names(ns), ['mylib', 'mylib::core', 'A'])
+
+
+if __name__ == '__main__':
+    unittest.main()
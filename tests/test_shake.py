@@ -0,0 +1,96 @@
+'''Tests on leaving out declarations that aren't needed.'''
+
+import unittest
+
+from cythonator.cythonator import (
+    Namespace, Class, Function, Method, Field, Param, Typedef)
+from cythonator.qualtype import parse_qualtype
+from cythonator.shake import shake
+from .utils import _code_runner
+
+
+def _class(id, name, bases=(), fields=(), methods=(), children=()):
+    return Class(id=id, name=name, is_struct=True, methods=list(methods),
+                 fields=list(fields), templateparams=(), bases=list(bases),
+                 typedefs=[], children=list(children))
+
+
+def _function(id, name, ret, *params):
+    return Function(
+        id=id, name=name, previously_declared=False,
+        return_type=parse_qualtype(ret), templateparams=(),
+        params=[Param(id=f'{id}p{ii}', name=None, type=parse_qualtype(p))
+                for ii, p in enumerate(params)])
+
+
+def _names(ns):
+    names = []
+    for child in ns.children:
+        names.append(child.name)
+        if child.__class__.__name__ == 'Namespace':
+            names += _names(child)
+    return names
+
+
+class TestShake(unittest.TestCase):
+    def setUp(self):
+        self.ns = Namespace(id='_global_namespace', name='', children=[
+            _class('0x1', 'Base'),
+            _class('0x2', 'Unused'),
+            Namespace(id='0x3', name='lib', children=[
+                Typedef(id='0x4', name='real', type=parse_qualtype('double'),
+                        referenced=True),
+                _class('0x5', 'Vec', bases=['Base'], fields=[
+                    Field(id='0x6', name='x', type=parse_qualtype('real'))]),
+                _class('0x7', 'Outer', children=[
+                    _class('0x8', 'Inner')]),
+                _function('0x9', 'solve', 'lib::Vec', 'const Outer::Inner &'),
+                _function('0xa', 'solve', 'void', 'int'),
+                _function('0xb', 'other', 'Unused'),
+            ]),
+            Namespace(id='0xc', name='empty', children=[
+                _function('0xd', 'g', 'void')]),
+        ])
+
+    def test_closure(self):
+        shaken = shake(self.ns, ['lib::solve'])
+        self.assertEqual(_names(shaken), [
+            'Base', 'lib', 'real', 'Vec', 'Outer', 'solve', 'solve'])
+        # classes are kept whole
+        self.assertEqual(shaken.children[1].children[2].children[0].name,
+                         'Inner')
+
+    def test_namespace_root(self):
+        shaken = shake(self.ns, ['empty'])
+        self.assertEqual(_names(shaken), ['empty', 'g'])
+
+    def test_by_header(self):
+        a, b = self.ns.children[:2], self.ns.children[2:]
+        shaken = shake({
+            'a.hpp': self.ns._replace(children=a),
+            'b.hpp': self.ns._replace(children=b),
+        }, ['lib::Vec'])
+        self.assertEqual(_names(shaken['a.hpp']), ['Base'])
+        self.assertEqual(_names(shaken['b.hpp']), ['lib', 'real', 'Vec'])
+
+    def test_unknown_root(self):
+        with self.assertRaises(ValueError):
+            shake(self.ns, ['lib::missing'])
+
+
+class TestShakeCythonator(unittest.TestCase):
+    def test_method_root(self):
+        ns = _code_runner([
+            'namespace lib {',
+            '    struct Point { double x, y; };',
+            '    typedef Point P;',
+            '    struct Shape { P center() const; };',
+            '    struct Unused {};',
+            '}',
+        ])
+        shaken = shake(ns, ['lib::Shape::center'])
+        self.assertEqual(_names(shaken), ['lib', 'Point', 'P', 'Shape'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+'''Tests on writing one PXD module per namespace or header.'''
+
+import pathlib
+import subprocess
+import tempfile
+import unittest
+
+from cythonator.cythonator import (
+    Namespace, _convert_toplevel, cythonator_headers)
+from cythonator.diagnostics import collecting
+from cythonator.shards import module_name, split, write_shards
+
+
+def _struct(id, name, field_type='double', bases=()):
+    return {'id': id, 'kind': 'CXXRecordDecl', 'name': name,
+            'tagUsed': 'struct', 'bases': [
+                {'type': {'qualType': b}, 'access': 'public'} for b in bases],
+            'inner': [
+                {'id': f'{id}f', 'kind': 'FieldDecl', 'name': 'x',
+                 'type': {'qualType': field_type}}]}
+
+
+def _fun(id, name, ret, params=()):
+    return {'id': id, 'kind': 'FunctionDecl', 'name': name,
+            'type': {'qualType': f'{ret} ({", ".join(params)})'},
+            'inner': [{'id': f'{id}p{ii}', 'kind': 'ParmVarDecl',
+                       'type': {'qualType': p}}
+                      for ii, p in enumerate(params)]}
+
+
+def _ns(id, name, inner):
+    return {'id': id, 'kind': 'NamespaceDecl', 'name': name, 'inner': inner}
+
+
+def _global(nodes):
+    return Namespace(id='_global_namespace', name='', children=[
+        _convert_toplevel(node) for node in nodes])
+
+
+NAMESPACES = {
+    'inc/a.hpp': _global([
+        _struct('0x1', 'A'),
+        _ns('0x2', 'geo', [
+            _struct('0x3', 'Point', 'A'),
+            _ns('0x4', 'detail', [_fun('0x5', 'norm', 'double', ['Point'])]),
+        ]),
+    ]),
+    'inc/b.hpp': _global([
+        _ns('0x6', 'geo', [
+            _fun('0x7', 'dist', 'double', ['Point', 'Point']),
+            _struct('0x8', 'Line', 'A', bases=['Point'])]),
+        _fun('0x9', 'make', 'geo::Line'),
+    ]),
+}
+
+
+class TestModuleName(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(module_name('', 'namespace'), '_global')
+        self.assertEqual(module_name('geo::detail', 'namespace'),
+                         'geo__detail')
+        self.assertEqual(module_name('/usr/include/my-lib.hpp', 'header'),
+                         'my_lib')
+        self.assertEqual(module_name('2d.h', 'header'), '_2d')
+        self.assertEqual(module_name('import', 'namespace'), 'import_')
+        with self.assertRaises(ValueError):
+            module_name('a', 'file')
+
+
+class TestSplit(unittest.TestCase):
+    def test_by_namespace(self):
+        shards = split(NAMESPACES)
+        self.assertEqual(list(shards), ['_global', 'geo', 'geo__detail'])
+        self.assertEqual(list(shards['geo'].namespaces),
+                         ['inc/a.hpp', 'inc/b.hpp'])
+        self.assertEqual(shards['_global'].cimports, {'geo': ['Line']})
+        self.assertEqual(shards['geo'].cimports, {'_global': ['A']})
+        self.assertEqual(shards['geo__detail'].cimports, {'geo': ['Point']})
+
+    def test_by_header(self):
+        shards = split(NAMESPACES, by='header')
+        self.assertEqual(list(shards), ['a', 'b'])
+        self.assertEqual(shards['a'].cimports, {})
+        self.assertEqual(shards['b'].cimports, {'a': ['A', 'Point']})
+
+    def test_same_stem(self):
+        shards = split({'x/a.hpp': NAMESPACES['inc/a.hpp'],
+                        'y/a.hpp': NAMESPACES['inc/b.hpp']}, by='header')
+        self.assertEqual(list(shards), ['a', 'a_2'])
+
+    def test_clash(self):
+        namespaces = {'a.hpp': _global([
+            _ns('0x1', 'p', [_struct('0x2', 'S')]),
+            _ns('0x3', 'q', [_struct('0x4', 'S')]),
+            _ns('0x5', 'r', [_fun('0x6', 'f', 'void', ['p::S', 'q::S'])]),
+        ])}
+        with collecting() as diagnostics:
+            split(namespaces)
+        self.assertEqual(len(diagnostics), 1)
+
+
+class TestWrite(unittest.TestCase):
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as d:
+            out = pathlib.Path(d) / 'pxd'
+            paths = write_shards(NAMESPACES, out, jobs=2)
+            self.assertEqual([p.name for p in paths], [
+                '_global.pxd', 'geo.pxd', 'geo__detail.pxd', 'index.pxd'])
+            geo = (out / 'geo.pxd').read_text()
+            self.assertTrue(geo.startswith('from _global cimport A\n\n'))
+            self.assertEqual(geo.count('namespace "geo"'), 2)
+            self.assertEqual((out / 'index.pxd').read_text(), ''.join(
+                f'from {m} cimport *\n'
+                for m in ['_global', 'geo', 'geo__detail']))
+
+            with self.assertRaises(ValueError):
+                write_shards(NAMESPACES, out, index='geo')
+
+    def test_cython(self):
+        code = {
+            'a.hpp': '#pragma once\nstruct A { int x; };',
+            'b.hpp': '#pragma once\n#include "a.hpp"\n'
+                     'namespace ns { struct B { A a; }; void f(B b); }',
+        }
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            for name, text in code.items():
+                (d / name).write_text(text)
+            namespaces = cythonator_headers([str(d / h) for h in code])
+            for path in write_shards(namespaces, d / 'pxd'):
+                pyx = d / f'{path.stem}_user.pyx'
+                pyx.write_text(f'from {path.stem} cimport *\n')
+                res = subprocess.run(
+                    ['cython', '-3', '--cplus', '-I', str(d / 'pxd'),
+                     str(pyx)], capture_output=True)
+                self.assertEqual(res.returncode, 0, res.stderr.decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,10 @@
 
 import unittest
 
+from cythonator.cythonator import (
+    Namespace, Typedef, Function, Param, Class, Method)
+from cythonator.qualtype import parse_qualtype
+from cythonator.typedefs import TypeResolver, resolve_types
 from .utils import _code_runner, _code_run_single_typedef
 
 
@@ -101,3 +105,81 @@ class TestTypedefs(unittest.TestCase):
             'typedef B<A<double *const, C<int[], int**> >&, const int>& Tdbl;'
         ]).children[-1]
         # print(td)
+
+
+class TestCanonicalTypes(unittest.TestCase):
+    def test_resolver(self):
+        resolver = TypeResolver()
+        resolver.add_typedef('myInt', parse_qualtype('int'))
+        resolver.add_typedef('otherInt', parse_qualtype('myInt'), 'ns')
+        t = resolver.resolve(
+            parse_qualtype('std::vector<const ns::otherInt *>'))
+        self.assertEqual(t.canonical.clang_str, 'std::vector<const int *>')
+        self.assertEqual(t.template_args[0].canonical.name, 'int')
+        self.assertTrue(t.template_args[0].canonical.is_ptr)
+        # nothing to resolve
+        self.assertIsNone(
+            resolver.resolve(parse_qualtype('double')).canonical)
+
+    def test_self_referencing(self):
+        resolver = TypeResolver()
+        resolver.add_typedef('A', parse_qualtype('struct A'))
+        self.assertEqual(resolver.canonical_str('A'), 'struct A')
+
+    def test_resolve_ir(self):
+        ns = resolve_types(Namespace(id='', name='', children=[
+            Typedef(id='0x1', name='myInt', type=parse_qualtype('int'),
+                    referenced=True),
+            Namespace(id='0x2', name='ns', children=[
+                Function(id='0x3', name='f', previously_declared=False,
+                         return_type=parse_qualtype('myInt'),
+                         params=[Param(id='0x4', name='a', type=parse_qualtype(
+                             'const myInt &'))],
+                         templateparams=())]),
+        ]))
+        f = ns.children[1].children[0]
+        self.assertEqual(f.return_type.canonical.clang_str, 'int')
+        self.assertEqual(f.params[0].type.canonical.clang_str, 'const int &')
+
+    def test_same_name_in_two_scopes(self):
+        def cls(id, name, aliased):
+            get = Function(id=f'{id}f', name='get', previously_declared=False,
+                           return_type=parse_qualtype('value_type'),
+                           params=(), templateparams=())
+            return Class(
+                id=id, name=name, is_struct=True,
+                methods=[Method(function=get, is_ctor=False)], fields=[],
+                templateparams=(), bases=[], children=[], typedefs=[
+                    Typedef(id=f'{id}t', name='value_type',
+                            type=parse_qualtype(aliased), referenced=True)])
+
+        ns = resolve_types(Namespace(id='', name='', children=[
+            cls('0x1', 'A', 'int'),
+            Namespace(id='0x2', name='ns', children=[
+                cls('0x3', 'B', 'double')]),
+        ]))
+        a, b = ns.children[0], ns.children[1].children[0]
+        self.assertEqual(
+            a.methods[0].function.return_type.canonical.clang_str, 'int')
+        self.assertEqual(
+            b.methods[0].function.return_type.canonical.clang_str, 'double')
+
+        # only visible from inside the classes
+        resolver = TypeResolver()
+        resolver.add_typedef('value_type', parse_qualtype('int'), 'A')
+        self.assertEqual(resolver.canonical_str('value_type'), 'value_type')
+        self.assertEqual(resolver.canonical_str('A::value_type'), 'int')
+        self.assertEqual(resolver.canonical_str('value_type', 'A::C'), 'int')
+
+    def test_desugared(self):
+        ns = _code_runner([
+            'typedef int myInt;',
+            'typedef myInt otherInt;',
+            'otherInt f(const otherInt* a);',
+        ])
+        self.assertEqual(ns.children[1].type.canonical.name, 'int')
+        f = ns.children[2]
+        self.assertEqual(f.return_type.clang_str, 'otherInt ')
+        self.assertEqual(f.return_type.canonical.name, 'int')
+        self.assertEqual(
+            f.params[0].type.canonical.clang_str, 'const int *')
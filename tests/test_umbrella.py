@@ -0,0 +1,48 @@
+'''Tests on parsing many headers in one clang run.'''
+
+import pathlib
+import subprocess
+import tempfile
+import unittest
+
+from cythonator.cythonator import cythonator_headers
+from cythonator.write_cython import write_pxd_headers
+
+
+class TestUmbrella(unittest.TestCase):
+    def test_split_by_header(self):
+        with tempfile.TemporaryDirectory() as d:
+            d = pathlib.Path(d)
+            (d / 'a.hpp').write_text('\n'.join([
+                '#pragma once',
+                'namespace ns { void a(int x); }',
+                'struct A { int x; };',
+            ]))
+            (d / 'b.hpp').write_text('\n'.join([
+                '#pragma once',
+                '#include "a.hpp"',
+                'namespace ns { void b(A a); }',
+            ]))
+            headers = [str(d / 'a.hpp'), str(d / 'b.hpp')]
+            namespaces = cythonator_headers(headers)
+            self.assertEqual(list(namespaces), headers)
+
+            a, b = namespaces.values()
+            self.assertEqual([c.name for c in a.children], ['ns', 'A'])
+            self.assertEqual(a.children[0].children[0].name, 'a')
+            self.assertEqual([c.name for c in b.children], ['ns'])
+            self.assertEqual(b.children[0].children[0].name, 'b')
+
+            pxd = write_pxd_headers(namespaces)
+            self.assertEqual(pxd.count(f'cdef extern from "{d / "a.hpp"}"'), 2)
+            self.assertEqual(pxd.count(f'cdef extern from "{d / "b.hpp"}"'), 1)
+
+            pyx = d / 'test.pyx'
+            pyx.write_text(pxd)
+            res = subprocess.run(
+                ['cython', '-3', '--cplus', str(pyx)], capture_output=True)
+            self.assertEqual(res.returncode, 0, res.stderr.decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
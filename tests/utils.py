@@ -6,14 +6,14 @@ from cythonator import cythonator
 from cythonator.write_cython import write_pxd
 
 
-def _code_runner(code):
+def _code_runner(code, **kwargs):
     if isinstance(code, list):
         code = '\n'.join(code)
     with NamedTemporaryFile(suffix='.hpp') as fp, NamedTemporaryFile(suffix='.pyx') as pyxfp, NamedTemporaryFile(suffix='.cpp') as cyfp:
         fp.write(code.encode())
         fp.flush()
 
-        ns = cythonator(filename=fp.name)
+        ns = cythonator(filename=fp.name, **kwargs)
 
         pxd = write_pxd(ns, fp.name)
         print(pxd)